@@ -34,6 +34,7 @@
     const store = global.AssistantState.createStore();
     const tools = global.AssistantTools.createAssistantTools({
       dashboardProvider: () => (bridge && typeof bridge.getSnapshot === 'function' ? bridge.getSnapshot() : null),
+      toolRegistryProvider: () => store.state.toolRegistry,
     });
     const ui = global.AssistantUI.createAssistantUI();
     const observerSuggestions = new Map();
@@ -185,72 +186,131 @@
       syncDashboardState(getSnapshot());
     }
 
-    async function executeActions(actions, reasonText, taskIds = []) {
-      if (!actions.length) return;
-      store.setBusy(true);
-      const controller = createAbortController();
-      const context = {
-        messages: store.state.history.slice(),
+    function startTask(action, reasonText, existingTaskId, status) {
+      const meta = getToolMeta(action.tool);
+      const patch = {
+        title: action.title || (meta ? meta.label : action.tool),
+        detail: action.detail || reasonText || '等待执行。',
+        status,
       };
+      return (existingTaskId && store.updateTask(existingTaskId, patch)) || store.pushTask(patch);
+    }
+
+    async function applyActionResult(action, result) {
+      if (action.tool === 'readDataFile' && result && result.text) {
+        store.addAttachment({
+          id: global.AssistantState.createId('attachment'),
+          name: result.name,
+          source: result.path,
+          size: result.size,
+          sizeLabel: formatBytes(result.size),
+          text: result.text,
+          truncated: result.truncated,
+        });
+        ui.setFileHint(`已读取：${result.path}`);
+      }
+      if (action.tool === 'summarizeCurrentDashboard' && result.summary) {
+        store.addMessage('assistant', result.summary, { includeInHistory: false });
+      }
+      if (action.tool === 'writeAgentFile' && result.text) {
+        store.addMessage('assistant', result.text, { includeInHistory: true });
+      }
+      await refreshAfterTool(action.tool);
+    }
+
+    // Backend executor: independent actions run concurrently, a decision still waits for
+    // its forecast. Returns false when the backend has no /assist/execute.
+    async function executeActionsOnBackend(actions, reasonText, taskIds, context, controller) {
+      const tasks = actions.map((action, index) => startTask(action, reasonText, taskIds[index], 'planned'));
+      const followUps = [];
+      const finished = new Set();
+      let summary = null;
       try {
-        for (let index = 0; index < actions.length; index += 1) {
-          const action = actions[index];
-          const meta = getToolMeta(action.tool);
-          const existingTaskId = taskIds[index];
-          let task = null;
-          if (existingTaskId) {
-            task = store.updateTask(existingTaskId, {
-              title: action.title || (meta ? meta.label : action.tool),
-              detail: action.detail || reasonText || '等待执行。',
-              status: 'running',
-            });
-          }
-          if (!task) {
-            task = store.pushTask({
-              title: action.title || (meta ? meta.label : action.tool),
-              detail: action.detail || reasonText || '等待执行。',
-              status: 'running',
-            });
-          }
-          try {
-            const result = await tools.executeTool(action.tool, action.args || {}, context, {
-              signal: controller.signal,
-            });
+        summary = await tools.executePlan(actions, context, (event) => {
+          const action = actions[event.index];
+          const task = tasks[event.index];
+          if (!action || !task) return;
+          if (event.status !== 'running') finished.add(event.index);
+          if (event.status === 'running') {
+            store.updateTask(task.id, { status: 'running' });
+          } else if (event.status === 'success') {
+            const result = event.result || {};
             store.updateTask(task.id, {
               status: 'success',
               detail: action.successMessage || result.summary || result.filename || '执行完成。',
               result,
             });
-            if (action.tool === 'readDataFile' && result && result.text) {
-              store.addAttachment({
-                id: global.AssistantState.createId('attachment'),
-                name: result.name,
-                source: result.path,
-                size: result.size,
-                sizeLabel: formatBytes(result.size),
-                text: result.text,
-                truncated: result.truncated,
-              });
-              ui.setFileHint(`已读取：${result.path}`);
-            }
-            if (action.tool === 'summarizeCurrentDashboard' && result.summary) {
-              store.addMessage('assistant', result.summary, { includeInHistory: false });
-            }
-            if (action.tool === 'writeAgentFile' && result.text) {
-              store.addMessage('assistant', result.text, { includeInHistory: true });
-            }
-            await refreshAfterTool(action.tool);
-          } catch (error) {
-            const message = error && error.message ? error.message : String(error);
-            store.updateTask(task.id, {
-              status: controller.signal.aborted ? 'cancelled' : 'error',
-              detail: message,
-            });
-            if (!controller.signal.aborted) {
-              store.addMessage('assistant', `任务失败：${message}`, { includeInHistory: false });
+            followUps.push(applyActionResult(action, result));
+          } else {
+            store.updateTask(task.id, { status: 'error', detail: event.error || '执行失败。' });
+            if (event.status === 'error') {
+              store.addMessage('assistant', `任务失败：${event.error}`, { includeInHistory: false });
             }
-            break;
           }
+        }, controller.signal);
+      } catch (error) {
+        const status = controller.signal.aborted ? 'cancelled' : 'error';
+        tasks.forEach((task, index) => {
+          if (!finished.has(index)) store.updateTask(task.id, { status });
+        });
+        throw error;
+      }
+      if (!summary) {
+        tasks.forEach((task) => store.updateTask(task.id, { status: 'planned' }));
+        return false;
+      }
+      await Promise.all(followUps);
+      return true;
+    }
+
+    async function executeActionsSequentially(actions, reasonText, taskIds, context, controller) {
+      for (let index = 0; index < actions.length; index += 1) {
+        const action = actions[index];
+        const task = startTask(action, reasonText, taskIds[index], 'running');
+        try {
+          const result = await tools.executeTool(action.tool, action.args || {}, context, {
+            signal: controller.signal,
+          });
+          store.updateTask(task.id, {
+            status: 'success',
+            detail: action.successMessage || result.summary || result.filename || '执行完成。',
+            result,
+          });
+          await applyActionResult(action, result);
+        } catch (error) {
+          const message = error && error.message ? error.message : String(error);
+          store.updateTask(task.id, {
+            status: controller.signal.aborted ? 'cancelled' : 'error',
+            detail: message,
+          });
+          if (!controller.signal.aborted) {
+            store.addMessage('assistant', `任务失败：${message}`, { includeInHistory: false });
+          }
+          break;
+        }
+      }
+    }
+
+    async function executeActions(actions, reasonText, taskIds = []) {
+      if (!actions.length) return;
+      store.setBusy(true);
+      const controller = createAbortController();
+      const context = {
+        messages: store.state.history.slice(),
+      };
+      try {
+        let handled = false;
+        try {
+          handled = await executeActionsOnBackend(actions, reasonText, taskIds, context, controller);
+        } catch (error) {
+          const message = error && error.message ? error.message : String(error);
+          if (!controller.signal.aborted) {
+            store.addMessage('assistant', `任务失败：${message}`, { includeInHistory: false });
+          }
+          handled = true;
+        }
+        if (!handled) {
+          await executeActionsSequentially(actions, reasonText, taskIds, context, controller);
         }
       } finally {
         clearActiveRun();
@@ -324,6 +384,7 @@
 
     async function sendChatMessage(content) {
       store.setBusy(true);
+      let streamed = null;
       try {
         const dashboardSummary = tools.formatDashboardSummary(getSnapshot());
         const attachmentContext = buildAttachmentContext(store.state.attachments);
@@ -347,16 +408,23 @@
         } else if (content) {
           payloadMessages.push({ role: 'user', content });
         }
-        const response = await tools.chat({
+        // Show tokens as they arrive; the reply joins the history once complete.
+        streamed = store.addMessage('assistant', '…', { includeInHistory: false });
+        const response = await tools.chatStream({
           messages: payloadMessages,
           temperature: 0.7,
           max_tokens: 512,
-        });
+        }, (delta, text) => store.updateMessage(streamed.id, { content: text }));
         const reply = response.text || '(无返回)';
-        store.addMessage('assistant', reply, { includeInHistory: true });
+        store.updateMessage(streamed.id, { content: reply });
+        store.pushHistory('assistant', reply);
       } catch (error) {
         const message = error && error.message ? error.message : String(error);
-        store.addMessage('assistant', `请求失败：${message}`, { includeInHistory: false });
+        if (streamed) {
+          store.updateMessage(streamed.id, { content: `请求失败：${message}` });
+        } else {
+          store.addMessage('assistant', `请求失败：${message}`, { includeInHistory: false });
+        }
       } finally {
         store.setBusy(false);
       }
@@ -465,7 +533,9 @@
       const pending = store.state.pendingApproval;
       if (!pending) return;
       store.setPendingApproval(null);
-      executeActions(pending.actions || [], pending.text, pending.taskIds || []);
+      // The backend executor refuses confirmation-required actions without this flag.
+      const approved = (pending.actions || []).map((action) => ({ ...action, approved: true }));
+      executeActions(approved, pending.text, pending.taskIds || []);
     }
 
     function handleReject() {
@@ -85,6 +85,21 @@
       return message;
     }
 
+    function updateMessage(id, patch) {
+      const index = state.messages.findIndex((message) => message.id === id);
+      if (index < 0) return null;
+      state.messages[index] = {
+        ...state.messages[index],
+        ...patch,
+      };
+      notify();
+      return state.messages[index];
+    }
+
+    function pushHistory(role, content) {
+      state.history.push({ role, content });
+    }
+
     function replaceSuggestions(suggestions) {
       state.suggestions = Array.isArray(suggestions) ? suggestions.slice() : [];
       notify();
@@ -162,6 +177,7 @@
       addAttachment,
       clearAttachments,
       clearCompletedTasks,
+      pushHistory,
       pushTask,
       removeAttachment,
       replaceSuggestions,
@@ -174,6 +190,7 @@
       setPendingApproval,
       setStatus,
       setToolRegistry,
+      updateMessage,
       updateTask,
     };
   }
@@ -24,6 +24,12 @@
       description: '调用本地预测能力，生成未来 12 小时负荷与光伏预测文件。',
       danger: 'safe',
       requiresConfirmation: false,
+      defaults: {
+        history_file: '虚拟电厂_24h15min_数据.csv',
+        window_hours: 24,
+        horizon_hours: 12,
+        step_minutes: 1,
+      },
     },
     {
       name: 'runDecision',
@@ -31,6 +37,17 @@
       description: '根据历史数据和预测结果生成 12 小时市场决策文件。',
       danger: 'guarded',
       requiresConfirmation: false,
+      defaults: {
+        history_file: '虚拟电厂_24h15min_数据.csv',
+        load_forecast: 'output/Load_forecast_12h.csv',
+        pv_forecast: 'output/PV_forecast_12h.csv',
+        output_file: 'output/Market_decision_12h.csv',
+        horizon_hours: 12,
+        step_minutes: 1,
+        window_hours: 24,
+        capacity_kwh: 200,
+        p_max_kw: 100,
+      },
     },
     {
       name: 'writeAgentFile',
@@ -97,6 +114,17 @@
     const dashboardProvider = typeof options.dashboardProvider === 'function'
       ? options.dashboardProvider
       : () => null;
+    const toolRegistryProvider = typeof options.toolRegistryProvider === 'function'
+      ? options.toolRegistryProvider
+      : () => [];
+
+    // Default arguments come from the /assistant/tools manifest (the backend executor
+    // fills in the same ones), falling back to the built-in definitions offline.
+    function toolDefaults(name) {
+      const meta = (toolRegistryProvider() || []).find((item) => item.name === name)
+        || DEFAULT_TOOL_DEFINITIONS.find((item) => item.name === name);
+      return (meta && meta.defaults) || {};
+    }
 
     async function fetchToolManifest() {
       try {
@@ -124,6 +152,95 @@
       });
     }
 
+    // Read a Server-Sent Events body, calling onEvent(name, data) per event until onEvent
+    // returns something other than undefined (returned) or the stream ends.
+    async function readEventStream(response, onEvent) {
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      for (;;) {
+        const { value, done } = await reader.read();
+        if (done) return undefined;
+        buffer += decoder.decode(value, { stream: true });
+        let boundary = buffer.indexOf('\n\n');
+        while (boundary >= 0) {
+          const block = buffer.slice(0, boundary);
+          buffer = buffer.slice(boundary + 2);
+          boundary = buffer.indexOf('\n\n');
+          const event = (block.match(/^event: (.*)$/m) || [])[1] || 'message';
+          const data = JSON.parse((block.match(/^data: (.*)$/m) || [])[1] || '{}');
+          const result = onEvent(event, data);
+          if (result !== undefined) {
+            reader.cancel().catch(() => {});
+            return result;
+          }
+        }
+      }
+    }
+
+    async function postEventStream(path, payload, signal) {
+      const response = await fetch(`${API_ROOT}${path}`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(payload),
+        signal,
+      });
+      if (response.status === 404 || !response.body) {
+        return null;
+      }
+      if (!response.ok) {
+        const errorPayload = await response.json().catch(() => ({}));
+        throw new Error(errorPayload.error || `HTTP ${response.status}`);
+      }
+      return response;
+    }
+
+    // POST /chat/stream: onToken(delta, textSoFar) per token, resolves with the final
+    // `done` payload ({ text, first_token_ms, ... }).
+    async function chatStream(payload, onToken, signal) {
+      const response = await postEventStream('/chat/stream', payload, signal);
+      if (!response) {
+        // Backend without streaming: fall back to one blocking request.
+        const result = await chat(payload, signal);
+        onToken(result.text || '', result.text || '');
+        return result;
+      }
+      let text = '';
+      const result = await readEventStream(response, (event, data) => {
+        if (event === 'token') {
+          text += data.text || '';
+          onToken(data.text || '', text);
+        } else if (event === 'done') {
+          return data;
+        } else if (event === 'error') {
+          throw new Error(data.error || '流式响应中断');
+        }
+        return undefined;
+      });
+      return result || { text };
+    }
+
+    // POST /assist/execute: the backend runs the plan as a dependency graph and reports
+    // onAction({ index, tool, status, result?, error? }) per state change. Resolves with the
+    // `done` summary, or null when the backend has no executor.
+    async function executePlan(actions, context = {}, onAction, signal) {
+      const response = await postEventStream('/assist/execute', {
+        actions,
+        messages: context.messages || [],
+        dashboard: dashboardProvider(),
+      }, signal);
+      if (!response) return null;
+      const result = await readEventStream(response, (event, data) => {
+        if (event === 'action') {
+          onAction(data);
+        } else if (event === 'done') {
+          return data;
+        }
+        return undefined;
+      });
+      return result || { ok: false };
+    }
+
     async function planAssist(payload, signal) {
       return requestJson(`${API_ROOT}/assist`, {
         method: 'POST',
@@ -137,13 +254,7 @@
       return requestJson(`${API_ROOT}/predict12h`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({
-          history_file: '虚拟电厂_24h15min_数据.csv',
-          window_hours: 24,
-          horizon_hours: 12,
-          step_minutes: 1,
-          ...args,
-        }),
+        body: JSON.stringify({ ...toolDefaults('runForecast'), ...args }),
         signal,
       });
     }
@@ -152,18 +263,7 @@
       return requestJson(`${API_ROOT}/decision12h`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({
-          history_file: '虚拟电厂_24h15min_数据.csv',
-          load_forecast: 'output/Load_forecast_12h.csv',
-          pv_forecast: 'output/PV_forecast_12h.csv',
-          output_file: 'output/Market_decision_12h.csv',
-          horizon_hours: 12,
-          step_minutes: 1,
-          window_hours: 24,
-          capacity_kwh: 200,
-          p_max_kw: 100,
-          ...args,
-        }),
+        body: JSON.stringify({ ...toolDefaults('runDecision'), ...args }),
         signal,
       });
     }
@@ -242,6 +342,8 @@
       DEFAULT_TOOL_DEFINITIONS,
       checkHealth,
       chat,
+      chatStream,
+      executePlan,
       executeTool,
       fetchToolManifest,
       formatDashboardSummary,
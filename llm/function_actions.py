@@ -0,0 +1,146 @@
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+ACTION_TOOLS = ("summarizeCurrentDashboard", "readDataFile", "runForecast", "runDecision", "writeAgentFile")
+
+FORECAST_OUTPUTS = ("output/Load_forecast_12h.csv", "output/PV_forecast_12h.csv")
+
+
+@dataclass
+class ActionNode:
+    index: int
+    tool: str
+    args: Dict[str, Any]
+    title: str = ""
+    deps: List[int] = field(default_factory=list)
+
+
+def _data_path(path: object) -> str:
+    """data/-relative form of a path as written in a plan ("data/output/x.csv" -> "output/x.csv")."""
+    text = str(path or "").replace("\\", "/").strip().lstrip("./")
+    return text[len("data/"):] if text.startswith("data/") else text
+
+
+def action_resources(tool: str, args: Dict[str, Any]) -> Tuple[Set[str], Set[str]]:
+    """(reads, writes) of one action as data/-relative file paths."""
+    if tool == "readDataFile":
+        return {_data_path(args.get("path"))}, set()
+    if tool == "runForecast":
+        return {_data_path(args.get("history_file"))}, set(FORECAST_OUTPUTS)
+    if tool == "runDecision":
+        reads = {_data_path(args.get(key)) for key in ("history_file", "load_forecast", "pv_forecast")}
+        return reads, {_data_path(args.get("output_file"))}
+    if tool == "writeAgentFile":
+        return set(), {_data_path(args.get("targetPath"))}
+    # summarizeCurrentDashboard only formats the dashboard snapshot sent with the plan.
+    return set(), set()
+
+
+def build_action_dag(actions: List[Dict[str, Any]], defaults: Optional[Dict[str, Dict[str, Any]]] = None) -> List[ActionNode]:
+    """
+    One node per planned action, in plan order, with missing arguments taken from
+    `defaults[tool]` (the /assistant/tools manifest, which the panel also uses). An action depends on every earlier one
+    that writes a file it reads or writes, or that reads a file it writes, so a decision
+    waits for the forecast it consumes while independent reads run side by side.
+    """
+    nodes: List[ActionNode] = []
+    resources: List[Tuple[Set[str], Set[str]]] = []
+    for index, action in enumerate(actions):
+        tool = str(action.get("tool", ""))
+        args = {**(defaults or {}).get(tool, {}), **(action.get("args") or {})}
+        reads, writes = action_resources(tool, args)
+        deps = [
+            earlier
+            for earlier, (earlier_reads, earlier_writes) in enumerate(resources)
+            if earlier_writes & (reads | writes) or writes & earlier_reads
+        ]
+        nodes.append(ActionNode(index, tool, args, str(action.get("title", "") or tool), deps))
+        resources.append((reads, writes))
+    return nodes
+
+
+def critical_path_ms(nodes: List[ActionNode], elapsed_ms: Dict[int, float]) -> float:
+    """Longest dependency chain by measured time: the lower bound on the plan's wall time."""
+    finish: Dict[int, float] = {}
+    for node in nodes:  # plan order is a topological order
+        finish[node.index] = elapsed_ms.get(node.index, 0.0) + max((finish[d] for d in node.deps), default=0.0)
+    return max(finish.values(), default=0.0)
+
+
+def run_action_dag(
+    nodes: List[ActionNode],
+    runner: Callable[[ActionNode], Dict[str, Any]],
+    max_workers: int = 4,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Run every node once its dependencies succeeded, up to `max_workers` at a time, and
+    yield status events as they happen: `running`, then `success` / `error` with the
+    runner's result, or `skipped` when a dependency failed. A result with `ok: false`
+    counts as a failure. Ends with a `done` event carrying wall, summed and critical-path
+    times. Closing the generator early lets running actions finish but starts no more.
+    """
+    started = time.perf_counter()
+    by_index = {node.index: node for node in nodes}
+    waiting = {node.index: set(node.deps) for node in nodes}
+    dependents: Dict[int, List[int]] = {node.index: [] for node in nodes}
+    for node in nodes:
+        for dep in node.deps:
+            dependents[dep].append(node.index)
+    finished: "queue.Queue[Tuple[int, Dict[str, Any], str, float]]" = queue.Queue()
+    elapsed_ms: Dict[int, float] = {}
+    statuses: Dict[int, str] = {}
+
+    def _work(node: ActionNode) -> None:
+        t0 = time.perf_counter()
+        try:
+            result, error = runner(node), ""
+        except Exception as exc:
+            result, error = {}, str(exc) or type(exc).__name__
+        if not error and isinstance(result, dict) and result.get("ok") is False:
+            error = str(result.get("error") or result.get("message") or "action failed")
+        finished.put((node.index, result if isinstance(result, dict) else {}, error, (time.perf_counter() - t0) * 1000.0))
+
+    def _event(node: ActionNode, status: str, **extra: Any) -> Dict[str, Any]:
+        statuses[node.index] = status
+        return {"event": "action", "index": node.index, "tool": node.tool, "title": node.title, "status": status, **extra}
+
+    with ThreadPoolExecutor(max_workers=max(1, min(int(max_workers), len(nodes) or 1))) as pool:
+        for node in nodes:
+            if not node.deps:
+                pool.submit(_work, node)
+                yield _event(node, "running")
+        pending = len(nodes)
+        while pending:
+            index, result, error, ms = finished.get()
+            pending -= 1
+            elapsed_ms[index] = ms
+            node = by_index[index]
+            if error:
+                yield _event(node, "error", error=error, result=result, elapsed_ms=round(ms, 1))
+                skip = list(dependents[index])
+                while skip:
+                    blocked = skip.pop()
+                    if blocked in statuses:
+                        continue
+                    pending -= 1
+                    yield _event(by_index[blocked], "skipped", error=f"依赖的动作 {node.title} 失败")
+                    skip.extend(dependents[blocked])
+                continue
+            yield _event(node, "success", result=result, elapsed_ms=round(ms, 1))
+            for dependent in dependents[index]:
+                waiting[dependent].discard(index)
+                if not waiting[dependent] and dependent not in statuses:
+                    pool.submit(_work, by_index[dependent])
+                    yield _event(by_index[dependent], "running")
+
+    wall_ms = (time.perf_counter() - started) * 1000.0
+    yield {
+        "event": "done",
+        "ok": all(status == "success" for status in statuses.values()),
+        "elapsed_ms": round(wall_ms, 1),
+        "sum_ms": round(sum(elapsed_ms.values()), 1),
+        "critical_path_ms": round(critical_path_ms(nodes, elapsed_ms), 1),
+    }
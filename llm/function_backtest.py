@@ -0,0 +1,390 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from function_decision import (
+    _DecisionInputError,
+    _format_num,
+    _forecast_decision_inputs,
+    _resolve_soc_bounds,
+    _solve_dispatch,
+    _validate_decision_params,
+)
+from function_predict import write_data_csv
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+from predict import lightweight, preprocess  # noqa: E402
+
+BACKTEST_MODELS = ("lstm", "auto") + lightweight.MODELS
+
+_TARGETS = (("Load", "负荷消耗_kW"), ("PV", "光伏出力_kW"))
+
+
+@dataclass
+class BacktestOutput:
+    ok: bool
+    message: str
+    # Aggregates over all origins: per-target MAE/MAPE, summed costs and regret.
+    summary: Dict[str, object] = field(default_factory=dict)
+    filename: str = ""
+    csv_text: str = ""
+    warnings: List[str] = field(default_factory=list)
+    stats: Dict[str, object] = field(default_factory=dict)
+
+
+# Per-process copy of the replayed history (and batched LSTM forecasts), installed by the pool initializer.
+_WORKER_STATE: Dict[str, object] = {}
+
+
+def _init_backtest_worker(state: Dict[str, object]) -> None:
+    _WORKER_STATE.clear()
+    _WORKER_STATE.update(state)
+
+
+def _errors(pred: np.ndarray, actual: np.ndarray, mape_floor: float) -> Tuple[float, float]:
+    """(MAE, MAPE in %). MAPE skips points with |actual| below `mape_floor` (PV at night)."""
+    err = np.abs(pred - actual)
+    mask = np.abs(actual) >= mape_floor
+    mape = float((err[mask] / np.abs(actual[mask])).mean() * 100.0) if mask.any() else float("nan")
+    return float(err.mean()), mape
+
+
+def _forecast_at(end: int, target: str, key: str, k: int) -> Tuple[np.ndarray, bool]:
+    """Forecast of `target` from origin `end`; the bool marks a serving-style fallback to the zoo."""
+    st = _WORKER_STATE
+    y = st["series"][key][max(0, end - st["window_rows"]) : end]
+    steps, season, phase = st["steps"], st["season"], st["phases"][end - 1]
+    model = st["model"]
+    if model != "lstm":
+        return lightweight.forecast(y, steps, season, phase, model)[0].astype(np.float64), False
+    preds = st["lstm"][target][k].astype(np.float64)
+    # Same guard as /predict12h: a collapsed LSTM rollout is replaced by the best zoo model.
+    history_avg = float(np.abs(y).mean()) if y.size else 0.0
+    if history_avg > 1e-6 and float(np.abs(preds).mean()) < history_avg * 0.05:
+        return lightweight.forecast(y, steps, season, phase, "auto")[0].astype(np.float64), True
+    return preds, False
+
+
+def _run_origins(task: Tuple[int, Sequence[int]]) -> List[Dict[str, object]]:
+    """Forecast, dispatch and score a chunk of origins; `task` = (index of first origin, origin ends)."""
+    first, ends = task
+    st = _WORKER_STATE
+    steps = st["steps"]
+    dt_h = st["step_minutes"] / 60.0
+    rows: List[Dict[str, object]] = []
+    for offset, end in enumerate(ends):
+        k = first + offset
+        horizon = slice(end, end + steps)
+        result: Dict[str, object] = {"origin": st["dts"][end - 1]}
+        forecasts: Dict[str, np.ndarray] = {}
+        for target, key in _TARGETS:
+            pred, fell_back = _forecast_at(end, target, key, k)
+            forecasts[target] = pred
+            mae, mape = _errors(pred, st["series"][key][horizon], st["mape_floor"][key])
+            result[f"{target}_MAE"] = mae
+            result[f"{target}_MAPE"] = mape
+            result[f"{target}_fallback"] = fell_back
+
+        inputs = _forecast_decision_inputs(
+            st["history"].slice(max(0, end - st["window_rows"]), end),
+            st["dts"][horizon],
+            st["hours"][horizon],
+            forecasts["Load"],
+            forecasts["PV"],
+            st["horizon_hours"],
+            st["step_minutes"],
+        )
+        soc0, socT = _resolve_soc_bounds(st["capacity_kwh"], st["soc_initial_kwh"], st["soc_final_kwh"])
+        dispatch = dict(
+            dt_h=dt_h,
+            step_minutes=st["step_minutes"],
+            capacity_kwh=st["capacity_kwh"],
+            p_max_kw=st["p_max_kw"],
+            soc0_kwh=soc0,
+            socT_kwh=socT,
+        )
+        sched, _ = _solve_dispatch(net_kw=inputs.load_kw - inputs.pv_kw, price=inputs.price, **dispatch)
+
+        # The schedule only moves the battery, so it stays feasible against the actual net load;
+        # the grid absorbs the difference at the actual price.
+        actual_net = st["series"]["负荷消耗_kW"][horizon] - st["series"]["光伏出力_kW"][horizon]
+        actual_price = st["series"]["实时电价_元/kWh"][horizon]
+        perfect, _ = _solve_dispatch(net_kw=actual_net, price=actual_price, **dispatch)
+        result["Baseline_Cost"] = float(actual_net @ actual_price) * dt_h
+        result["Realized_Cost"] = float((actual_net - sched.p_kw[0]) @ actual_price) * dt_h
+        result["Perfect_Cost"] = float(perfect.cost[0])
+        result["Regret"] = result["Realized_Cost"] - result["Perfect_Cost"]
+        rows.append(result)
+    return rows
+
+
+def _render_backtest_csv(results: List[Dict[str, object]]) -> str:
+    headers = [
+        "Origin",
+        "Load_MAE_kW",
+        "Load_MAPE_pct",
+        "PV_MAE_kW",
+        "PV_MAPE_pct",
+        "Baseline_Cost_yuan",
+        "Realized_Cost_yuan",
+        "Perfect_Cost_yuan",
+        "Regret_yuan",
+    ]
+    keys = ["Load_MAE", "Load_MAPE", "PV_MAE", "PV_MAPE", "Baseline_Cost", "Realized_Cost", "Perfect_Cost", "Regret"]
+    lines = [",".join(headers)]
+    for r in results:
+        values = [float(r[k]) for k in keys]
+        lines.append(",".join([str(r["origin"])] + ["" if not np.isfinite(v) else _format_num(v, 6) for v in values]))
+    return "\n".join(lines)
+
+
+def _summarize(results: List[Dict[str, object]]) -> Dict[str, object]:
+    summary: Dict[str, object] = {}
+    for target, _ in _TARGETS:
+        mape = np.asarray([r[f"{target}_MAPE"] for r in results], dtype=np.float64)
+        summary[target] = {
+            "mae": float(np.mean([r[f"{target}_MAE"] for r in results])),
+            "mape_pct": float(np.nanmean(mape)) if np.isfinite(mape).any() else None,
+            "fallbacks": int(sum(bool(r[f"{target}_fallback"]) for r in results)),
+        }
+    totals = {k: float(sum(float(r[k]) for r in results)) for k in ("Baseline_Cost", "Realized_Cost", "Perfect_Cost", "Regret")}
+    possible = totals["Baseline_Cost"] - totals["Perfect_Cost"]
+    summary.update(
+        baseline_cost_yuan=totals["Baseline_Cost"],
+        realized_cost_yuan=totals["Realized_Cost"],
+        perfect_cost_yuan=totals["Perfect_Cost"],
+        regret_yuan=totals["Regret"],
+        mean_regret_yuan=totals["Regret"] / len(results),
+        # Share of the perfect-foresight savings the forecast-driven schedule actually captured.
+        savings_capture=(totals["Baseline_Cost"] - totals["Realized_Cost"]) / possible if abs(possible) > 1e-9 else None,
+    )
+    return summary
+
+
+def run_backtest(
+    *,
+    data_dir: str,
+    history_file: str = "虚拟电厂_24h15min_数据.csv",
+    output_file: str = "output/Backtest_12h.csv",
+    model: str = "lstm",
+    runtime: str = "auto",
+    lookback: int = 32,
+    horizon_hours: float = 12.0,
+    step_minutes: int = 15,
+    window_hours: float = 24.0,
+    origin_every_hours: float = 1.0,
+    max_origins: int = 0,
+    capacity_kwh: float = 200.0,
+    soc_initial_kwh: Optional[float] = None,
+    soc_final_kwh: Optional[float] = None,
+    p_max_kw: float = 100.0,
+    workers: Optional[int] = None,
+) -> BacktestOutput:
+    """
+    Replay `history_file` over rolling forecast origins and score forecasts and dispatch.
+
+    Origins are spaced `origin_every_hours` apart, each with `window_hours` of history
+    before it and a full horizon of actuals after it (`max_origins` keeps the latest N).
+    LSTM forecasts for all origins are computed up front as one batched rollout with the
+    served weights. Their training span is not excluded, so once they were trained on this
+    history (e.g. by a retrain) LSTM scores are in-sample (`stats.in_sample`). Zoo models are fitted per origin on the window
+    before it. Each origin is then dispatched like
+    /decision12h, and the schedule is charged at the actual net load and price. Regret is
+    that cost minus the cost of the DP re-solved with actual load, PV and price.
+    Origins are spread over `workers` processes (default: all cores, 1 runs inline),
+    started with spawn because the request process has already run torch.
+    """
+    if model not in BACKTEST_MODELS:
+        return BacktestOutput(ok=False, message=f"model 必须是 {', '.join(BACKTEST_MODELS)} 之一")
+    if origin_every_hours <= 0:
+        return BacktestOutput(ok=False, message="origin_every_hours 必须 > 0")
+    try:
+        _validate_decision_params(step_minutes, horizon_hours, capacity_kwh, p_max_kw)
+    except _DecisionInputError as exc:
+        return BacktestOutput(ok=False, message=str(exc))
+
+    history_path = os.path.join(data_dir, history_file)
+    if not os.path.exists(history_path):
+        return BacktestOutput(ok=False, message=f"历史数据不存在: {history_file}")
+    started = time.perf_counter()
+    try:
+        history = preprocess.read_history(history_path)
+    except OSError as exc:
+        return BacktestOutput(ok=False, message=f"历史数据读取失败: {exc}")
+    warnings: List[str] = []
+    # Origins are positions, so missing timestamps are restored before resampling.
+    source_step = preprocess.infer_step_minutes(history)
+    gaps = preprocess.find_gaps(history, source_step)
+    if gaps.size:
+        warnings.append(f"历史数据有 {len(gaps)} 处时间缺口（共 {int(gaps[:, 1].sum())} 点），已按时间补齐")
+        history = preprocess.reindex(history, source_step, gaps)
+    history = preprocess.resample_mean(history, step_minutes, source_step)
+
+    dt_h = step_minutes / 60.0
+    steps = int(round(horizon_hours / dt_h))
+    window_rows = max(1, int(round(window_hours / dt_h)))
+    every = max(1, int(round(origin_every_hours / dt_h)))
+    first = max(window_rows, lookback if model == "lstm" else 1)
+    ends = np.arange(first, len(history) - steps + 1, every, dtype=np.int64)
+    if max_origins and ends.size > max_origins:
+        ends = ends[-int(max_origins) :]
+    if ends.size == 0:
+        return BacktestOutput(ok=False, message=f"历史数据不足: {len(history)} 点，至少需要 {first + steps} 点")
+
+    series: Dict[str, np.ndarray] = {}
+    for key in ("负荷消耗_kW", "光伏出力_kW", "实时电价_元/kWh"):
+        raw = history.column(key)
+        if not np.isfinite(raw).all():
+            warnings.append(f"{key} 有 {int((~np.isfinite(raw)).sum())} 个缺失点，已线性插值")
+        series[key] = preprocess.fill_gaps(raw)
+
+    dts = [str(t).strip() for t in history.text.tolist()]
+    hours = np.nan_to_num(preprocess.hour_of_day(history))
+    season = max(1, int(round(24 * 60 / step_minutes)))
+
+    lstm_preds: Dict[str, np.ndarray] = {}
+    forecast_started = time.perf_counter()
+    if model == "lstm":
+        try:
+            from predict import lstm
+
+            for target, key in _TARGETS:
+                lstm_preds[target] = lstm.forecast_origins(target, series[key], ends, steps, lookback=lookback, runtime=runtime)
+        except Exception as exc:
+            return BacktestOutput(ok=False, message=f"LSTM 批量预测失败: {exc}")
+        warnings.append("LSTM 使用当前服务权重，未排除其训练区间：权重用这份历史训练过（如 retrain 后）时误差为样本内结果，会偏乐观；换用未参与训练的历史文件可得到样本外评估")
+    forecast_s = time.perf_counter() - forecast_started
+
+    state: Dict[str, object] = {
+        "model": model,
+        "series": series,
+        "lstm": lstm_preds,
+        "history": history,
+        "dts": dts,
+        "hours": hours,
+        "phases": (hours % 24.0) / 24.0,
+        "season": season,
+        "steps": steps,
+        "window_rows": window_rows,
+        "horizon_hours": horizon_hours,
+        "step_minutes": step_minutes,
+        "capacity_kwh": capacity_kwh,
+        "soc_initial_kwh": soc_initial_kwh,
+        "soc_final_kwh": soc_final_kwh,
+        "p_max_kw": p_max_kw,
+        # Points below 5% of the mean magnitude (PV at night) would dominate a plain MAPE.
+        "mape_floor": {key: 0.05 * float(np.abs(values).mean()) for key, values in series.items()},
+    }
+
+    n_workers = max(1, min(int(workers or os.cpu_count() or 1), int(ends.size)))
+    # A few chunks per worker keeps the pool busy without paying IPC per origin.
+    chunks = np.array_split(np.arange(ends.size), min(int(ends.size), n_workers * 4))
+    tasks = [(int(c[0]), ends[c].tolist()) for c in chunks if c.size]
+    dispatch_started = time.perf_counter()
+    if n_workers == 1:
+        _init_backtest_worker(state)
+        parts = [_run_origins(task) for task in tasks]
+    else:
+        # Forked children would inherit torch's thread pools from the LSTM rollout above.
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=n_workers, mp_context=ctx, initializer=_init_backtest_worker, initargs=(state,)) as pool:
+            parts = list(pool.map(_run_origins, tasks))
+    results = [r for part in parts for r in part]
+
+    return BacktestOutput(
+        ok=True,
+        message="ok",
+        summary=_summarize(results),
+        filename=output_file,
+        csv_text=_render_backtest_csv(results),
+        warnings=warnings,
+        stats={
+            "model": model,
+            "runtime": runtime if model == "lstm" else None,
+            "lookback": lookback if model == "lstm" else None,
+            "in_sample": model == "lstm",
+            "horizon_hours": horizon_hours,
+            "step_minutes": step_minutes,
+            "steps": steps,
+            "window_rows": window_rows,
+            "history_rows": len(history),
+            "origins": int(ends.size),
+            "first_origin": dts[int(ends[0]) - 1],
+            "last_origin": dts[int(ends[-1]) - 1],
+            "workers": n_workers,
+            "forecast_s": round(forecast_s, 3),
+            "dispatch_s": round(time.perf_counter() - dispatch_started, 3),
+            "elapsed_s": round(time.perf_counter() - started, 3),
+        },
+    )
+
+
+def write_backtest(**kwargs) -> BacktestOutput:
+    data_dir = kwargs.get("data_dir")
+    if not data_dir:
+        return BacktestOutput(ok=False, message="data_dir is required")
+    result = run_backtest(**kwargs)
+    if not result.ok or not result.filename:
+        return result
+    wr = write_data_csv(result.filename, result.csv_text, data_dir)
+    if not wr.ok:
+        result.ok = False
+        result.message = wr.message
+        return result
+    result.filename = wr.filename
+    return result
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Rolling-origin backtest of the 12h forecast + dispatch pipeline.")
+    parser.add_argument("--data-dir", default=os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data")))
+    parser.add_argument("--history-file", default="虚拟电厂_24h15min_数据.csv")
+    parser.add_argument("--output-file", default="output/Backtest_12h.csv", help="relative to data dir; empty to skip writing")
+    parser.add_argument("--model", default="lstm", choices=BACKTEST_MODELS)
+    parser.add_argument("--runtime", default="auto", help="LSTM runtime: auto, eager, torchscript, onnx or int8")
+    parser.add_argument("--lookback", type=int, default=32)
+    parser.add_argument("--horizon-hours", type=float, default=12.0)
+    parser.add_argument("--step-minutes", type=int, default=15)
+    parser.add_argument("--window-hours", type=float, default=24.0)
+    parser.add_argument("--every-hours", type=float, default=1.0, help="spacing between forecast origins")
+    parser.add_argument("--max-origins", type=int, default=0, help="keep only the latest N origins (0 = all)")
+    parser.add_argument("--capacity-kwh", type=float, default=200.0)
+    parser.add_argument("--p-max-kw", type=float, default=100.0)
+    parser.add_argument("--workers", type=int, default=0, help="0 uses all cores")
+    args = parser.parse_args()
+
+    result = write_backtest(
+        data_dir=args.data_dir,
+        history_file=args.history_file,
+        output_file=args.output_file,
+        model=args.model,
+        runtime=args.runtime,
+        lookback=args.lookback,
+        horizon_hours=args.horizon_hours,
+        step_minutes=args.step_minutes,
+        window_hours=args.window_hours,
+        origin_every_hours=args.every_hours,
+        max_origins=args.max_origins,
+        capacity_kwh=args.capacity_kwh,
+        p_max_kw=args.p_max_kw,
+        workers=args.workers or None,
+    )
+    if not result.ok:
+        print(result.message)
+        return 1
+    print(json.dumps({"summary": result.summary, "files": [result.filename] if result.filename else [], "stats": result.stats}, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
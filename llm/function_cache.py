@@ -0,0 +1,183 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+
+def file_digest(path: str) -> str:
+    """sha256 of a file's bytes ("" when it cannot be read)."""
+    h = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+    except OSError:
+        return ""
+    return h.hexdigest()
+
+
+def content_key(namespace: str, parts: Iterable[object]) -> str:
+    """Stable key over bytes/str/JSON-able parts."""
+    h = hashlib.sha256(namespace.encode("utf-8"))
+    for part in parts:
+        if isinstance(part, bytes):
+            data = part
+        elif isinstance(part, str):
+            data = part.encode("utf-8")
+        else:
+            data = json.dumps(part, sort_keys=True, ensure_ascii=True, default=str).encode("utf-8")
+        h.update(len(data).to_bytes(8, "little"))
+        h.update(data)
+    return h.hexdigest()
+
+
+class ResultCache:
+    """
+    Thread-safe LRU cache of JSON-serializable values with an optional disk tier.
+
+    The memory tier holds up to `max_entries` values. When `disk_dir` is set every
+    value is also written there as `<key>.json` (oldest files beyond
+    `max_disk_entries` are removed), and memory misses fall back to disk.
+    With `ttl_s`, values older than that many seconds count as misses in both tiers
+    (disk files then carry their write time).
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 64,
+        disk_dir: Optional[str] = None,
+        max_disk_entries: int = 512,
+        ttl_s: Optional[float] = None,
+    ) -> None:
+        self.max_entries = max(1, int(max_entries))
+        self.disk_dir = disk_dir
+        self.max_disk_entries = max(1, int(max_disk_entries))
+        self.ttl_s = float(ttl_s) if ttl_s else None
+        self._items: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._expired = 0
+
+    def _fresh(self, stored_at: float) -> bool:
+        return self.ttl_s is None or time.time() - stored_at < self.ttl_s
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            if key in self._items:
+                stored_at, value = self._items[key]
+                if self._fresh(stored_at):
+                    self._items.move_to_end(key)
+                    self._hits += 1
+                    return value
+                del self._items[key]
+                self._expired += 1
+        entry = self._disk_get(key)
+        with self._lock:
+            if entry is None:
+                self._misses += 1
+                return None
+            self._disk_hits += 1
+            self._remember(key, *entry)
+        return entry[1]
+
+    def put(self, key: str, value: Any) -> None:
+        stored_at = time.time()
+        with self._lock:
+            self._remember(key, stored_at, value)
+        self._disk_put(key, stored_at, value)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+        if self.disk_dir and os.path.isdir(self.disk_dir):
+            for name in os.listdir(self.disk_dir):
+                if name.endswith(".json"):
+                    try:
+                        os.remove(os.path.join(self.disk_dir, name))
+                    except OSError:
+                        pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._items),
+                "max_entries": self.max_entries,
+                "hits": self._hits,
+                "disk_hits": self._disk_hits,
+                "misses": self._misses,
+                "expired": self._expired,
+                "ttl_s": self.ttl_s,
+                "disk_dir": self.disk_dir or "",
+            }
+
+    def _remember(self, key: str, stored_at: float, value: Any) -> None:
+        self._items[key] = (stored_at, value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_entries:
+            self._items.popitem(last=False)
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir or "", f"{key}.json")
+
+    def _disk_get(self, key: str) -> Optional[Tuple[float, Any]]:
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+            if self.ttl_s is not None:
+                # {"stored_at", "value"} envelope, see _disk_put.
+                stored_at, value = float(value["stored_at"]), value["value"]
+                if not self._fresh(stored_at):
+                    with self._lock:
+                        self._expired += 1
+                    os.remove(path)
+                    return None
+            else:
+                stored_at = time.time()
+            os.utime(path)
+            return stored_at, value
+        except (OSError, ValueError, TypeError, KeyError):
+            return None
+
+    def _disk_put(self, key: str, stored_at: float, value: Any) -> None:
+        if not self.disk_dir:
+            return
+        if self.ttl_s is not None:
+            # mtime tracks last use for eviction, so the write time goes in the file.
+            value = {"stored_at": stored_at, "value": value}
+        try:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            with tempfile.NamedTemporaryFile("w", encoding="utf-8", delete=False, dir=self.disk_dir, suffix=".tmp") as handle:
+                json.dump(value, handle, ensure_ascii=False)
+                temp_path = handle.name
+            os.replace(temp_path, self._disk_path(key))
+            self._disk_evict()
+        except (OSError, TypeError, ValueError):
+            return
+
+    def _disk_evict(self) -> None:
+        entries = []
+        for name in os.listdir(self.disk_dir or ""):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.disk_dir or "", name)
+            try:
+                entries.append((os.path.getmtime(path), path))
+            except OSError:
+                continue
+        if len(entries) <= self.max_disk_entries:
+            return
+        entries.sort()
+        for _, path in entries[: len(entries) - self.max_disk_entries]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
@@ -1,12 +1,23 @@
 import csv
-import math
+import inspect
 import os
+import sys
+import time
 from datetime import datetime
 from dataclasses import dataclass, field
+from functools import lru_cache
 from typing import Dict, List, Optional, Tuple
 
+import numpy as np
+
+from function_cache import ResultCache, content_key, file_digest
 from function_predict import write_data_csv
 
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+from predict import preprocess  # noqa: E402
+
 
 @dataclass
 class DecisionStats:
@@ -20,6 +31,12 @@ class DecisionStats:
     soc_final_kwh: float
     p_max_kw: float
     objective: str
+    solver: str = "exact"
+    soc_step_kwh: float = 0.0
+    power_step_kw: float = 0.0
+    refinements: int = 0
+    widenings: int = 0
+    solve_ms: float = 0.0
 
 
 @dataclass
@@ -30,6 +47,17 @@ class DecisionOutput:
     csv_text: str = ""
     warnings: List[str] = field(default_factory=list)
     stats: Optional[DecisionStats] = None
+    cached: bool = False
+
+
+# Decision results keyed on the bytes of every input file plus all parameters.
+# Bump the revision whenever the solver can return a different schedule for the same
+# inputs, so results cached by the previous solver are recomputed.
+_SOLVER_REVISION = 3
+DECISION_CACHE = ResultCache(
+    max_entries=32,
+    disk_dir=os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "decision"),
+)
 
 
 def _safe_float(value: object) -> Optional[float]:
@@ -47,77 +75,6 @@ def _read_csv_rows(path: str) -> List[Dict[str, str]]:
         return [row for row in reader if row]
 
 
-def _extract_hour_value(row: Dict[str, str]) -> Optional[float]:
-    hour = _safe_float(row.get("时间_小时"))
-    if hour is not None:
-        return hour
-    period = _safe_float(row.get("时间_时段"))
-    if period is not None:
-        return period - 1.0
-    return None
-
-
-def _infer_history_step_minutes(rows: List[Dict[str, str]]) -> int:
-    diffs: List[float] = []
-    prev: Optional[float] = None
-    for row in rows[-256:]:
-        hour = _extract_hour_value(row)
-        if hour is None:
-            continue
-        if prev is not None:
-            diff_h = hour - prev
-            if diff_h > 0:
-                diffs.append(diff_h * 60.0)
-        prev = hour
-    if not diffs:
-        return 1
-    diffs.sort()
-    return max(1, int(round(diffs[len(diffs) // 2])))
-
-
-def _resample_history_rows(rows: List[Dict[str, str]], target_step_minutes: int) -> List[Dict[str, str]]:
-    if not rows:
-        return rows
-    actual_step = _infer_history_step_minutes(rows)
-    if actual_step >= target_step_minutes:
-        return rows
-    if target_step_minutes % actual_step != 0:
-        return rows
-
-    group_size = int(round(target_step_minutes / actual_step))
-    if group_size <= 1:
-        return rows
-
-    usable = len(rows) - (len(rows) % group_size)
-    if usable <= 0:
-        return rows
-
-    result: List[Dict[str, str]] = []
-    for start in range(0, usable, group_size):
-        chunk = rows[start : start + group_size]
-        last = chunk[-1]
-
-        def _avg(key: str) -> str:
-            values = [_safe_float(item.get(key)) for item in chunk]
-            clean = [float(v) for v in values if v is not None]
-            if not clean:
-                return ""
-            avg = sum(clean) / len(clean)
-            return f"{avg:.6f}".rstrip("0").rstrip(".")
-
-        result.append(
-            {
-                "Datetime": str(last.get("Datetime", "")),
-                "时间_小时": str(last.get("时间_小时", "")),
-                "时间_时段": str(last.get("时间_时段", "")),
-                "光伏出力_kW": _avg("光伏出力_kW"),
-                "负荷消耗_kW": _avg("负荷消耗_kW"),
-                "实时电价_元/kWh": _avg("实时电价_元/kWh"),
-            }
-        )
-    return result
-
-
 def _parse_hour(text: str) -> Optional[float]:
     if not text:
         return None
@@ -143,26 +100,18 @@ def _parse_hour(text: str) -> Optional[float]:
     return None
 
 
-def _build_time_of_day_price_map(history_rows: List[Dict[str, str]]) -> Tuple[Dict[float, float], List[str]]:
+def _build_time_of_day_price_map(history: preprocess.History) -> Tuple[Dict[float, float], List[str]]:
     warnings: List[str] = []
-    buckets: Dict[float, List[float]] = {}
-
-    for r in history_rows:
-        hour = _extract_hour_value(r)
-        if hour is None:
-            continue
-        hour = float(hour) % 24.0
-        price = _safe_float(r.get("实时电价_元/kWh"))
-        if price is None:
-            continue
-        buckets.setdefault(float(hour), []).append(float(price))
-
-    if not buckets:
+    hours = preprocess.hour_of_day(history)
+    price = history.column("实时电价_元/kWh")
+    ok = np.isfinite(hours) & np.isfinite(price)
+    if not ok.any():
         warnings.append("历史数据缺少 实时电价_元/kWh，电价将按 0 处理")
         return {}, warnings
 
-    price_map = {k: (sum(v) / len(v)) for k, v in buckets.items() if v}
-    return price_map, warnings
+    keys, slot = np.unique(hours[ok], return_inverse=True)
+    means = np.bincount(slot, weights=price[ok]) / np.bincount(slot)
+    return dict(zip(keys.tolist(), means.tolist())), warnings
 
 
 def _nearest_lookup(map_: Dict[float, float], hour: float, default: float = 0.0) -> float:
@@ -177,6 +126,186 @@ def _format_num(x: float, digits: int = 6) -> str:
     return f"{x:.{digits}f}".rstrip("0").rstrip(".")
 
 
+@dataclass(frozen=True)
+class StorageTransitions:
+    """
+    Precomputed (SOC state, battery power) transition structure of the storage DP.
+
+    Edges are grouped by destination state: row j of `in_src`/`in_p` lists every
+    (source state, power) pair that lands on j, ordered by (source, power) so that
+    argmin tie-breaking matches the original scalar loop. Padding points at the
+    sentinel state `n_states`, whose cost is always +inf.
+    """
+
+    soc_min_kwh: float
+    soc_max_kwh: float
+    soc_step_kwh: float
+    dt_h: float
+    n_states: int
+    in_src: np.ndarray
+    in_p: np.ndarray
+
+
+@lru_cache(maxsize=32)
+def _build_transitions(
+    soc_min_kwh: float,
+    soc_max_kwh: float,
+    soc_step_kwh: float,
+    dt_h: float,
+    p_max_kw: float,
+    power_step_kw: float,
+) -> StorageTransitions:
+    soc_step = soc_step_kwh
+    if soc_step <= 0:
+        raise ValueError("invalid soc step")
+    n_states = int(round((soc_max_kwh - soc_min_kwh) / soc_step)) + 1
+    if n_states <= 1:
+        raise ValueError("invalid soc bounds")
+
+    # Feasible power bounds per SOC state from SOC + power limit; powers are the
+    # multiples of power_step_kw inside the bounds.
+    soc = soc_min_kwh + np.arange(n_states) * soc_step
+    p_min = np.maximum(-p_max_kw, -(soc_max_kwh - soc) / dt_h)
+    p_max = np.minimum(p_max_kw, (soc - soc_min_kwh) / dt_h)
+    k_first = np.ceil(p_min / power_step_kw)
+    n_powers = np.maximum(0, np.floor((p_max + 1e-9) / power_step_kw) - k_first + 1).astype(np.int64)
+    src_all = np.repeat(np.arange(n_states), n_powers)
+    offsets = np.arange(src_all.size) - np.repeat(np.cumsum(n_powers) - n_powers, n_powers)
+    p_all = (np.repeat(k_first, n_powers) + offsets) * power_step_kw
+    soc_next = soc[src_all] - p_all * dt_h
+    j_all = np.round((soc_next - soc_min_kwh) / soc_step).astype(np.int64)
+    keep = (j_all >= 0) & (j_all < n_states)
+    src, dst, pw = src_all[keep], j_all[keep], p_all[keep]
+
+    order = np.argsort(dst, kind="stable")
+    dst_sorted = dst[order]
+    counts = np.bincount(dst_sorted, minlength=n_states)
+    width = max(1, int(counts.max()) if counts.size else 1)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    slot = np.arange(dst_sorted.size) - starts[dst_sorted]
+
+    in_src = np.full((n_states, width), n_states, dtype=np.int64)
+    in_p = np.zeros((n_states, width), dtype=np.float64)
+    in_src[dst_sorted, slot] = src[order]
+    in_p[dst_sorted, slot] = pw[order]
+    in_src.setflags(write=False)
+    in_p.setflags(write=False)
+    return StorageTransitions(
+        soc_min_kwh=soc_min_kwh,
+        soc_max_kwh=soc_max_kwh,
+        soc_step_kwh=soc_step,
+        dt_h=dt_h,
+        n_states=n_states,
+        in_src=in_src,
+        in_p=in_p,
+    )
+
+
+@dataclass
+class BatchSchedule:
+    cost: np.ndarray
+    p_kw: Optional[np.ndarray] = None
+    soc_kwh: Optional[np.ndarray] = None
+    grid_kw: Optional[np.ndarray] = None
+
+
+def _dp_optimize_storage_batch(
+    *,
+    net_kw: np.ndarray,
+    price: np.ndarray,
+    transitions: StorageTransitions,
+    soc0_kwh: float,
+    socT_kwh: float,
+    p_limits_kw: Optional[np.ndarray] = None,
+    keep_schedule: bool = True,
+    corridor: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+) -> BatchSchedule:
+    """
+    Vectorized storage DP over K net-load traces at once.
+
+    `net_kw` has shape (K, T); `price` is (T,) or (K, T). All rows share the same
+    transition structure, so one pass costs roughly as much as one scalar DP per
+    time step regardless of K. `p_limits_kw` (K,) tightens the power limit per row
+    below the one the transitions were built with; `keep_schedule=False` skips the
+    backtracking tables and only returns the optimal costs. `corridor` = (lo, hi)
+    restricts the SOC state after step t to indices lo[t]..hi[t], so a corridor DP
+    only pays for the states inside it.
+    """
+    net = np.atleast_2d(np.asarray(net_kw, dtype=np.float64))
+    n_rows, steps = net.shape
+    pr = np.broadcast_to(np.asarray(price, dtype=np.float64), (n_rows, steps))
+    tr = transitions
+    dt_h = tr.dt_h
+    n_states = tr.n_states
+    rows = np.arange(n_rows)
+
+    def to_idx(soc: float) -> int:
+        return max(0, min(n_states - 1, int(round((soc - tr.soc_min_kwh) / tr.soc_step_kwh))))
+
+    penalty = None
+    if p_limits_kw is not None:
+        limits = np.asarray(p_limits_kw, dtype=np.float64).reshape(n_rows, 1, 1)
+        penalty = np.where(np.abs(tr.in_p)[None, :, :] > limits + 1e-9, np.inf, 0.0)
+
+    # DP over SOC states; column n_states is the +inf padding sentinel.
+    cost = np.full((n_rows, n_states + 1), np.inf)
+    cost[:, to_idx(soc0_kwh)] = 0.0
+    choice = np.empty((steps, n_rows, n_states), dtype=np.int32) if keep_schedule else None
+
+    # Rows that share one trace (e.g. a sweep over power limits) share the step cost.
+    shared = n_rows > 1 and bool((net == net[:1]).all() and (pr == pr[:1]).all())
+    lo, hi = 0, n_states
+    for t in range(steps):
+        if corridor is not None:
+            lo, hi = int(corridor[0][t]), int(corridor[1][t]) + 1
+        in_src = tr.in_src[lo:hi]
+        in_p = tr.in_p[lo:hi]
+        if shared:
+            step_cost = ((net[0, t] - in_p) * pr[0, t] * dt_h)[None, :, :]
+        else:
+            step_cost = (net[:, t, None, None] - in_p[None, :, :]) * pr[:, t, None, None] * dt_h
+        cand = cost[:, in_src] + step_cost
+        if penalty is not None:
+            cand += penalty[:, lo:hi]
+        if corridor is not None:
+            cost[:, :n_states] = np.inf
+        if choice is None:
+            cost[:, lo:hi] = cand.min(axis=2)
+            continue
+        best = np.argmin(cand, axis=2)
+        next_cost = np.take_along_axis(cand, best[:, :, None], axis=2)[:, :, 0]
+        best[~np.isfinite(next_cost)] = -1
+        if corridor is not None:
+            choice[t] = -1
+        choice[t, :, lo:hi] = best
+        cost[:, lo:hi] = next_cost
+
+    final = cost[:, :n_states]
+    iT = to_idx(socT_kwh)
+    # If exact terminal SOC isn't reachable due to discretization, pick nearest.
+    j = np.where(np.isfinite(final[:, iT]), iT, np.argmin(final, axis=1))
+    total = final[rows, j]
+    if choice is None:
+        return BatchSchedule(cost=total)
+
+    p_schedule = np.zeros((n_rows, steps))
+    soc_schedule = np.zeros((n_rows, steps))
+    for t in range(steps - 1, -1, -1):
+        a = choice[t, rows, j]
+        reached = a >= 0
+        a_safe = np.where(reached, a, 0)
+        i = np.where(reached, tr.in_src[j, a_safe], j)
+        p = np.where(reached, tr.in_p[j, a_safe], 0.0)
+        soc_prev = tr.soc_min_kwh + i * tr.soc_step_kwh
+        # Forwards definition: soc_next = soc_prev - p*dt
+        p_schedule[:, t] = p
+        soc_schedule[:, t] = soc_prev - p * dt_h
+        j = i
+
+    grid_schedule = net - p_schedule
+    return BatchSchedule(cost=total, p_kw=p_schedule, soc_kwh=soc_schedule, grid_kw=grid_schedule)
+
+
 def _dp_optimize_storage(
     *,
     load_kw: List[float],
@@ -199,173 +328,122 @@ def _dp_optimize_storage(
     if steps <= 0:
         return [], [], []
 
-    soc_step = soc_step_kwh
-    if soc_step <= 0:
-        raise ValueError("invalid soc step")
-
-    def to_idx(soc: float) -> int:
-        return int(round((soc - soc_min_kwh) / soc_step))
-
-    n_states = int(round((soc_max_kwh - soc_min_kwh) / soc_step)) + 1
-    if n_states <= 1:
-        raise ValueError("invalid soc bounds")
-
-    # DP over SOC states: cost[t][i] = min cost up to time t with SOC index i
-    inf = 1e30
-    cost = [inf] * n_states
-    prev_idx: List[List[int]] = [[-1] * n_states for _ in range(steps)]
-    prev_p: List[List[float]] = [[0.0] * n_states for _ in range(steps)]
-
-    i0 = max(0, min(n_states - 1, to_idx(soc0_kwh)))
-    cost[i0] = 0.0
-
-    for t in range(steps):
-        next_cost = [inf] * n_states
-        net = float(load_kw[t]) - float(pv_kw[t])
-        pr = float(price[t])
+    transitions = _build_transitions(
+        float(soc_min_kwh), float(soc_max_kwh), float(soc_step_kwh), float(dt_h), float(p_max_kw), float(power_step_kw)
+    )
+    net = np.asarray(load_kw[:steps], dtype=np.float64) - np.asarray(pv_kw[:steps], dtype=np.float64)
+    sched = _dp_optimize_storage_batch(
+        net_kw=net[None, :],
+        price=np.asarray(price[:steps], dtype=np.float64),
+        transitions=transitions,
+        soc0_kwh=soc0_kwh,
+        socT_kwh=socT_kwh,
+    )
+    return sched.p_kw[0].tolist(), sched.soc_kwh[0].tolist(), sched.grid_kw[0].tolist()
 
-        for i in range(n_states):
-            base = cost[i]
-            if base >= inf / 2:
-                continue
-            soc = soc_min_kwh + i * soc_step
-
-            # Feasible power bounds from SOC + power limit
-            p_min = max(-p_max_kw, -(soc_max_kwh - soc) / dt_h)
-            p_max = min(p_max_kw, (soc - soc_min_kwh) / dt_h)
-
-            p = math.ceil(p_min / power_step_kw) * power_step_kw
-            while p <= p_max + 1e-9:
-                soc_next = soc - p * dt_h
-                j = int(round((soc_next - soc_min_kwh) / soc_step))
-                if 0 <= j < n_states:
-                    grid = net - p
-                    step_cost = grid * pr * dt_h
-                    cand = base + step_cost
-                    if cand < next_cost[j]:
-                        next_cost[j] = cand
-                        prev_idx[t][j] = i
-                        prev_p[t][j] = float(p)
-                p += power_step_kw
-
-        cost = next_cost
-
-    iT = max(0, min(n_states - 1, to_idx(socT_kwh)))
-    if cost[iT] >= inf / 2:
-        # If exact terminal SOC isn't reachable due to discretization, pick nearest.
-        best_i = min(range(n_states), key=lambda i: cost[i])
-    else:
-        best_i = iT
 
-    # Backtrack
-    p_schedule: List[float] = [0.0] * steps
-    soc_schedule: List[float] = [0.0] * steps
-    grid_schedule: List[float] = [0.0] * steps
+class _DecisionInputError(Exception):
+    pass
 
-    j = best_i
-    soc = soc_min_kwh + j * soc_step
-    for t in range(steps - 1, -1, -1):
-        i = prev_idx[t][j]
-        p = prev_p[t][j]
-        if i < 0:
-            i = j
-            p = 0.0
-        soc_prev = soc_min_kwh + i * soc_step
-        # Forwards definition: soc_next = soc_prev - p*dt
-        p_schedule[t] = float(p)
-        soc_schedule[t] = float(soc_prev - p * dt_h)
-        grid_schedule[t] = (float(load_kw[t]) - float(pv_kw[t])) - float(p)
-        j = i
-        soc = soc_prev
 
-    return p_schedule, soc_schedule, grid_schedule
+@dataclass
+class DecisionInputs:
+    """Aligned decision horizon: timestamps, point forecasts and time-of-day prices."""
+
+    dts: List[str]
+    load_kw: np.ndarray
+    pv_kw: np.ndarray
+    price: np.ndarray
+    dt_h: float
+    window_rows: int
+    warnings: List[str] = field(default_factory=list)
 
 
-def build_market_decision_12h(
-    *,
-    data_dir: str,
-    history_file: str = "虚拟电厂_24h15min_数据.csv",
-    load_forecast_file: str = "output/Load_forecast_12h.csv",
-    pv_forecast_file: str = "output/PV_forecast_12h.csv",
-    output_file: str = "output/Market_decision_12h.csv",
-    horizon_hours: float = 12.0,
-    step_minutes: int = 15,
-    window_hours: float = 24.0,
-    capacity_kwh: float = 200.0,
-    soc_initial_kwh: Optional[float] = None,
-    soc_final_kwh: Optional[float] = None,
-    p_max_kw: float = 100.0,
-) -> DecisionOutput:
-    warnings: List[str] = []
+def _validate_decision_params(step_minutes: int, horizon_hours: float, capacity_kwh: float, p_max_kw: float) -> None:
     if step_minutes <= 0 or 60 % step_minutes != 0:
-        return DecisionOutput(ok=False, message="step_minutes 必须能整除 60（例如 15）")
+        raise _DecisionInputError("step_minutes 必须能整除 60（例如 15）")
     if horizon_hours <= 0:
-        return DecisionOutput(ok=False, message="horizon_hours 必须 > 0")
+        raise _DecisionInputError("horizon_hours 必须 > 0")
     if capacity_kwh <= 0:
-        return DecisionOutput(ok=False, message="capacity_kwh 必须 > 0")
+        raise _DecisionInputError("capacity_kwh 必须 > 0")
     if p_max_kw <= 0:
-        return DecisionOutput(ok=False, message="p_max_kw 必须 > 0")
+        raise _DecisionInputError("p_max_kw 必须 > 0")
 
-    dt_h = step_minutes / 60.0
-    steps = int(round(horizon_hours / dt_h))
+
+def _read_history_window(data_dir: str, history_file: str, window_hours: float, step_minutes: int) -> preprocess.History:
     history_path = os.path.join(data_dir, history_file)
     if not os.path.exists(history_path):
-        return DecisionOutput(ok=False, message=f"历史数据不存在: {history_file}")
-
-    load_path = os.path.join(data_dir, load_forecast_file)
-    pv_path = os.path.join(data_dir, pv_forecast_file)
-    if not os.path.exists(load_path):
-        return DecisionOutput(ok=False, message=f"负荷预测不存在: {load_forecast_file}")
-    if not os.path.exists(pv_path):
-        return DecisionOutput(ok=False, message=f"光伏预测不存在: {pv_forecast_file}")
+        raise _DecisionInputError(f"历史数据不存在: {history_file}")
 
     try:
-        history_rows_all = _read_csv_rows(history_path)
-        history_step_minutes = _infer_history_step_minutes(history_rows_all)
-        raw_window_rows = int(round(window_hours * 60.0 / history_step_minutes))
-        history_rows_raw = history_rows_all[-raw_window_rows:] if len(history_rows_all) > raw_window_rows else history_rows_all
-        history_rows = _resample_history_rows(history_rows_raw, step_minutes)
+        history = preprocess.read_history(history_path)
     except OSError as exc:
-        return DecisionOutput(ok=False, message=f"历史数据读取失败: {exc}")
+        raise _DecisionInputError(f"历史数据读取失败: {exc}") from exc
+    history_step_minutes = preprocess.infer_step_minutes(history)
+    window = history.tail(int(round(window_hours * 60.0 / history_step_minutes)))
+    return preprocess.resample_mean(window, step_minutes, history_step_minutes)
+
 
-    if not history_rows:
-        return DecisionOutput(ok=False, message="历史数据为空")
+def _history_price_context(history: preprocess.History) -> Tuple[Dict[float, float], float, List[str]]:
+    if not len(history):
+        raise _DecisionInputError("历史数据为空")
 
-    price_map, price_warnings = _build_time_of_day_price_map(history_rows)
-    warnings.extend(price_warnings)
+    price_map, price_warnings = _build_time_of_day_price_map(history)
 
-    # Determine last hour from history (time axis base)
-    last = history_rows[-1]
-    last_hour = _extract_hour_value(last)
-    if last_hour is None:
-        return DecisionOutput(ok=False, message="无法从历史数据解析最后时间点（时间_小时/时间_时段）")
+    # Clock hour of the last history point (time axis base)
+    last_hour = float(preprocess.hour_of_day(history.slice(-1))[0])
+    if np.isnan(last_hour):
+        raise _DecisionInputError("无法从历史数据解析最后时间点（Datetime/时间_小时/时间_时段）")
+    return price_map, last_hour, list(price_warnings)
+
+
+def _read_forecast_rows(data_dir: str, load_forecast_file: str, pv_forecast_file: str) -> Tuple[List[Dict[str, str]], List[Dict[str, str]]]:
+    load_path = os.path.join(data_dir, load_forecast_file)
+    pv_path = os.path.join(data_dir, pv_forecast_file)
+    if not os.path.exists(load_path):
+        raise _DecisionInputError(f"负荷预测不存在: {load_forecast_file}")
+    if not os.path.exists(pv_path):
+        raise _DecisionInputError(f"光伏预测不存在: {pv_forecast_file}")
 
-    # Forecast series
     load_rows = _read_csv_rows(load_path)
     pv_rows = _read_csv_rows(pv_path)
     if not load_rows or not pv_rows:
-        return DecisionOutput(ok=False, message="预测文件为空")
+        raise _DecisionInputError("预测文件为空")
+    return load_rows, pv_rows
+
+
+def _forecast_column(rows: List[Dict[str, str]], key: str, n: int) -> np.ndarray:
+    return np.asarray([float(_safe_float(rows[i].get(key)) or 0.0) for i in range(n)], dtype=np.float64)
+
+
+def _load_decision_inputs(
+    *,
+    data_dir: str,
+    history_file: str,
+    load_forecast_file: str,
+    pv_forecast_file: str,
+    horizon_hours: float,
+    step_minutes: int,
+    window_hours: float,
+) -> Tuple[DecisionInputs, List[Dict[str, str]], List[Dict[str, str]]]:
+    dt_h = step_minutes / 60.0
+    steps = int(round(horizon_hours / dt_h))
+    history = _read_history_window(data_dir, history_file, window_hours, step_minutes)
+    price_map, last_hour, warnings = _history_price_context(history)
+    load_rows, pv_rows = _read_forecast_rows(data_dir, load_forecast_file, pv_forecast_file)
 
     aligned = min(steps, len(load_rows), len(pv_rows))
     if aligned <= 0:
-        return DecisionOutput(ok=False, message="预测长度不足")
+        raise _DecisionInputError("预测长度不足")
 
     dts: List[str] = []
-    load_kw: List[float] = []
-    pv_kw: List[float] = []
     price: List[float] = []
-
     for i in range(aligned):
         dt_text = str(load_rows[i].get("Datetime", "")).strip()
         if not dt_text:
             dt_text = str(pv_rows[i].get("Datetime", "")).strip()
         dts.append(dt_text)
 
-        lv = _safe_float(load_rows[i].get("Load_Forecast"))
-        pv = _safe_float(pv_rows[i].get("PV_Forecast"))
-        load_kw.append(float(lv or 0.0))
-        pv_kw.append(float(pv or 0.0))
-
         h = _parse_hour(dt_text)
         if h is None:
             # fallback: use last_hour + step
@@ -373,26 +451,162 @@ def build_market_decision_12h(
         tod = float(h) % 24.0
         price.append(_nearest_lookup(price_map, tod, default=0.0))
 
+    inputs = DecisionInputs(
+        dts=dts,
+        load_kw=_forecast_column(load_rows, "Load_Forecast", aligned),
+        pv_kw=_forecast_column(pv_rows, "PV_Forecast", aligned),
+        price=np.asarray(price, dtype=np.float64),
+        dt_h=dt_h,
+        window_rows=len(history),
+        warnings=warnings,
+    )
+    return inputs, load_rows, pv_rows
+
+
+def _resolve_soc_bounds(capacity_kwh: float, soc_initial_kwh: Optional[float], soc_final_kwh: Optional[float]) -> Tuple[float, float]:
     soc0 = float(soc_initial_kwh) if soc_initial_kwh is not None else capacity_kwh * 0.5
     socT = float(soc_final_kwh) if soc_final_kwh is not None else soc0
     soc0 = min(max(soc0, 0.0), capacity_kwh)
     socT = min(max(socT, 0.0), capacity_kwh)
+    return soc0, socT
 
-    p_schedule, soc_schedule, grid_schedule = _dp_optimize_storage(
-        load_kw=load_kw,
-        pv_kw=pv_kw,
-        price=price,
-        dt_h=dt_h,
-        soc_min_kwh=0.0,
-        soc_max_kwh=capacity_kwh,
-        soc0_kwh=soc0,
-        socT_kwh=socT,
-        p_max_kw=p_max_kw,
-        soc_step_kwh=1.0 if step_minutes <= 5 else 0.5,
-        power_step_kw=5.0 if step_minutes <= 5 else 2.0,
+
+def _default_grid_steps(step_minutes: int) -> Tuple[float, float]:
+    """(soc_step_kwh, power_step_kw) used by the exact solver."""
+    return (1.0 if step_minutes <= 5 else 0.5), (5.0 if step_minutes <= 5 else 2.0)
+
+
+@dataclass
+class _SolveReport:
+    solver: str
+    soc_step_kwh: float
+    power_step_kw: float
+    refinements: int
+    widenings: int
+    solve_ms: float
+
+
+def _solve_dispatch(
+    *,
+    net_kw: np.ndarray,
+    price: np.ndarray,
+    dt_h: float,
+    step_minutes: int,
+    capacity_kwh: float,
+    p_max_kw: float,
+    soc0_kwh: float,
+    socT_kwh: float,
+    time_budget_ms: Optional[float] = None,
+) -> Tuple[BatchSchedule, _SolveReport]:
+    """
+    Solve one net-load trace at the default grid resolution.
+
+    With `time_budget_ms` the solver runs in anytime mode: a coarse grid (up to 8x
+    the default steps) is solved in full, then each refinement halves both steps
+    and re-solves only a corridor of two coarse cells around the previous optimal
+    SOC trajectory, with the terminal target always inside it. A refined path that
+    touches the corridor edge or misses the target is not trusted: the corridor is
+    doubled around it and the level re-solved, until the path stays inside or the
+    corridor spans the whole grid. Every solve is started only if its estimated
+    cost (from the measured time per state-edge so far) fits in the remaining
+    budget; the finest level whose path was accepted is returned.
+    """
+    started = time.perf_counter()
+    soc_step_kwh, power_step_kw = _default_grid_steps(step_minutes)
+    net = np.asarray(net_kw, dtype=np.float64)[None, :]
+
+    def _solve(soc_step: float, power_step: float, corridor=None) -> BatchSchedule:
+        transitions = _build_transitions(0.0, float(capacity_kwh), soc_step, dt_h, float(p_max_kw), power_step)
+        return _dp_optimize_storage_batch(
+            net_kw=net, price=price, transitions=transitions, soc0_kwh=soc0_kwh, socT_kwh=socT_kwh, corridor=corridor
+        )
+
+    if time_budget_ms is None:
+        sched = _solve(soc_step_kwh, power_step_kw)
+        return sched, _SolveReport("exact", soc_step_kwh, power_step_kw, 0, 0, (time.perf_counter() - started) * 1000.0)
+
+    deadline = started + max(0.0, float(time_budget_ms)) / 1000.0
+
+    def _coarse_ok(f: int) -> bool:
+        # Powers below soc_step / (2 * dt) round to "no SOC change"; a coarse level must
+        # not widen that free band beyond its own power step or the target grid's band.
+        free_band = soc_step_kwh * f / (2.0 * dt_h)
+        return (
+            capacity_kwh / (soc_step_kwh * f) >= 16
+            and power_step_kw * f <= p_max_kw / 4
+            and free_band <= max(power_step_kw * f, soc_step_kwh / (2.0 * dt_h))
+        )
+
+    factor = 8
+    while factor > 1 and not _coarse_ok(factor):
+        factor //= 2
+
+    level_start = time.perf_counter()
+    sched = _solve(soc_step_kwh * factor, power_step_kw * factor)
+    coarse = _build_transitions(0.0, float(capacity_kwh), soc_step_kwh * factor, dt_h, float(p_max_kw), power_step_kw * factor)
+    seconds_per_edge = (time.perf_counter() - level_start) / max(1, coarse.n_states * coarse.in_src.shape[1] * net.shape[1])
+
+    refinements = widenings = 0
+    while factor > 1:
+        next_factor = factor // 2
+        soc_step = soc_step_kwh * next_factor
+        power_step = power_step_kw * next_factor
+        transitions = _build_transitions(0.0, float(capacity_kwh), soc_step, dt_h, float(p_max_kw), power_step)
+        last = transitions.n_states - 1
+        target = int(np.clip(np.rint(socT_kwh / soc_step), 0, last))
+        # SOC moves in multiples of power_step * dt, so a path "touches" the edge once
+        # its next reachable state in that direction falls outside the corridor.
+        lattice = max(1, int(round(power_step * dt_h / soc_step)))
+        radius = 2.0 * soc_step_kwh * factor
+        trajectory = sched.soc_kwh[0]
+        refined = None
+        while refined is None:
+            lo = np.clip(np.floor((trajectory - radius) / soc_step), 0, last).astype(np.int64)
+            hi = np.clip(np.ceil((trajectory + radius) / soc_step), 0, last).astype(np.int64)
+            lo[-1], hi[-1] = min(lo[-1], target), max(hi[-1], target)
+            edges = int((hi - lo + 1).sum()) * transitions.in_src.shape[1]
+            if time.perf_counter() + seconds_per_edge * edges > deadline:
+                break
+            level_start = time.perf_counter()
+            candidate = _solve(soc_step, power_step, corridor=(lo, hi))
+            seconds_per_edge = (time.perf_counter() - level_start) / max(1, edges)
+            path = np.rint(candidate.soc_kwh[0] / soc_step).astype(np.int64)
+            on_edge = ((path - lo < lattice) & (lo > 0)) | ((hi - path < lattice) & (hi < last))
+            whole_grid = not lo.any() and bool((hi == last).all())
+            if whole_grid or (path[-1] == target and not on_edge.any()):
+                refined = candidate
+            else:
+                # The new path lies within `radius` of the old one, so doubling around
+                # it still contains the previous corridor.
+                trajectory = candidate.soc_kwh[0]
+                radius *= 2.0
+                widenings += 1
+        if refined is None:
+            break
+        sched = refined
+        factor = next_factor
+        refinements += 1
+
+    return sched, _SolveReport(
+        "anytime",
+        soc_step_kwh * factor,
+        power_step_kw * factor,
+        refinements,
+        widenings,
+        (time.perf_counter() - started) * 1000.0,
     )
 
-    # Build CSV
+
+def _render_decision_csv(
+    dts: List[str],
+    load_kw: np.ndarray,
+    pv_kw: np.ndarray,
+    price: np.ndarray,
+    p_schedule: np.ndarray,
+    soc_schedule: np.ndarray,
+    grid_schedule: np.ndarray,
+    dt_h: float,
+) -> str:
     headers = [
         "Datetime",
         "Load_Forecast_kW",
@@ -405,53 +619,510 @@ def build_market_decision_12h(
         "Grid_Cost_yuan",
     ]
     lines = [",".join(headers)]
-    for i in range(aligned):
-        net = load_kw[i] - pv_kw[i]
-        p = p_schedule[i]
-        soc = soc_schedule[i]
-        grid = grid_schedule[i]
-        cost = grid * price[i] * dt_h
+    for i in range(len(dts)):
+        load = float(load_kw[i])
+        pv = float(pv_kw[i])
+        pr = float(price[i])
+        grid = float(grid_schedule[i])
+        cost = grid * pr * dt_h
         lines.append(
             ",".join(
                 [
                     dts[i],
-                    _format_num(load_kw[i], 4),
-                    _format_num(pv_kw[i], 4),
-                    _format_num(price[i], 6),
-                    _format_num(net, 4),
-                    _format_num(p, 4),
-                    _format_num(soc, 4),
+                    _format_num(load, 4),
+                    _format_num(pv, 4),
+                    _format_num(pr, 6),
+                    _format_num(load - pv, 4),
+                    _format_num(float(p_schedule[i]), 4),
+                    _format_num(float(soc_schedule[i]), 4),
                     _format_num(grid, 4),
                     _format_num(cost, 6),
                 ]
             )
         )
-    csv_text = "\n".join(lines)
+    return "\n".join(lines)
+
+
+def build_market_decision_12h(
+    *,
+    data_dir: str,
+    history_file: str = "虚拟电厂_24h15min_数据.csv",
+    load_forecast_file: str = "output/Load_forecast_12h.csv",
+    pv_forecast_file: str = "output/PV_forecast_12h.csv",
+    output_file: str = "output/Market_decision_12h.csv",
+    horizon_hours: float = 12.0,
+    step_minutes: int = 15,
+    window_hours: float = 24.0,
+    capacity_kwh: float = 200.0,
+    soc_initial_kwh: Optional[float] = None,
+    soc_final_kwh: Optional[float] = None,
+    p_max_kw: float = 100.0,
+    time_budget_ms: Optional[float] = None,
+) -> DecisionOutput:
+    """
+    Optimize the storage schedule against the point forecasts.
+
+    `time_budget_ms` switches to the anytime solver (coarse grid, then corridor
+    refinements while the budget lasts); the achieved resolution is reported in
+    the stats.
+    """
+    if time_budget_ms is not None and time_budget_ms <= 0:
+        return DecisionOutput(ok=False, message="time_budget_ms 必须 > 0")
+    try:
+        _validate_decision_params(step_minutes, horizon_hours, capacity_kwh, p_max_kw)
+        inputs, _, _ = _load_decision_inputs(
+            data_dir=data_dir,
+            history_file=history_file,
+            load_forecast_file=load_forecast_file,
+            pv_forecast_file=pv_forecast_file,
+            horizon_hours=horizon_hours,
+            step_minutes=step_minutes,
+            window_hours=window_hours,
+        )
+    except _DecisionInputError as exc:
+        return DecisionOutput(ok=False, message=str(exc))
+
+    return _decide(
+        inputs,
+        output_file=output_file,
+        horizon_hours=horizon_hours,
+        step_minutes=step_minutes,
+        window_hours=window_hours,
+        capacity_kwh=capacity_kwh,
+        soc_initial_kwh=soc_initial_kwh,
+        soc_final_kwh=soc_final_kwh,
+        p_max_kw=p_max_kw,
+        time_budget_ms=time_budget_ms,
+    )
+
+
+def _forecast_decision_inputs(
+    history: preprocess.History,
+    dts: List[str],
+    hours: List[float],
+    load_kw: List[float],
+    pv_kw: List[float],
+    horizon_hours: float,
+    step_minutes: int,
+) -> DecisionInputs:
+    """Align in-memory forecasts to the decision horizon and price them from the history window."""
+    price_map, _, warnings = _history_price_context(history)
+    dt_h = step_minutes / 60.0
+    aligned = min(int(round(horizon_hours / dt_h)), len(dts), len(hours), len(load_kw), len(pv_kw))
+    if aligned <= 0:
+        raise _DecisionInputError("预测长度不足")
+    return DecisionInputs(
+        dts=list(dts[:aligned]),
+        load_kw=np.asarray(load_kw[:aligned], dtype=np.float64),
+        pv_kw=np.asarray(pv_kw[:aligned], dtype=np.float64),
+        price=np.asarray([_nearest_lookup(price_map, float(h) % 24.0, default=0.0) for h in hours[:aligned]], dtype=np.float64),
+        dt_h=dt_h,
+        window_rows=len(history),
+        warnings=warnings,
+    )
+
+
+def build_market_decision_from_forecast(
+    *,
+    history: preprocess.History,
+    dts: List[str],
+    hours: List[float],
+    load_kw: List[float],
+    pv_kw: List[float],
+    output_file: str = "output/Market_decision_12h.csv",
+    horizon_hours: float = 12.0,
+    step_minutes: int = 15,
+    window_hours: float = 24.0,
+    capacity_kwh: float = 200.0,
+    soc_initial_kwh: Optional[float] = None,
+    soc_final_kwh: Optional[float] = None,
+    p_max_kw: float = 100.0,
+    time_budget_ms: Optional[float] = None,
+) -> DecisionOutput:
+    """
+    Same as `build_market_decision_12h`, for forecasts handed over in memory.
+
+    `history` is the already windowed/resampled history and `hours` the
+    absolute hour of each forecast step, so nothing is read or re-parsed.
+    """
+    if time_budget_ms is not None and time_budget_ms <= 0:
+        return DecisionOutput(ok=False, message="time_budget_ms 必须 > 0")
+    try:
+        _validate_decision_params(step_minutes, horizon_hours, capacity_kwh, p_max_kw)
+        inputs = _forecast_decision_inputs(history, dts, hours, load_kw, pv_kw, horizon_hours, step_minutes)
+    except _DecisionInputError as exc:
+        return DecisionOutput(ok=False, message=str(exc))
+
+    return _decide(
+        inputs,
+        output_file=output_file,
+        horizon_hours=horizon_hours,
+        step_minutes=step_minutes,
+        window_hours=window_hours,
+        capacity_kwh=capacity_kwh,
+        soc_initial_kwh=soc_initial_kwh,
+        soc_final_kwh=soc_final_kwh,
+        p_max_kw=p_max_kw,
+        time_budget_ms=time_budget_ms,
+    )
+
+
+def _decide(
+    inputs: DecisionInputs,
+    *,
+    output_file: str,
+    horizon_hours: float,
+    step_minutes: int,
+    window_hours: float,
+    capacity_kwh: float,
+    soc_initial_kwh: Optional[float],
+    soc_final_kwh: Optional[float],
+    p_max_kw: float,
+    time_budget_ms: Optional[float],
+) -> DecisionOutput:
+    soc0, socT = _resolve_soc_bounds(capacity_kwh, soc_initial_kwh, soc_final_kwh)
+    sched, report = _solve_dispatch(
+        net_kw=inputs.load_kw - inputs.pv_kw,
+        price=inputs.price,
+        dt_h=inputs.dt_h,
+        step_minutes=step_minutes,
+        capacity_kwh=capacity_kwh,
+        p_max_kw=p_max_kw,
+        soc0_kwh=soc0,
+        socT_kwh=socT,
+        time_budget_ms=time_budget_ms,
+    )
+
+    csv_text = _render_decision_csv(
+        inputs.dts, inputs.load_kw, inputs.pv_kw, inputs.price, sched.p_kw[0], sched.soc_kwh[0], sched.grid_kw[0], inputs.dt_h
+    )
 
     stats = DecisionStats(
         horizon_hours=horizon_hours,
         step_minutes=step_minutes,
-        steps=aligned,
+        steps=len(inputs.dts),
         window_hours=window_hours,
-        window_rows=len(history_rows),
+        window_rows=inputs.window_rows,
         capacity_kwh=capacity_kwh,
         soc_initial_kwh=soc0,
         soc_final_kwh=socT,
         p_max_kw=p_max_kw,
         objective="minimize grid cost (buy positive / sell negative) at market price",
+        solver=report.solver,
+        soc_step_kwh=report.soc_step_kwh,
+        power_step_kw=report.power_step_kw,
+        refinements=report.refinements,
+        widenings=report.widenings,
+        solve_ms=round(report.solve_ms, 3),
     )
-    return DecisionOutput(ok=True, message="ok", filename=output_file, csv_text=csv_text, warnings=warnings, stats=stats)
+    return DecisionOutput(ok=True, message="ok", filename=output_file, csv_text=csv_text, warnings=inputs.warnings, stats=stats)
 
 
-def write_market_decision_12h(**kwargs) -> DecisionOutput:
+def _decision_cache_key(kwargs: Dict[str, object]) -> str:
+    bound = inspect.signature(build_market_decision_12h).bind(**kwargs)
+    bound.apply_defaults()
+    params = dict(bound.arguments)
+    data_dir = str(params.pop("data_dir"))
+    digests = []
+    for name in ("history_file", "load_forecast_file", "pv_forecast_file"):
+        digest = file_digest(os.path.join(data_dir, str(params[name])))
+        if not digest:
+            return ""
+        digests.append(digest)
+    return content_key("market_decision_12h", [_SOLVER_REVISION, *digests, params])
+
+
+def _output_matches(data_dir: str, filename: str, csv_text: str) -> bool:
+    try:
+        with open(os.path.join(data_dir, filename), "r", encoding="utf-8-sig") as f:
+            return f.read() == csv_text
+    except OSError:
+        return False
+
+
+def _full_resolution(stats: Optional[DecisionStats]) -> bool:
+    """True if the schedule was solved on the default grid (exact, or anytime that finished)."""
+    if stats is None:
+        return False
+    return (stats.soc_step_kwh, stats.power_step_kw) == _default_grid_steps(stats.step_minutes)
+
+
+def write_market_decision_12h(use_cache: bool = True, **kwargs) -> DecisionOutput:
+    """
+    Build and write the decision CSV.
+
+    Results are cached on a hash of the input files and parameters; on a hit the
+    stored result is returned without running the DP, and the output file is only
+    rewritten if it no longer holds the cached content. An anytime solve that ran
+    out of budget before the default grid depends on wall-clock time, so only
+    full-resolution results are stored.
+    """
     data_dir = kwargs.get("data_dir")
     if not data_dir:
         return DecisionOutput(ok=False, message="data_dir is required")
-    result = build_market_decision_12h(**kwargs)
+
+    key = _decision_cache_key(kwargs) if use_cache else ""
+    entry = DECISION_CACHE.get(key) if key else None
+    if entry is not None:
+        result = DecisionOutput(
+            ok=True,
+            message="ok",
+            filename=entry["filename"],
+            csv_text=entry["csv_text"],
+            warnings=list(entry["warnings"]),
+            stats=DecisionStats(**entry["stats"]),
+            cached=True,
+        )
+        if _output_matches(str(data_dir), result.filename, result.csv_text):
+            return result
+    else:
+        result = build_market_decision_12h(**kwargs)
+        if not result.ok:
+            return result
+
+    wr = write_data_csv(result.filename, result.csv_text, data_dir)
+    if not wr.ok:
+        return DecisionOutput(ok=False, message=wr.message, warnings=result.warnings, stats=result.stats)
+    result.filename = wr.filename
+    if key and entry is None and _full_resolution(result.stats):
+        DECISION_CACHE.put(
+            key,
+            {
+                "filename": result.filename,
+                "csv_text": result.csv_text,
+                "warnings": result.warnings,
+                "stats": vars(result.stats) if result.stats else {},
+            },
+        )
+    return result
+
+
+# ---------------------------------------------------------------------------
+# Scenario-batched (stochastic) dispatch
+# ---------------------------------------------------------------------------
+
+
+@dataclass
+class ScenarioDecisionOutput:
+    ok: bool
+    message: str
+    filename: str = ""
+    csv_text: str = ""
+    warnings: List[str] = field(default_factory=list)
+    stats: Optional[DecisionStats] = None
+    selected: str = ""
+    scenarios: List[Dict[str, object]] = field(default_factory=list)
+
+
+def _scenario_columns(rows: List[Dict[str, str]], base: str) -> List[str]:
+    """Forecast columns `<base>_<name>` (e.g. Load_Forecast_P10) in header order."""
+    if not rows:
+        return []
+    prefix = f"{base}_"
+    return [key[len(prefix):] for key in rows[0].keys() if key and key.startswith(prefix) and len(key) > len(prefix)]
+
+
+def _collect_scenarios(
+    *,
+    data_dir: str,
+    inputs: DecisionInputs,
+    load_rows: List[Dict[str, str]],
+    pv_rows: List[Dict[str, str]],
+    scenarios: Optional[List[Dict[str, object]]],
+) -> Tuple[List[str], np.ndarray, np.ndarray, np.ndarray]:
+    """Return (names, load (K,T), pv (K,T), weights (K,)) aligned to the decision horizon."""
+    n = len(inputs.dts)
+    names: List[str] = []
+    loads: List[np.ndarray] = []
+    pvs: List[np.ndarray] = []
+    weights: List[float] = []
+
+    def _trace(values: object, fallback: np.ndarray, label: str) -> np.ndarray:
+        if values is None:
+            return fallback
+        if not isinstance(values, (list, tuple)):
+            raise _DecisionInputError(f"场景 {label} 必须是数值数组")
+        arr = np.asarray([float(_safe_float(v) or 0.0) for v in values[:n]], dtype=np.float64)
+        if arr.size < n:
+            raise _DecisionInputError(f"场景 {label} 长度不足: {arr.size} < {n}")
+        return arr
+
+    if scenarios:
+        for idx, spec in enumerate(scenarios):
+            if not isinstance(spec, dict):
+                raise _DecisionInputError(f"场景 #{idx} 格式错误")
+            name = str(spec.get("name") or f"s{idx}")
+            load = _trace(spec.get("load"), inputs.load_kw, f"{name}.load")
+            pv = _trace(spec.get("pv"), inputs.pv_kw, f"{name}.pv")
+            load_file = spec.get("load_forecast")
+            pv_file = spec.get("pv_forecast")
+            if load_file or pv_file:
+                s_load_rows, s_pv_rows = _read_forecast_rows(
+                    data_dir, str(load_file or "output/Load_forecast_12h.csv"), str(pv_file or "output/PV_forecast_12h.csv")
+                )
+                if min(len(s_load_rows), len(s_pv_rows)) < n:
+                    raise _DecisionInputError(f"场景 {name} 预测长度不足")
+                if load_file:
+                    load = _forecast_column(s_load_rows, "Load_Forecast", n)
+                if pv_file:
+                    pv = _forecast_column(s_pv_rows, "PV_Forecast", n)
+            names.append(name)
+            loads.append(load)
+            pvs.append(pv)
+            raw_weight = spec.get("weight")
+            weight = 1.0 if raw_weight is None else _safe_float(raw_weight)
+            # An explicit 0 excludes the scenario; only a missing weight defaults to 1.
+            if weight is None or not np.isfinite(weight) or weight < 0:
+                raise _DecisionInputError(f"场景 {name} 的权重必须是非负数: {raw_weight!r}")
+            weights.append(float(weight))
+    else:
+        # Quantile / ensemble traces stored as extra columns of the forecast files.
+        load_cols = _scenario_columns(load_rows, "Load_Forecast")
+        pv_cols = _scenario_columns(pv_rows, "PV_Forecast")
+        for name in list(dict.fromkeys(load_cols + pv_cols)):
+            names.append(name)
+            loads.append(_forecast_column(load_rows, f"Load_Forecast_{name}", n) if name in load_cols else inputs.load_kw)
+            pvs.append(_forecast_column(pv_rows, f"PV_Forecast_{name}", n) if name in pv_cols else inputs.pv_kw)
+            weights.append(1.0)
+
+    if not names:
+        raise _DecisionInputError("未提供场景，且预测文件中没有 Load_Forecast_*/PV_Forecast_* 场景列")
+
+    w = np.asarray(weights, dtype=np.float64)
+    if np.any(w < 0) or w.sum() <= 0:
+        raise _DecisionInputError("场景权重必须非负且不全为 0")
+    return names, np.vstack(loads), np.vstack(pvs), w / w.sum()
+
+
+def build_market_decision_scenarios(
+    *,
+    data_dir: str,
+    history_file: str = "虚拟电厂_24h15min_数据.csv",
+    load_forecast_file: str = "output/Load_forecast_12h.csv",
+    pv_forecast_file: str = "output/PV_forecast_12h.csv",
+    output_file: str = "output/Market_decision_12h_scenarios.csv",
+    scenarios: Optional[List[Dict[str, object]]] = None,
+    selection: str = "expected",
+    horizon_hours: float = 12.0,
+    step_minutes: int = 15,
+    window_hours: float = 24.0,
+    capacity_kwh: float = 200.0,
+    soc_initial_kwh: Optional[float] = None,
+    soc_final_kwh: Optional[float] = None,
+    p_max_kw: float = 100.0,
+) -> ScenarioDecisionOutput:
+    """
+    Solve K forecast scenarios plus their probability-weighted mean in one batched DP.
+
+    Scenarios come from `scenarios` (inline arrays or forecast file pairs) or, when
+    omitted, from the `Load_Forecast_<name>`/`PV_Forecast_<name>` columns of the
+    forecast files. `selection` picks the published schedule: "expected" is the DP on
+    the weighted mean net load (exact for the linear cost), "robust" is the candidate
+    schedule with the lowest worst-case cost across scenarios.
+    """
+    if selection not in ("expected", "robust"):
+        return ScenarioDecisionOutput(ok=False, message="selection 必须是 expected 或 robust")
+    try:
+        _validate_decision_params(step_minutes, horizon_hours, capacity_kwh, p_max_kw)
+        inputs, load_rows, pv_rows = _load_decision_inputs(
+            data_dir=data_dir,
+            history_file=history_file,
+            load_forecast_file=load_forecast_file,
+            pv_forecast_file=pv_forecast_file,
+            horizon_hours=horizon_hours,
+            step_minutes=step_minutes,
+            window_hours=window_hours,
+        )
+        names, loads, pvs, weights = _collect_scenarios(
+            data_dir=data_dir, inputs=inputs, load_rows=load_rows, pv_rows=pv_rows, scenarios=scenarios
+        )
+    except _DecisionInputError as exc:
+        return ScenarioDecisionOutput(ok=False, message=str(exc))
+
+    soc0, socT = _resolve_soc_bounds(capacity_kwh, soc_initial_kwh, soc_final_kwh)
+    soc_step_kwh, power_step_kw = _default_grid_steps(step_minutes)
+    transitions = _build_transitions(0.0, float(capacity_kwh), soc_step_kwh, inputs.dt_h, float(p_max_kw), power_step_kw)
+
+    nets = loads - pvs
+    mean_load = weights @ loads
+    mean_pv = weights @ pvs
+    # Row K is the expected-value trace; all K+1 rows share one DP pass.
+    sched = _dp_optimize_storage_batch(
+        net_kw=np.vstack([nets, mean_load - mean_pv]),
+        price=inputs.price,
+        transitions=transitions,
+        soc0_kwh=soc0,
+        socT_kwh=socT,
+    )
+
+    # cost[c, k]: candidate schedule c evaluated against scenario k.
+    step_price = inputs.price * inputs.dt_h
+    cost_matrix = (nets @ step_price)[None, :] - (sched.p_kw @ step_price)[:, None]
+    expected_cost = cost_matrix @ weights
+    worst_cost = cost_matrix.max(axis=1)
+
+    candidates = names + ["expected"]
+    if selection == "robust":
+        chosen = int(np.argmin(worst_cost))
+    else:
+        chosen = len(names)
+
+    p_sel = sched.p_kw[chosen]
+    csv_text = _render_decision_csv(
+        inputs.dts, mean_load, mean_pv, inputs.price, p_sel, sched.soc_kwh[chosen], (mean_load - mean_pv) - p_sel, inputs.dt_h
+    )
+
+    scenario_reports: List[Dict[str, object]] = []
+    for c, name in enumerate(candidates):
+        scenario_reports.append(
+            {
+                "name": name,
+                "weight": float(weights[c]) if c < len(names) else 1.0,
+                "optimal_cost": float(sched.cost[c]),
+                "expected_cost": float(expected_cost[c]),
+                "worst_case_cost": float(worst_cost[c]),
+                "battery_power_kw": [round(float(v), 4) for v in sched.p_kw[c]],
+                "soc_kwh": [round(float(v), 4) for v in sched.soc_kwh[c]],
+            }
+        )
+
+    stats = DecisionStats(
+        horizon_hours=horizon_hours,
+        step_minutes=step_minutes,
+        steps=len(inputs.dts),
+        window_hours=window_hours,
+        window_rows=inputs.window_rows,
+        capacity_kwh=capacity_kwh,
+        soc_initial_kwh=soc0,
+        soc_final_kwh=socT,
+        p_max_kw=p_max_kw,
+        objective=(
+            f"minimize {'worst-case' if selection == 'robust' else 'expected'} grid cost over {len(names)} scenarios"
+        ),
+        soc_step_kwh=soc_step_kwh,
+        power_step_kw=power_step_kw,
+    )
+    return ScenarioDecisionOutput(
+        ok=True,
+        message="ok",
+        filename=output_file,
+        csv_text=csv_text,
+        warnings=inputs.warnings,
+        stats=stats,
+        selected=candidates[chosen],
+        scenarios=scenario_reports,
+    )
+
+
+def write_market_decision_scenarios(**kwargs) -> ScenarioDecisionOutput:
+    data_dir = kwargs.get("data_dir")
+    if not data_dir:
+        return ScenarioDecisionOutput(ok=False, message="data_dir is required")
+    result = build_market_decision_scenarios(**kwargs)
     if not result.ok:
         return result
     wr = write_data_csv(result.filename, result.csv_text, data_dir)
     if not wr.ok:
-        return DecisionOutput(ok=False, message=wr.message, warnings=result.warnings, stats=result.stats)
+        return ScenarioDecisionOutput(ok=False, message=wr.message, warnings=result.warnings, stats=result.stats)
     result.filename = wr.filename
     return result
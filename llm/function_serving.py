@@ -0,0 +1,406 @@
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Deque, Dict, Optional, Sequence
+
+from flask import Flask, jsonify, request
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+# Requests running at once per endpoint (per process). Endpoints not listed (and not heavy)
+# are never queued, so /health, /assistant/tools and status reads stay fast under load.
+DEFAULT_LIMITS: Dict[str, int] = {
+    "/predict12h": 2,
+    "/pipeline12h": 2,
+    "/decision12h": 2,
+    "/decision12h/scenarios": 1,
+    "/decision12h/sweep": 1,
+    "/backtest12h": 1,
+    "/chat": 4,
+    "/chat/stream": 4,
+    "/agent": 4,
+    "/agent/stream": 4,
+    "/assist": 4,
+    "/agent/write-target": 2,
+}
+
+
+def parse_limits(specs) -> Dict[str, int]:
+    """DEFAULT_LIMITS overridden by "PATH=N" strings (N = 0 removes the limit)."""
+    limits = dict(DEFAULT_LIMITS)
+    for spec in specs or ():
+        path, sep, value = str(spec).partition("=")
+        if not sep or not path.startswith("/"):
+            raise ValueError(f"limit must look like /path=N: {spec}")
+        limits[path.strip()] = int(value)
+    return {path: n for path, n in limits.items() if n > 0}
+
+
+# Forecast/decision/backtest endpoints share the heavy-work slots below; LLM endpoints are
+# I/O bound and only have their per-endpoint limit.
+HEAVY_ENDPOINTS = ("/predict12h", "/pipeline12h", "/decision12h", "/decision12h/scenarios", "/decision12h/sweep", "/backtest12h")
+
+PRIORITY_CLASSES = ("interactive", "background")
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+@dataclass
+class _Ticket:
+    path: str
+    cls: str
+    heavy: bool
+    key: str = ""
+    revision: Optional[int] = None
+    enqueued_at: float = field(default_factory=time.perf_counter)
+    state: str = "queued"  # queued -> running | superseded | shed | timeout
+    wait_ms: float = 0.0
+
+
+class AdmissionControl:
+    """
+    Priority admission in front of the views.
+
+    Every request is `interactive` (default: the dashboard and assistant) or `background`
+    (header `X-Priority: background`, sent by the simulator's syncs). Heavy endpoints share
+    `heavy_slots` execution slots, of which background work may hold at most
+    `background_slots`, so an operator's forecast always finds a slot soon. Endpoints in
+    `limits` additionally run at most N at once. Requests that cannot start wait in a
+    bounded FIFO queue per class; freed slots go to queued interactive work first.
+
+    A background request may carry `X-Revision` (and `X-Sync-Key`, default the path): a newer
+    revision drops queued older ones with the same key (409), and a full background queue
+    sheds its oldest entry for the newcomer. Interactive requests are refused with 503 when
+    their queue is full or they waited `wait_s` seconds.
+    """
+
+    def __init__(
+        self,
+        limits: Dict[str, int],
+        *,
+        heavy_slots: int = 2,
+        background_slots: int = 1,
+        queue_sizes: Optional[Dict[str, int]] = None,
+        wait_s: float = 30.0,
+        heavy: Sequence[str] = HEAVY_ENDPOINTS,
+    ) -> None:
+        self.limits = {path: int(n) for path, n in limits.items() if int(n) > 0}
+        self.heavy = frozenset(heavy)
+        self.heavy_slots = max(1, int(heavy_slots))
+        self.background_slots = min(self.heavy_slots, max(1, int(background_slots)))
+        self.queue_sizes = {"interactive": 16, "background": 4, **(queue_sizes or {})}
+        self.wait_s = float(wait_s)
+        self._cond = threading.Condition()
+        self._queues: Dict[str, Deque[_Ticket]] = {cls: deque() for cls in PRIORITY_CLASSES}
+        self._active = {path: 0 for path in self.limits}
+        self._heavy_active = {cls: 0 for cls in PRIORITY_CLASSES}
+        self._counts = {cls: {"admitted": 0, "rejected": 0, "superseded": 0, "shed": 0} for cls in PRIORITY_CLASSES}
+        self._waits = {cls: deque(maxlen=256) for cls in PRIORITY_CLASSES}
+
+    # -- scheduling (callers hold self._cond) --------------------------------------------
+
+    def _can_run(self, ticket: _Ticket) -> bool:
+        limit = self.limits.get(ticket.path)
+        if limit is not None and self._active[ticket.path] >= limit:
+            return False
+        if ticket.heavy:
+            if sum(self._heavy_active.values()) >= self.heavy_slots:
+                return False
+            if ticket.cls == "background" and self._heavy_active["background"] >= self.background_slots:
+                return False
+        return True
+
+    def _start(self, ticket: _Ticket) -> None:
+        ticket.state = "running"
+        ticket.wait_ms = (time.perf_counter() - ticket.enqueued_at) * 1000.0
+        if ticket.path in self._active:
+            self._active[ticket.path] += 1
+        if ticket.heavy:
+            self._heavy_active[ticket.cls] += 1
+        self._counts[ticket.cls]["admitted"] += 1
+        self._waits[ticket.cls].append(ticket.wait_ms)
+
+    def _dispatch(self) -> None:
+        # Interactive first, FIFO within a class; a ticket blocked only by its own endpoint
+        # limit does not hold back the tickets behind it.
+        for cls in PRIORITY_CLASSES:
+            queue = self._queues[cls]
+            for ticket in list(queue):
+                if self._can_run(ticket):
+                    queue.remove(ticket)
+                    self._start(ticket)
+        self._cond.notify_all()
+
+    def _drop(self, ticket: _Ticket, state: str) -> None:
+        self._queues[ticket.cls].remove(ticket)
+        ticket.state = state
+        self._counts[ticket.cls][state if state != "timeout" else "rejected"] += 1
+
+    # -- request side --------------------------------------------------------------------
+
+    def acquire(self, path: str, cls: str = "interactive", key: str = "", revision: Optional[int] = None) -> Optional[_Ticket]:
+        """A running ticket, None when `path` is not controlled; raises AdmissionRejected."""
+        heavy = path in self.heavy
+        if not heavy and path not in self.limits:
+            return None
+        cls = cls if cls in PRIORITY_CLASSES else "interactive"
+        ticket = _Ticket(path, cls, heavy, key or path, revision)
+        with self._cond:
+            queue = self._queues[cls]
+            if cls == "background" and revision is not None:
+                for queued in list(queue):
+                    if queued.key != ticket.key or queued.revision is None:
+                        continue
+                    if queued.revision >= revision:
+                        self._counts[cls]["superseded"] += 1
+                        raise AdmissionRejected(409, f"revision {revision} superseded by queued revision {queued.revision}")
+                    self._drop(queued, "superseded")
+            # Start at once only if nobody of this or a higher class is already waiting.
+            ahead = len(self._queues["interactive"]) + (len(queue) if cls == "background" else 0)
+            if not ahead and self._can_run(ticket):
+                self._start(ticket)
+                return ticket
+            if len(queue) >= self.queue_sizes[cls]:
+                if cls != "background" or not queue:
+                    self._counts[cls]["rejected"] += 1
+                    raise AdmissionRejected(503, f"{cls} queue is full ({len(queue)} waiting)")
+                self._drop(queue[0], "shed")
+            queue.append(ticket)
+            self._cond.notify_all()
+            self._cond.wait_for(lambda: ticket.state != "queued", timeout=self.wait_s)
+            if ticket.state == "queued":
+                self._drop(ticket, "timeout")
+            if ticket.state == "superseded":
+                raise AdmissionRejected(409, "superseded by a newer revision while queued")
+            if ticket.state == "shed":
+                raise AdmissionRejected(503, "shed from a full background queue by newer work")
+            if ticket.state == "timeout":
+                raise AdmissionRejected(503, f"waited {self.wait_s:.0f}s without a free slot")
+            return ticket
+
+    def release(self, ticket: _Ticket) -> None:
+        with self._cond:
+            if ticket.path in self._active:
+                self._active[ticket.path] -= 1
+            if ticket.heavy:
+                self._heavy_active[ticket.cls] -= 1
+            self._dispatch()
+
+    def install(self, app: Flask) -> None:
+        @app.before_request
+        def _admit():
+            if request.method == "OPTIONS" or request.url_rule is None:
+                return None
+            revision = request.headers.get("X-Revision", "")
+            try:
+                ticket = self.acquire(
+                    request.url_rule.rule,
+                    request.headers.get("X-Priority", "interactive").strip().lower(),
+                    request.headers.get("X-Sync-Key", ""),
+                    int(revision) if revision.strip().lstrip("-").isdigit() else None,
+                )
+            except AdmissionRejected as exc:
+                response = jsonify({"ok": False, "error": exc.message, "superseded": exc.status == 409})
+                response.status_code = exc.status
+                if exc.status == 503:
+                    response.headers["Retry-After"] = "5"
+                return response
+            if ticket is not None:
+                request.environ["vpp.ticket"] = ticket
+            return None
+
+        @app.after_request
+        def _report_wait(response):
+            ticket = request.environ.get("vpp.ticket")
+            if ticket is not None:
+                response.headers["X-Queue-Wait-Ms"] = f"{ticket.wait_ms:.1f}"
+            return response
+
+        @app.teardown_request
+        def _release(exc):
+            ticket = request.environ.pop("vpp.ticket", None)
+            if ticket is not None:
+                self.release(ticket)
+
+    def status(self) -> Dict[str, object]:
+        with self._cond:
+            classes = {}
+            for cls in PRIORITY_CLASSES:
+                waits = sorted(self._waits[cls])
+                classes[cls] = {
+                    "queued": len(self._queues[cls]),
+                    "queue_size": self.queue_sizes[cls],
+                    "heavy_running": self._heavy_active[cls],
+                    "oldest_wait_ms": round((time.perf_counter() - self._queues[cls][0].enqueued_at) * 1000.0, 1) if self._queues[cls] else 0.0,
+                    # Over the last 256 admissions of the class.
+                    "wait_ms_p50": round(waits[len(waits) // 2], 1) if waits else 0.0,
+                    "wait_ms_p95": round(waits[int(len(waits) * 0.95)], 1) if waits else 0.0,
+                    **self._counts[cls],
+                }
+            return {
+                "heavy_slots": self.heavy_slots,
+                "background_slots": self.background_slots,
+                "classes": classes,
+                "endpoints": {path: {"limit": limit, "active": self._active[path]} for path, limit in self.limits.items()},
+            }
+
+
+class _RequestHandler(WSGIRequestHandler):
+    # One request per connection: an idle keep-alive browser connection would otherwise
+    # hold a pool thread until the client goes away.
+    protocol_version = "HTTP/1.0"
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """Werkzeug WSGI server that runs each connection on a fixed-size thread pool."""
+
+    multithread = True
+
+    def __init__(self, host: str, port: int, app, threads: int = 8, fd: Optional[int] = None) -> None:
+        super().__init__(host, port, app, handler=_RequestHandler, fd=fd)
+        self._pool = ThreadPoolExecutor(max_workers=max(1, int(threads)), thread_name_prefix="http")
+        self._idle = threading.Condition()
+        self._inflight = 0
+
+    def process_request(self, request, client_address) -> None:
+        with self._idle:
+            self._inflight += 1
+        self._pool.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address) -> None:
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            with self._idle:
+                self._inflight -= 1
+                self._idle.notify_all()
+
+    def drain(self, timeout: float) -> int:
+        """Wait up to `timeout` s for accepted requests to finish; returns how many did not."""
+        with self._idle:
+            self._idle.wait_for(lambda: self._inflight == 0, timeout=max(0.0, timeout))
+            left = self._inflight
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        return left
+
+
+def _stop_signals():
+    names = ("SIGINT", "SIGTERM", "SIGBREAK")  # SIGBREAK: Ctrl+Break on Windows
+    return [getattr(signal, name) for name in names if hasattr(signal, name)]
+
+
+def _serve_worker(
+    app,
+    host: str,
+    sock: socket.socket,
+    threads: int,
+    shutdown_timeout: float,
+    on_shutdown: Optional[Callable[[], None]],
+) -> None:
+    port = sock.getsockname()[1]
+    server = PooledWSGIServer(host, port, app, threads=threads, fd=sock.fileno())
+    # Several processes may wait on the same socket; a non-blocking accept lets the losers
+    # go back to polling (and notice shutdown) instead of blocking in accept().
+    server.socket.setblocking(False)
+    stop = threading.Event()
+    for sig in _stop_signals():
+        signal.signal(sig, lambda signum, frame: stop.set())
+
+    loop = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.2}, name="http-accept", daemon=True)
+    loop.start()
+    print(f" * pid {os.getpid()} serving on http://{host}:{port} with {threads} threads", file=sys.stderr)
+    while not stop.wait(0.5):
+        pass
+
+    started = time.perf_counter()
+    server.shutdown()  # stop accepting; requests already accepted keep running
+    # Close the listener now so new clients are refused at once rather than left in the backlog.
+    server.server_close()
+    sock.close()
+    left = server.drain(shutdown_timeout)
+    if on_shutdown is not None:
+        on_shutdown()
+    print(
+        f" * pid {os.getpid()} stopped in {time.perf_counter() - started:.1f}s"
+        + (f", {left} request(s) abandoned after {shutdown_timeout:.0f}s" if left else ""),
+        file=sys.stderr,
+    )
+
+
+def serve(
+    app,
+    host: str,
+    port: int,
+    *,
+    threads: int = 8,
+    processes: int = 1,
+    shutdown_timeout: float = 30.0,
+    before_fork: Optional[Callable[[], None]] = None,
+    after_fork: Optional[Callable[[], None]] = None,
+    on_shutdown: Optional[Callable[[], None]] = None,
+) -> None:
+    """
+    Production serving: `processes` workers (fork, POSIX only) sharing one listening socket,
+    each running requests on `threads` pool threads.
+
+    `before_fork` runs once in the parent before the workers are forked, so whatever it
+    loads (the ML stack) is shared copy-on-write instead of loaded per worker. It must not
+    run torch (or other OpenMP) ops: those start thread pools that do not survive fork, and
+    a worker inheriting one can hang on its first parallel op. Work that needs them (model
+    warm-up) belongs in `after_fork`, which runs in each worker before it starts serving.
+    SIGINT / SIGTERM stop accepting, let in-flight requests finish for up to
+    `shutdown_timeout` seconds, then run `on_shutdown` in every worker.
+    """
+    if processes > 1 and not hasattr(os, "fork"):
+        print(" * --processes needs fork (not available on this platform); using 1 process", file=sys.stderr)
+        processes = 1
+    sock = socket.create_server((host, port), backlog=128)
+
+    if processes <= 1:
+        _serve_worker(app, host, sock, threads, shutdown_timeout, on_shutdown)
+        return
+
+    if before_fork is not None:
+        before_fork()
+    children = []
+    for _ in range(processes):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                if after_fork is not None:
+                    after_fork()
+                _serve_worker(app, host, sock, threads, shutdown_timeout, on_shutdown)
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        children.append(pid)
+    sock.close()
+
+    def _forward(signum, frame):
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    for sig in _stop_signals():
+        signal.signal(sig, _forward)
+    for pid in children:
+        os.waitpid(pid, 0)
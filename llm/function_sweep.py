@@ -0,0 +1,271 @@
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from function_decision import (
+    _build_transitions,
+    _default_grid_steps,
+    _DecisionInputError,
+    _dp_optimize_storage_batch,
+    _format_num,
+    _load_decision_inputs,
+    _validate_decision_params,
+)
+from function_predict import write_data_csv
+
+
+@dataclass
+class SweepOutput:
+    ok: bool
+    message: str
+    capacities_kwh: List[float] = field(default_factory=list)
+    p_max_kw: List[float] = field(default_factory=list)
+    # cost_yuan[i][j] is the optimal grid cost for capacities_kwh[i] x p_max_kw[j].
+    cost_yuan: List[List[float]] = field(default_factory=list)
+    baseline_cost_yuan: float = 0.0
+    best: Dict[str, float] = field(default_factory=dict)
+    filename: str = ""
+    csv_text: str = ""
+    warnings: List[str] = field(default_factory=list)
+    stats: Dict[str, object] = field(default_factory=dict)
+
+
+# Power ratings per capacity are solved in this many bands (see _solve_capacity_row).
+_POWER_BANDS = 5
+
+# Per-process copy of the shared decision inputs, installed once by the pool initializer.
+_WORKER_INPUTS: Dict[str, object] = {}
+
+
+def _init_sweep_worker(net: np.ndarray, price: np.ndarray, dt_h: float, soc_step_kwh: float, power_step_kw: float) -> None:
+    _WORKER_INPUTS.update(
+        net=net,
+        price=price,
+        dt_h=dt_h,
+        soc_step_kwh=soc_step_kwh,
+        power_step_kw=power_step_kw,
+    )
+
+
+def _solve_capacity_row(args: Tuple[float, Sequence[float], float, float]) -> np.ndarray:
+    """
+    Optimal cost for one capacity across every power rating.
+
+    All ratings share one SOC grid, so neighbouring ratings run as rows of a single
+    batched DP over the transition structure of the band's largest rating, each row
+    masked to its own limit. Bands keep small ratings off the widest transition table.
+    """
+    capacity_kwh, powers, soc_initial_frac, soc_final_frac = args
+    net = _WORKER_INPUTS["net"]
+    powers_arr = np.asarray(powers, dtype=np.float64)
+    costs = np.empty(powers_arr.size)
+    for band in np.array_split(np.arange(powers_arr.size), max(1, min(_POWER_BANDS, powers_arr.size))):
+        band_powers = powers_arr[band]
+        transitions = _build_transitions(
+            0.0,
+            float(capacity_kwh),
+            float(_WORKER_INPUTS["soc_step_kwh"]),
+            float(_WORKER_INPUTS["dt_h"]),
+            float(band_powers.max()),
+            float(_WORKER_INPUTS["power_step_kw"]),
+        )
+        sched = _dp_optimize_storage_batch(
+            net_kw=np.broadcast_to(net, (band_powers.size, net.size)),
+            price=_WORKER_INPUTS["price"],
+            transitions=transitions,
+            soc0_kwh=capacity_kwh * soc_initial_frac,
+            socT_kwh=capacity_kwh * soc_final_frac,
+            p_limits_kw=band_powers,
+            keep_schedule=False,
+        )
+        costs[band] = sched.cost
+    return costs
+
+
+def parse_grid(spec: object) -> List[float]:
+    """Accept a list, "a,b,c", "start:stop:num" (inclusive linspace) or {start, stop, num}."""
+    if isinstance(spec, dict):
+        return [float(v) for v in np.linspace(float(spec["start"]), float(spec["stop"]), int(spec["num"]))]
+    if isinstance(spec, (list, tuple)):
+        return [float(v) for v in spec]
+    text = str(spec or "").strip()
+    if ":" in text:
+        start, stop, num = text.split(":")
+        return [float(v) for v in np.linspace(float(start), float(stop), int(num))]
+    return [float(v) for v in text.split(",") if v.strip()]
+
+
+def _render_sweep_csv(capacities: List[float], powers: List[float], cost: np.ndarray, baseline: float) -> str:
+    lines = ["Capacity_kWh,P_Max_kW,Grid_Cost_yuan,Savings_yuan"]
+    for i, cap in enumerate(capacities):
+        for j, pw in enumerate(powers):
+            lines.append(
+                ",".join([_format_num(cap, 4), _format_num(pw, 4), _format_num(float(cost[i, j]), 6), _format_num(baseline - float(cost[i, j]), 6)])
+            )
+    return "\n".join(lines)
+
+
+def sweep_battery_sizing(
+    *,
+    data_dir: str,
+    capacities_kwh: Sequence[float],
+    p_max_kw: Sequence[float],
+    history_file: str = "虚拟电厂_24h15min_数据.csv",
+    load_forecast_file: str = "output/Load_forecast_12h.csv",
+    pv_forecast_file: str = "output/PV_forecast_12h.csv",
+    output_file: str = "output/Battery_sizing_sweep.csv",
+    horizon_hours: float = 12.0,
+    step_minutes: int = 15,
+    window_hours: float = 24.0,
+    soc_initial_frac: float = 0.5,
+    soc_final_frac: Optional[float] = None,
+    workers: Optional[int] = None,
+) -> SweepOutput:
+    """
+    Evaluate the dispatch DP over a capacity x power grid and return the cost surface.
+
+    History and forecasts are loaded once; each capacity is one task that solves its
+    power ratings as batched DP rows sharing the capacity's transition structures.
+    Tasks are spread over `workers` processes (default: all cores, 1 runs inline),
+    started with spawn: this runs on a request thread, and forking a threaded server
+    can copy locks held by other threads into the children.
+    """
+    capacities = sorted({float(c) for c in capacities_kwh})
+    powers = sorted({float(p) for p in p_max_kw})
+    if not capacities or not powers:
+        return SweepOutput(ok=False, message="capacities_kwh / p_max_kw 不能为空")
+    soc_final_frac = soc_initial_frac if soc_final_frac is None else soc_final_frac
+    if not (0.0 <= soc_initial_frac <= 1.0 and 0.0 <= soc_final_frac <= 1.0):
+        return SweepOutput(ok=False, message="soc_initial_frac / soc_final_frac 必须在 [0, 1] 内")
+
+    try:
+        if not all(np.isfinite(capacities)) or not all(np.isfinite(powers)):
+            raise _DecisionInputError("capacities_kwh / p_max_kw 必须是有限数值")
+        for cap in capacities:
+            for power in powers:
+                _validate_decision_params(step_minutes, horizon_hours, cap, power)
+        inputs, _, _ = _load_decision_inputs(
+            data_dir=data_dir,
+            history_file=history_file,
+            load_forecast_file=load_forecast_file,
+            pv_forecast_file=pv_forecast_file,
+            horizon_hours=horizon_hours,
+            step_minutes=step_minutes,
+            window_hours=window_hours,
+        )
+    except _DecisionInputError as exc:
+        return SweepOutput(ok=False, message=str(exc))
+
+    started = time.perf_counter()
+    net = inputs.load_kw - inputs.pv_kw
+    soc_step_kwh, power_step_kw = _default_grid_steps(step_minutes)
+    init_args = (net, inputs.price, inputs.dt_h, soc_step_kwh, power_step_kw)
+    # Largest capacities first: they dominate runtime, so the pool drains evenly.
+    order = sorted(range(len(capacities)), key=lambda i: -capacities[i])
+    tasks = [(capacities[i], powers, soc_initial_frac, soc_final_frac) for i in order]
+
+    n_workers = max(1, min(int(workers or os.cpu_count() or 1), len(tasks)))
+    if n_workers == 1:
+        _init_sweep_worker(*init_args)
+        rows = [_solve_capacity_row(task) for task in tasks]
+    else:
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=n_workers, mp_context=ctx, initializer=_init_sweep_worker, initargs=init_args) as pool:
+            rows = list(pool.map(_solve_capacity_row, tasks))
+
+    cost = np.empty((len(capacities), len(powers)))
+    for i, row in zip(order, rows):
+        cost[i] = row
+    baseline = float(net @ (inputs.price * inputs.dt_h))
+    bi, bj = np.unravel_index(int(np.argmin(cost)), cost.shape)
+
+    return SweepOutput(
+        ok=True,
+        message="ok",
+        capacities_kwh=capacities,
+        p_max_kw=powers,
+        cost_yuan=cost.tolist(),
+        baseline_cost_yuan=baseline,
+        best={
+            "capacity_kwh": capacities[bi],
+            "p_max_kw": powers[bj],
+            "cost_yuan": float(cost[bi, bj]),
+            "savings_yuan": baseline - float(cost[bi, bj]),
+        },
+        filename=output_file,
+        csv_text=_render_sweep_csv(capacities, powers, cost, baseline),
+        warnings=inputs.warnings,
+        stats={
+            "horizon_hours": horizon_hours,
+            "step_minutes": step_minutes,
+            "steps": len(inputs.dts),
+            "window_rows": inputs.window_rows,
+            "grid_points": len(capacities) * len(powers),
+            "workers": n_workers,
+            "elapsed_s": round(time.perf_counter() - started, 3),
+        },
+    )
+
+
+def write_battery_sizing_sweep(**kwargs) -> SweepOutput:
+    data_dir = kwargs.get("data_dir")
+    if not data_dir:
+        return SweepOutput(ok=False, message="data_dir is required")
+    result = sweep_battery_sizing(**kwargs)
+    if not result.ok or not result.filename:
+        return result
+    wr = write_data_csv(result.filename, result.csv_text, data_dir)
+    if not wr.ok:
+        result.ok = False
+        result.message = wr.message
+        return result
+    result.filename = wr.filename
+    return result
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Battery sizing sweep over capacity x power using the 12h dispatch DP.")
+    parser.add_argument("--data-dir", default=os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data")))
+    parser.add_argument("--capacities", required=True, help='kWh grid: "a,b,c" or "start:stop:num"')
+    parser.add_argument("--powers", required=True, help='kW grid: "a,b,c" or "start:stop:num"')
+    parser.add_argument("--history-file", default="虚拟电厂_24h15min_数据.csv")
+    parser.add_argument("--load-forecast", default="output/Load_forecast_12h.csv")
+    parser.add_argument("--pv-forecast", default="output/PV_forecast_12h.csv")
+    parser.add_argument("--output-file", default="output/Battery_sizing_sweep.csv", help="relative to data dir; empty to skip writing")
+    parser.add_argument("--horizon-hours", type=float, default=12.0)
+    parser.add_argument("--step-minutes", type=int, default=15)
+    parser.add_argument("--window-hours", type=float, default=24.0)
+    parser.add_argument("--soc-initial-frac", type=float, default=0.5)
+    parser.add_argument("--workers", type=int, default=0, help="0 uses all cores")
+    args = parser.parse_args()
+
+    result = write_battery_sizing_sweep(
+        data_dir=args.data_dir,
+        capacities_kwh=parse_grid(args.capacities),
+        p_max_kw=parse_grid(args.powers),
+        history_file=args.history_file,
+        load_forecast_file=args.load_forecast,
+        pv_forecast_file=args.pv_forecast,
+        output_file=args.output_file,
+        horizon_hours=args.horizon_hours,
+        step_minutes=args.step_minutes,
+        window_hours=args.window_hours,
+        soc_initial_frac=args.soc_initial_frac,
+        workers=args.workers or None,
+    )
+    if not result.ok:
+        print(result.message)
+        return 1
+    print(json.dumps({"best": result.best, "baseline_cost_yuan": result.baseline_cost_yuan, "files": [result.filename] if result.filename else [], "stats": result.stats}, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,18 +1,232 @@
 import os
 import re
 import argparse
+import copy
 import csv
+import importlib.util
+import json
 import math
-import tempfile
-from datetime import datetime, timedelta
+import sys
+import threading
+import time
+from datetime import timedelta
 from dataclasses import dataclass, field
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 import httpx
-from flask import Flask, jsonify, request
+import numpy as np
+from flask import Flask, Response, jsonify, request, stream_with_context
 
 from function_predict import write_agent_csv, write_data_csv
-from function_decision import write_market_decision_12h
+from function_decision import build_market_decision_from_forecast, write_market_decision_12h, write_market_decision_scenarios
+from function_backtest import write_backtest
+from function_actions import ACTION_TOOLS, ActionNode, build_action_dag, run_action_dag
+from function_cache import ResultCache, content_key, file_digest
+from function_serving import DEFAULT_LIMITS, AdmissionControl, parse_limits, serve
+from function_sweep import parse_grid, write_battery_sizing_sweep
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+from predict import preprocess  # noqa: E402
+
+# Requests finer than this are forecast at this step and upsampled (see _compute_forecast).
+COARSE_STEP_MINUTES = 15
+
+# Quantile columns written by probabilistic forecasts (`quantiles: true`): <target>_Forecast_P10 ...
+BAND_LABELS = ("P10", "P50", "P90")
+
+# History read for residual bands: each scored origin needs a day before it, which a 24h
+# window alone cannot give, so bands look back this far (or the window, if longer).
+BAND_HISTORY_HOURS = 72.0
+
+# Rendered forecasts keyed on the history bytes, request parameters and served model weights.
+FORECAST_CACHE = ResultCache(max_entries=16)
+
+
+# DeepSeek's tokenizer spends roughly 0.6 tokens per CJK character and 0.3 per other
+# character; each message adds a few tokens of framing.
+_CJK_RE = re.compile(r"[\u3000-\u303f\u3400-\u9fff\uf900-\ufaff\uff00-\uffef]")
+_MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: str) -> int:
+    cjk = len(_CJK_RE.findall(text))
+    return int(math.ceil(cjk * 0.6 + (len(text) - cjk) * 0.3))
+
+
+def _content_text(message: Dict[str, Any]) -> str:
+    """Text content of a message ("" for an assistant message that only carries tool_calls)."""
+    content = message.get("content")
+    return content if isinstance(content, str) else ""
+
+
+def _message_tokens(messages: List[Dict[str, Any]]) -> int:
+    total = 0
+    for m in messages:
+        total += estimate_tokens(_content_text(m)) + _MESSAGE_OVERHEAD_TOKENS
+        if m.get("tool_calls"):
+            total += estimate_tokens(json.dumps(m["tool_calls"], ensure_ascii=False))
+    return total
+
+
+def _csv_summary(lines: List[str], head: int, tail: int) -> str:
+    """Statistics plus first/last rows standing in for a long CSV block."""
+    header = next(csv.reader([lines[0]]))
+    rows = list(csv.reader(lines[1:]))
+    stats = []
+    for col, name in enumerate(header):
+        values = preprocess.to_floats([r[col] if col < len(r) else "" for r in rows])
+        finite = values[np.isfinite(values)]
+        # Columns that are mostly numbers (timestamps and labels are not).
+        if finite.size and finite.size >= 0.8 * len(rows):
+            stats.append(
+                f"- {name.strip()}: 最小 {finite.min():.4g} / 均值 {finite.mean():.4g} / 最大 {finite.max():.4g}"
+                + (f"（{len(rows) - finite.size} 个空值）" if finite.size < len(rows) else "")
+            )
+    parts = [f"[CSV 已压缩：{len(rows)} 行 × {len(header)} 列；列：{', '.join(h.strip() for h in header)}]"]
+    if stats:
+        parts += ["数值列统计：", *stats]
+    parts += [f"前 {head} 行：", lines[0], *lines[1 : head + 1], f"……（省略 {len(rows) - head - tail} 行）……", f"后 {tail} 行：", *lines[-tail:]]
+    return "\n".join(parts)
+
+
+def compact_csv_blocks(text: str, max_rows: int = 40, head: int = 5, tail: int = 5) -> Tuple[str, int]:
+    """
+    Replace every run of more than `max_rows` comma-separated lines with the same field
+    count (a pasted or attached CSV) by `_csv_summary`. Returns (text, blocks replaced).
+    """
+    lines = text.split("\n")
+    out: List[str] = []
+    replaced = 0
+    i = 0
+    while i < len(lines):
+        fields = lines[i].count(",")
+        j = i + 1
+        if fields:
+            while j < len(lines) and lines[j].count(",") == fields:
+                j += 1
+        if fields and j - i - 1 > max(max_rows, head + tail):
+            out.append(_csv_summary(lines[i:j], head, tail))
+            replaced += 1
+        else:
+            out.extend(lines[i:j])
+        i = j
+    return ("\n".join(out) if replaced else text), replaced
+
+
+def _truncate_middle(text: str, tokens: int) -> str:
+    """Keep the start and end of `text` within about `tokens` tokens."""
+    total = estimate_tokens(text)
+    if total <= tokens:
+        return text
+    keep = max(0, int(len(text) * tokens / total) - 20) // 2
+    return f"{text[:keep]}\n……（省略约 {len(text) - 2 * keep} 字）……\n{text[len(text) - keep:] if keep else ''}"
+
+
+class ContextCompactor:
+    """
+    Fits the messages of one completion into `max_tokens` prompt tokens (estimated).
+
+    Within budget, messages pass through unchanged. Otherwise it goes step by step until
+    they fit (only `content` is rewritten; `name`, `tool_calls`, `tool_call_id` and any
+    other keys of the kept messages are preserved):
+      1. long CSV blocks become column statistics plus head/tail rows;
+      2. turns older than the latest `keep_last` become one-line gists in a single system
+         message, and the leading system messages (the guards) are always kept; a tool
+         result is never kept without the assistant message that called it;
+      3. the kept turns shrink down to the latest one;
+      4. the longest remaining messages are cut in the middle, the latest message and the
+         leading system messages last.
+    """
+
+    def __init__(self, max_tokens: int = 8000, keep_last: int = 6, csv_rows: int = 40) -> None:
+        self.max_tokens = int(max_tokens)
+        self.keep_last = max(1, int(keep_last))
+        self.csv_rows = int(csv_rows)
+        self._lock = threading.Lock()
+        self._totals = {"requests": 0, "compacted": 0, "tokens_in": 0, "tokens_out": 0, "csv_blocks": 0, "summarized": 0, "truncated": 0}
+
+    def compact(self, messages: List[Dict[str, Any]], max_tokens: Optional[int] = None) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+        budget = int(max_tokens or self.max_tokens)
+        msgs = []
+        for m in messages:
+            if not isinstance(m, dict):
+                continue
+            msg = {**m, "role": str(m.get("role", "user"))}
+            if msg.get("content") is not None or not msg.get("tool_calls"):
+                msg["content"] = str(msg.get("content") or "")
+            msgs.append(msg)
+        report = {"budget": budget, "tokens_in": _message_tokens(msgs), "csv_blocks": 0, "summarized": 0, "truncated": 0}
+        if budget > 0 and report["tokens_in"] > budget:
+            msgs = self._fit(msgs, budget, report)
+        report["tokens_out"] = _message_tokens(msgs)
+        with self._lock:
+            self._totals["requests"] += 1
+            self._totals["compacted"] += int(report["tokens_out"] < report["tokens_in"])
+            for key in ("tokens_in", "tokens_out", "csv_blocks", "summarized", "truncated"):
+                self._totals[key] += report[key]
+        return msgs, report
+
+    def _fit(self, msgs: List[Dict[str, Any]], budget: int, report: Dict[str, int]) -> List[Dict[str, Any]]:
+        for m in msgs:
+            if _content_text(m):
+                m["content"], replaced = compact_csv_blocks(m["content"], self.csv_rows)
+                report["csv_blocks"] += replaced
+        if _message_tokens(msgs) <= budget:
+            return msgs
+
+        lead = 0
+        while lead < len(msgs) - 1 and msgs[lead]["role"] == "system":
+            lead += 1
+        guards, turns = msgs[:lead], msgs[lead:]
+        keep = min(self.keep_last, len(turns))
+        while True:
+            split = len(turns) - keep
+            while split > 0 and turns[split]["role"] == "tool":
+                split -= 1
+            older, recent = turns[:split], turns[split:]
+            fitted = guards + self._summarize(older, budget // 10) + recent
+            if _message_tokens(fitted) <= budget or keep == 1:
+                break
+            keep -= 1
+        report["summarized"] = len(older)
+
+        # Cut the longest message first; the latest turn and the guards only when nothing else is left.
+        protected = set(range(len(fitted) - 1, len(fitted))) | set(range(lead))
+        for candidates in (lambda i: i not in protected, lambda i: True):
+            while _message_tokens(fitted) > budget:
+                pool = [i for i in range(len(fitted)) if candidates(i) and estimate_tokens(_content_text(fitted[i])) > 64]
+                if not pool:
+                    break
+                i = max(pool, key=lambda k: estimate_tokens(_content_text(fitted[k])))
+                excess = _message_tokens(fitted) - budget
+                target = max(48, estimate_tokens(fitted[i]["content"]) - excess)
+                fitted[i] = {**fitted[i], "content": _truncate_middle(fitted[i]["content"], target)}
+                report["truncated"] += 1
+        return fitted
+
+    @staticmethod
+    def _summarize(older: List[Dict[str, Any]], tokens: int) -> List[Dict[str, str]]:
+        """One system message with the latest gists of `older` that fit in `tokens`."""
+        if not older:
+            return []
+        labels = {"user": "用户", "assistant": "助手", "system": "系统"}
+        gists: List[str] = []
+        used = 0
+        for m in reversed(older):
+            line = " ".join(_content_text(m).split())
+            gist = f"- {labels.get(m['role'], m['role'])}：{line[:80]}{'…' if len(line) > 80 else ''}"
+            used += estimate_tokens(gist)
+            if used > tokens:
+                break
+            gists.append(gist)
+        header = f"以下是较早 {len(older)} 条对话的摘要（原文已省略）："
+        return [{"role": "system", "content": "\n".join([header, *reversed(gists)])}]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"max_tokens": self.max_tokens, "keep_last": self.keep_last, **self._totals}
 
 
 @dataclass
@@ -22,15 +236,55 @@ class LLMConfig:
     base_url: str = field(default="https://api.deepseek.com/v1")
     model: str = field(default="deepseek-chat")
     timeout_s: float = field(default=30.0)
+    # Connection pool shared by every call of one agent (and one for async calls).
+    max_connections: int = field(default=16)
+    max_keepalive_connections: int = field(default=8)
+    keepalive_expiry_s: float = field(default=60.0)
+    # Needs the optional `h2` package (pip install "httpx[http2]"); ignored without it.
+    http2: bool = field(default_factory=lambda: os.getenv("DEEPSEEK_HTTP2", "") == "1")
+    # Completions cached by normalized prompt (cache_entries=0 disables it). Only calls at
+    # or below cache_max_temperature (by default: temperature 0) are cached unless the
+    # caller opts in with cache=True; sampled answers are meant to vary.
+    cache_entries: int = field(default=128)
+    cache_ttl_s: float = field(default=600.0)
+    cache_max_temperature: float = field(default_factory=lambda: float(os.getenv("DEEPSEEK_CACHE_MAX_TEMPERATURE", "") or 0.0))
+    cache_dir: str = field(default_factory=lambda: os.getenv("DEEPSEEK_CACHE_DIR", ""))
+    # Prompt budget in estimated tokens (0 sends messages unchanged), see ContextCompactor.
+    context_tokens: int = field(default_factory=lambda: int(os.getenv("DEEPSEEK_CONTEXT_TOKENS", "") or 8000))
+    context_keep_last: int = field(default=6)
 
 
 class DeepSeekAgent:
+    """
+    DeepSeek chat-completions client. Calls reuse one pooled keep-alive connection set
+    (`client` / `async_client`, created on first use), so only the first request to the
+    API pays TCP and TLS setup; `close` / `aclose` release the pools at shutdown.
+
+    Answers are kept in `cache` (LRU + TTL, optional disk tier) keyed on the model,
+    sampling parameters and the messages with whitespace normalized, so a repeated
+    dashboard question is answered without a round trip. `cache=None` caches only
+    deterministic calls (temperature <= cache_max_temperature), `cache=True` opts a
+    sampled call in and `cache=False` skips the cache. Hits are returned as copies.
+    Messages are fitted into the prompt budget by `context` before either happens.
+    """
+
     def __init__(self, config: Optional[LLMConfig] = None) -> None:
         self.config = config or LLMConfig()
         if not self.config.api_key:
             self.config.api_key = self._load_key_from_file(self.config.api_key_path)
         if not self.config.api_key:
             raise ValueError("Missing DEEPSEEK_API_KEY or key file")
+        self._client: Optional[httpx.Client] = None
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._client_lock = threading.Lock()
+        self.context = ContextCompactor(self.config.context_tokens, self.config.context_keep_last)
+        self.cache: Optional[ResultCache] = None
+        if self.config.cache_entries > 0:
+            self.cache = ResultCache(
+                max_entries=self.config.cache_entries,
+                disk_dir=self.config.cache_dir or None,
+                ttl_s=self.config.cache_ttl_s,
+            )
 
     def _load_key_from_file(self, path: str) -> str:
         if not path:
@@ -51,13 +305,50 @@ class DeepSeekAgent:
             return ""
         return ""
 
-    def chat(
+    def _client_options(self) -> Dict[str, Any]:
+        http2 = self.config.http2
+        if http2 and importlib.util.find_spec("h2") is None:
+            print("DEEPSEEK_HTTP2 needs the h2 package; using HTTP/1.1", file=sys.stderr)
+            http2 = False
+        return {
+            "base_url": self.config.base_url.rstrip("/") + "/",
+            "headers": {"Authorization": f"Bearer {self.config.api_key}"},
+            "timeout": self.config.timeout_s,
+            "limits": httpx.Limits(
+                max_connections=self.config.max_connections,
+                max_keepalive_connections=self.config.max_keepalive_connections,
+                keepalive_expiry=self.config.keepalive_expiry_s,
+            ),
+            "http2": http2,
+        }
+
+    @property
+    def client(self) -> httpx.Client:
+        """Pooled client shared by all request threads (httpx.Client is thread-safe)."""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = httpx.Client(**self._client_options())
+        return self._client
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        """Pooled async client; use it from one event loop. Created once even if threads race."""
+        if self._async_client is None:
+            with self._client_lock:
+                if self._async_client is None:
+                    self._async_client = httpx.AsyncClient(**self._client_options())
+        return self._async_client
+
+    def _payload(
         self,
         messages: List[Dict[str, str]],
-        temperature: float = 0.7,
-        max_tokens: int = 512,
-        extra: Optional[Dict[str, Any]] = None,
+        temperature: float,
+        max_tokens: int,
+        extra: Optional[Dict[str, Any]],
     ) -> Dict[str, Any]:
+        if self.context.max_tokens > 0:
+            messages, _ = self.context.compact(messages)
         payload: Dict[str, Any] = {
             "model": self.config.model,
             "messages": messages,
@@ -66,18 +357,219 @@ class DeepSeekAgent:
         }
         if extra:
             payload.update(extra)
+        return payload
 
-        headers = {"Authorization": f"Bearer {self.config.api_key}"}
-        url = f"{self.config.base_url}/chat/completions"
+    def _cache_key(self, payload: Dict[str, Any], use_cache: Optional[bool]) -> str:
+        """Cache key of a request payload, "" when the call must not be cached."""
+        if use_cache is False or self.cache is None:
+            return ""
+        if use_cache is None and float(payload.get("temperature", 0.0)) > self.config.cache_max_temperature:
+            return ""
+        messages = [
+            [
+                str(m.get("role", "")).strip().lower(),
+                " ".join(str(m.get("content") or "").split()),
+                {k: v for k, v in m.items() if k not in ("role", "content")},
+            ]
+            for m in payload.get("messages") or []
+            if isinstance(m, dict)
+        ]
+        rest = {k: v for k, v in payload.items() if k not in ("messages", "stream")}
+        return content_key("llm-chat", [rest, messages])
 
-        with httpx.Client(timeout=self.config.timeout_s) as client:
-            resp = client.post(url, headers=headers, json=payload)
+    def chat(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: int = 512,
+        extra: Optional[Dict[str, Any]] = None,
+        cache: Optional[bool] = None,
+    ) -> Dict[str, Any]:
+        payload = self._payload(messages, temperature, max_tokens, extra)
+        key = self._cache_key(payload, cache)
+        hit = self.cache.get(key) if key else None
+        if hit is not None:
+            return copy.deepcopy(hit)
+        resp = self.client.post("chat/completions", json=payload)
+        resp.raise_for_status()
+        data = resp.json()
+        if key:
+            self.cache.put(key, copy.deepcopy(data))
+        return data
+
+    def chat_stream(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: int = 512,
+        extra: Optional[Dict[str, Any]] = None,
+        cache: Optional[bool] = None,
+    ) -> Iterator[str]:
+        """
+        Content deltas of a `stream: true` completion, yielded as DeepSeek sends them. A
+        cached answer (from `chat` or an earlier complete stream) comes back as one delta.
+        Only a stream that ended with `[DONE]` or a `finish_reason` is cached; a dropped
+        connection leaves a partial answer that must not be replayed as a hit.
+        """
+        payload = self._payload(messages, temperature, max_tokens, extra)
+        key = self._cache_key(payload, cache)
+        hit = self.cache.get(key) if key else None
+        if hit is not None:
+            yield hit["choices"][0]["message"]["content"]
+            return
+        payload["stream"] = True
+        parts: List[str] = []
+        finish_reason: Optional[str] = None
+        done = False
+        with self.client.stream("POST", "chat/completions", json=payload) as resp:
             resp.raise_for_status()
-            return resp.json()
-
-
-def create_app(agent: DeepSeekAgent) -> Flask:
+            for line in resp.iter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    done = True
+                    break
+                for choice in json.loads(data).get("choices") or []:
+                    delta = (choice.get("delta") or {}).get("content")
+                    if delta:
+                        parts.append(delta)
+                        yield delta
+                    finish_reason = choice.get("finish_reason") or finish_reason
+        if key and (done or finish_reason):
+            message = {"role": "assistant", "content": "".join(parts)}
+            choice = {"index": 0, "message": message, "finish_reason": finish_reason or "stop"}
+            self.cache.put(key, {"model": self.config.model, "choices": [choice]})
+
+    async def achat(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: int = 512,
+        extra: Optional[Dict[str, Any]] = None,
+        cache: Optional[bool] = None,
+    ) -> Dict[str, Any]:
+        """`chat` for asyncio callers, e.g. several completions at once via asyncio.gather."""
+        payload = self._payload(messages, temperature, max_tokens, extra)
+        key = self._cache_key(payload, cache)
+        hit = self.cache.get(key) if key else None
+        if hit is not None:
+            return copy.deepcopy(hit)
+        resp = await self.async_client.post("chat/completions", json=payload)
+        resp.raise_for_status()
+        data = resp.json()
+        if key:
+            self.cache.put(key, copy.deepcopy(data))
+        return data
+
+    def close(self) -> None:
+        with self._client_lock:
+            client, self._client = self._client, None
+        if client is not None:
+            client.close()
+
+    async def aclose(self) -> None:
+        with self._client_lock:
+            client, self._async_client = self._async_client, None
+        if client is not None:
+            await client.aclose()
+
+
+class MLPreloader:
+    """
+    Imports predict/lstm.py (torch, scikit-learn, joblib) and loads both forecasters once.
+
+    `start` runs the work on a daemon thread so the HTTP server can come up immediately;
+    `get` blocks until it finished (starting it inline if nobody did), so concurrent
+    forecasts wait on the one preload instead of each importing and loading again.
+    With `warm_up=False` (a parent about to fork) torch is held to one thread and nothing
+    is run; `warm_up` finishes the job in each worker.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._started_at = 0.0
+        self._warm_up = True
+        self._threads = 0
+        self.module: Any = None
+        self.error = ""
+        self.report: Dict[str, Any] = {}
+
+    def start(self, warm_up: bool = True) -> None:
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._warm_up = warm_up
+            self._started_at = time.perf_counter()
+            self._thread = threading.Thread(target=self._run, name="ml-preload", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        try:
+            from predict import lstm  # type: ignore
+
+            imported_s = time.perf_counter() - self._started_at
+            if not self._warm_up:
+                # One intra-op thread runs every op inline, so loading starts no thread pool.
+                self._threads = lstm.configure_threads().get("intra_op", 0)
+                lstm.configure_threads(1)
+            models = lstm.preload(warm_up=self._warm_up)
+            self.report = {"import_s": round(imported_s, 3), "models": models, "warmed_up": self._warm_up}
+            self.module = lstm
+        except Exception as exc:
+            self.error = str(exc)
+        finally:
+            self.report["elapsed_s"] = round(time.perf_counter() - self._started_at, 3)
+            self._done.set()
+
+    def get(self, warm_up: bool = True) -> Any:
+        self.start(warm_up)
+        self._done.wait()
+        if self.module is None:
+            raise RuntimeError(self.error or "ML preload failed")
+        return self.module
+
+    def warm_up(self) -> None:
+        """In a forked worker: restore torch's thread count and run the deferred warm-up rollouts."""
+        if self.module is None or self._warm_up:
+            return
+        self.module.configure_threads(self._threads or None)
+        self.report["models"] = self.module.preload()
+        self.report["warmed_up"] = self._warm_up = True
+
+    def status(self) -> Dict[str, Any]:
+        if self._thread is None:
+            state = "idle"
+        elif not self._done.is_set():
+            state = "loading"
+        else:
+            state = "ready" if self.module is not None else "failed"
+        result: Dict[str, Any] = {"state": state, **self.report}
+        if state == "loading":
+            result["elapsed_s"] = round(time.perf_counter() - self._started_at, 3)
+        if self.error:
+            result["error"] = self.error
+        return result
+
+
+def request_flag(payload: Dict[str, Any], key: str, default: Optional[bool] = None) -> Optional[bool]:
+    """Boolean request field; strings such as "false", "0", "no" or "off" count as false."""
+    value = payload.get(key)
+    if value is None:
+        return default
+    if isinstance(value, str):
+        return value.strip().lower() not in ("", "0", "false", "no", "off")
+    return bool(value)
+
+
+def create_app(agent: DeepSeekAgent, preloader: Optional[MLPreloader] = None, admission: Optional[AdmissionControl] = None) -> Flask:
     app = Flask(__name__)
+    # Without a preloader from run_server, the ML stack loads on the first forecast.
+    preloader = preloader or MLPreloader()
+    admission = admission or AdmissionControl(DEFAULT_LIMITS)
+    admission.install(app)
     data_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data"))
     tool_manifest = [
         {
@@ -101,6 +593,12 @@ def create_app(agent: DeepSeekAgent) -> Flask:
             "description": "生成未来 12 小时的负荷与光伏预测。",
             "danger": "safe",
             "requiresConfirmation": False,
+            "defaults": {
+                "history_file": "虚拟电厂_24h15min_数据.csv",
+                "window_hours": 24,
+                "horizon_hours": 12,
+                "step_minutes": 1,
+            },
         },
         {
             "name": "runDecision",
@@ -108,6 +606,17 @@ def create_app(agent: DeepSeekAgent) -> Flask:
             "description": "根据历史数据和预测结果生成市场决策文件。",
             "danger": "guarded",
             "requiresConfirmation": False,
+            "defaults": {
+                "history_file": "虚拟电厂_24h15min_数据.csv",
+                "load_forecast": "output/Load_forecast_12h.csv",
+                "pv_forecast": "output/PV_forecast_12h.csv",
+                "output_file": "output/Market_decision_12h.csv",
+                "horizon_hours": 12,
+                "step_minutes": 1,
+                "window_hours": 24,
+                "capacity_kwh": 200,
+                "p_max_kw": 100,
+            },
         },
         {
             "name": "writeAgentFile",
@@ -118,17 +627,31 @@ def create_app(agent: DeepSeekAgent) -> Flask:
             "parameters": ["targetPath", "prompt"],
         },
     ]
+    # Arguments filled in for planned actions; the panel reads the same manifest.
+    action_defaults = {tool["name"]: tool.get("defaults", {}) for tool in tool_manifest}
+    needs_confirmation = {tool["name"] for tool in tool_manifest if tool["requiresConfirmation"]}
 
     @app.after_request
     def add_cors_headers(response):
         response.headers["Access-Control-Allow-Origin"] = "*"
-        response.headers["Access-Control-Allow-Headers"] = "Content-Type, Authorization"
+        response.headers["Access-Control-Allow-Headers"] = "Content-Type, Authorization, X-Priority, X-Revision, X-Sync-Key"
         response.headers["Access-Control-Allow-Methods"] = "POST, OPTIONS, GET"
         return response
 
     @app.route("/health", methods=["GET"])
     def health():
-        return jsonify({"ok": True})
+        ml = preloader.status()
+        return jsonify(
+            {
+                "ok": True,
+                "ready": ml["state"] == "ready",
+                "ml": ml,
+                "admission": admission.status(),
+                "llm_cache": agent.cache.stats() if agent.cache is not None else None,
+                "llm_context": agent.context.stats(),
+                "pid": os.getpid(),
+            }
+        )
 
     @app.route("/assistant/tools", methods=["GET"])
     def assistant_tools():
@@ -151,10 +674,65 @@ def create_app(agent: DeepSeekAgent) -> Flask:
             messages=messages,
             temperature=temperature,
             max_tokens=max_tokens,
+            cache=request_flag(payload, "use_cache"),
         )
         text = raw["choices"][0]["message"]["content"]
         return jsonify({"text": text, "raw": raw})
 
+    def _sse(event: str, data: Dict[str, Any]) -> str:
+        return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    def _stream_completion(messages: List[Dict[str, str]], temperature: float, max_tokens: int, use_cache: Optional[bool] = None, finish=None) -> Response:
+        """
+        Relay a streamed completion as Server-Sent Events: one `token` event per delta, then
+        `done` with the full text (plus whatever `finish(text)` returns), or `error`.
+        """
+
+        def generate():
+            started = time.perf_counter()
+            first_token_ms = None
+            parts: List[str] = []
+            try:
+                for delta in agent.chat_stream(messages=messages, temperature=temperature, max_tokens=max_tokens, cache=use_cache):
+                    if first_token_ms is None:
+                        first_token_ms = round((time.perf_counter() - started) * 1000.0, 1)
+                    parts.append(delta)
+                    yield _sse("token", {"text": delta})
+            except (httpx.HTTPError, ValueError) as exc:
+                yield _sse("error", {"error": str(exc), "text": "".join(parts)})
+                return
+            text = "".join(parts)
+            done: Dict[str, Any] = {
+                "text": text,
+                "first_token_ms": first_token_ms,
+                "elapsed_ms": round((time.perf_counter() - started) * 1000.0, 1),
+            }
+            if finish is not None:
+                done.update(finish(text))
+            yield _sse("done", done)
+
+        # The request context (and with it the admission slot) lives until the stream ends.
+        return Response(
+            stream_with_context(generate()),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    @app.route("/chat/stream", methods=["POST", "OPTIONS"])
+    def chat_stream():
+        if request.method == "OPTIONS":
+            return ("", 204)
+
+        payload = request.get_json(silent=True) or {}
+        messages = payload.get("messages") or []
+        temperature = float(payload.get("temperature", 0.7))
+        max_tokens = int(payload.get("max_tokens", 512))
+
+        if not isinstance(messages, list) or not messages:
+            return jsonify({"error": "messages is required"}), 400
+
+        return _stream_completion(messages, temperature, max_tokens, request_flag(payload, "use_cache"))
+
     def _extract_file_block(text: str) -> Optional[Tuple[str, str, bool]]:
         if not text:
             return None
@@ -328,7 +906,14 @@ def create_app(agent: DeepSeekAgent) -> Flask:
 
         return ("", [], suggestions)
 
-    def _agent_write_to_target(messages: List[Dict[str, str]], target_path: str, prompt: str, temperature: float, max_tokens: int) -> Dict[str, Any]:
+    def _agent_write_to_target(
+        messages: List[Dict[str, str]],
+        target_path: str,
+        prompt: str,
+        temperature: float,
+        max_tokens: int,
+        use_cache: Optional[bool] = None,
+    ) -> Dict[str, Any]:
         system_guard = {
             "role": "system",
             "content": (
@@ -349,6 +934,7 @@ def create_app(agent: DeepSeekAgent) -> Flask:
             messages=[system_guard, *safe_messages],
             temperature=temperature,
             max_tokens=max_tokens,
+            cache=use_cache,
         )
         text = raw["choices"][0]["message"]["content"]
         extracted = _extract_file_block(text)
@@ -377,6 +963,36 @@ def create_app(agent: DeepSeekAgent) -> Flask:
             "error": error,
         }
 
+    agent_system_guard = {
+        "role": "system",
+        "content": (
+            "你现在是本地数据助手，只能生成/修改 data/ 下的 CSV 文件，"
+            "允许子目录，且文件名必须以 _agent.csv 结尾。"
+            "当需要写文件时，请用如下格式输出：\n"
+            "```file:output/xxx_agent.csv\n"
+            "CSV内容\n"
+            "```\n"
+            "允许输出 data/ 前缀或 data/ 内的相对路径。"
+        ),
+    }
+
+    def _save_file_block(text: str) -> Dict[str, Any]:
+        saved = False
+        filename = ""
+        error = ""
+        extracted = _extract_file_block(text)
+        if extracted:
+            filename, content, closed = extracted
+            result = write_agent_csv(filename, content, data_dir)
+            if result.ok:
+                saved = True
+                filename = result.filename
+            else:
+                error = result.message
+            if not closed and not error:
+                error = "file block was not closed; saved anyway"
+        return {"saved": saved, "filename": filename, "error": error}
+
     @app.route("/agent", methods=["POST", "OPTIONS"])
     def agent_chat():
         if request.method == "OPTIONS":
@@ -390,42 +1006,36 @@ def create_app(agent: DeepSeekAgent) -> Flask:
         if not isinstance(messages, list) or not messages:
             return jsonify({"error": "messages is required"}), 400
 
-        system_guard = {
-            "role": "system",
-            "content": (
-                "你现在是本地数据助手，只能生成/修改 data/ 下的 CSV 文件，"
-                "允许子目录，且文件名必须以 _agent.csv 结尾。"
-                "当需要写文件时，请用如下格式输出：\n"
-                "```file:output/xxx_agent.csv\n"
-                "CSV内容\n"
-                "```\n"
-                "允许输出 data/ 前缀或 data/ 内的相对路径。"
-            ),
-        }
-
         raw = agent.chat(
-            messages=[system_guard, *messages],
+            messages=[agent_system_guard, *messages],
             temperature=temperature,
             max_tokens=max_tokens,
+            cache=request_flag(payload, "use_cache"),
         )
         text = raw["choices"][0]["message"]["content"]
+        return jsonify({"text": text, "raw": raw, **_save_file_block(text)})
 
-        saved = False
-        filename = ""
-        error = ""
-        extracted = _extract_file_block(text)
-        if extracted:
-            filename, content, closed = extracted
-            result = write_agent_csv(filename, content, data_dir)
-            if result.ok:
-                saved = True
-                filename = result.filename
-            else:
-                error = result.message
-            if not closed and not error:
-                error = "file block was not closed; saved anyway"
+    @app.route("/agent/stream", methods=["POST", "OPTIONS"])
+    def agent_chat_stream():
+        if request.method == "OPTIONS":
+            return ("", 204)
 
-        return jsonify({"text": text, "raw": raw, "saved": saved, "filename": filename, "error": error})
+        payload = request.get_json(silent=True) or {}
+        messages = payload.get("messages") or []
+        temperature = float(payload.get("temperature", 0.7))
+        max_tokens = int(payload.get("max_tokens", 512))
+
+        if not isinstance(messages, list) or not messages:
+            return jsonify({"error": "messages is required"}), 400
+
+        # The file block is only complete once the last token arrived, so it is saved then.
+        return _stream_completion(
+            [agent_system_guard, *messages],
+            temperature,
+            max_tokens,
+            request_flag(payload, "use_cache"),
+            finish=_save_file_block,
+        )
 
     @app.route("/agent/write-target", methods=["POST", "OPTIONS"])
     def agent_write_target():
@@ -442,7 +1052,7 @@ def create_app(agent: DeepSeekAgent) -> Flask:
         if not target_path:
             return jsonify({"ok": False, "error": "target_path is required"}), 400
 
-        result = _agent_write_to_target(messages, target_path, prompt, temperature, max_tokens)
+        result = _agent_write_to_target(messages, target_path, prompt, temperature, max_tokens, request_flag(payload, "use_cache"))
         status = 200 if result.get("saved") else 400
         return jsonify(result), status
 
@@ -484,7 +1094,7 @@ def create_app(agent: DeepSeekAgent) -> Flask:
             if user_message:
                 context_messages.append({"role": "user", "content": user_message})
 
-            raw = agent.chat(messages=context_messages, temperature=0.6, max_tokens=512)
+            raw = agent.chat(messages=context_messages, temperature=0.6, max_tokens=512, cache=request_flag(payload, "use_cache"))
             reply = raw["choices"][0]["message"]["content"]
 
         approval_required = any(bool(action.get("requiresConfirmation")) for action in actions)
@@ -500,12 +1110,109 @@ def create_app(agent: DeepSeekAgent) -> Flask:
             }
         )
 
+    # Heavy tools take the admission slot of the endpoint the panel would otherwise call.
+    action_routes = {"runForecast": "/predict12h", "runDecision": "/decision12h", "writeAgentFile": "/agent/write-target"}
+
+    def _read_data_file(path: str) -> Dict[str, Any]:
+        """Backend side of the panel's readDataFile: a data/ file as text, capped at 200k chars."""
+        normalized = str(path or "").replace("\\", "/").strip()
+        if not normalized.startswith("data/") or ".." in normalized:
+            return {"ok": False, "error": "路径必须以 data/ 开头，且不能包含 .."}
+        target = os.path.abspath(os.path.join(data_dir, normalized[len("data/"):]))
+        if os.path.commonpath([data_dir, target]) != data_dir:
+            return {"ok": False, "error": "invalid path"}
+        try:
+            with open(target, "r", encoding="utf-8-sig", errors="replace") as f:
+                raw_text = f.read()
+        except OSError as exc:
+            return {"ok": False, "error": f"read failed: {exc}"}
+        limit = 200000
+        truncated = len(raw_text) > limit
+        text = f"{raw_text[:limit]}\n\n[内容已截断，超过 {limit} 字符]" if truncated else raw_text
+        return {
+            "ok": True,
+            "path": normalized,
+            "name": os.path.basename(normalized),
+            "size": len(raw_text),
+            "text": text,
+            "truncated": truncated,
+        }
+
+    @app.route("/assist/execute", methods=["POST", "OPTIONS"])
+    def assist_execute():
+        """
+        Run a plan from /assist on the backend: actions form a DAG by the files they read
+        and write (see function_actions), independent ones run concurrently, and status
+        streams back as Server-Sent Events (`plan`, one `action` per state change, `done`).
+        Actions whose tool requires confirmation run only if they carry `approved: true`,
+        which the panel sets once the user has approved the plan.
+        """
+        if request.method == "OPTIONS":
+            return ("", 204)
+
+        payload = request.get_json(silent=True) or {}
+        actions = payload.get("actions") or []
+        if not isinstance(actions, list) or not actions or not all(isinstance(a, dict) for a in actions):
+            return jsonify({"ok": False, "error": "actions is required"}), 400
+        messages = payload.get("messages") or []
+        dashboard = payload.get("dashboard") or {}
+        max_workers = int(payload.get("max_workers", 4))
+        priority = request.headers.get("X-Priority", "interactive").strip().lower()
+
+        nodes = build_action_dag(actions, action_defaults)
+        unknown = [node.tool for node in nodes if node.tool not in ACTION_TOOLS]
+        if unknown:
+            return jsonify({"ok": False, "error": f"unknown tool: {', '.join(unknown)}"}), 400
+        unapproved = [
+            node.title for node, action in zip(nodes, actions) if node.tool in needs_confirmation and not request_flag(action, "approved", False)
+        ]
+        if unapproved:
+            return jsonify({"ok": False, "error": f"需要用户确认的动作未获批准: {', '.join(unapproved)}"}), 403
+
+        def run(node: ActionNode) -> Dict[str, Any]:
+            route = action_routes.get(node.tool)
+            ticket = admission.acquire(route, priority) if route else None
+            try:
+                if node.tool == "readDataFile":
+                    return _read_data_file(node.args.get("path", ""))
+                if node.tool == "runForecast":
+                    return _predict12h(node.args)[1]
+                if node.tool == "runDecision":
+                    return _decision12h(node.args)[1]
+                if node.tool == "writeAgentFile":
+                    return _agent_write_to_target(
+                        messages if isinstance(messages, list) else [],
+                        str(node.args.get("targetPath", "") or "").strip(),
+                        str(node.args.get("prompt", "") or "").strip(),
+                        float(node.args.get("temperature", 0.4)),
+                        int(node.args.get("max_tokens", 768)),
+                    )
+                return {"ok": True, "snapshot": dashboard, "summary": _dashboard_summary_text(dashboard)}
+            finally:
+                if ticket is not None:
+                    admission.release(ticket)
+
+        def generate():
+            yield _sse("plan", {"actions": [{"index": n.index, "tool": n.tool, "title": n.title, "deps": n.deps} for n in nodes]})
+            for event in run_action_dag(nodes, run, max_workers):
+                yield _sse(event.pop("event"), event)
+
+        return Response(
+            stream_with_context(generate()),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
     @app.route("/decision12h", methods=["POST", "OPTIONS"])
     def decision12h():
         if request.method == "OPTIONS":
             return ("", 204)
 
-        payload = request.get_json(silent=True) or {}
+        status, body = _decision12h(request.get_json(silent=True) or {})
+        return jsonify(body), status
+
+    def _decision12h(payload: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        """/decision12h without the request, (status, body)."""
         history_file = payload.get("history_file", "虚拟电厂_24h15min_数据.csv")
         load_forecast = payload.get("load_forecast", "output/Load_forecast_12h.csv")
         pv_forecast = payload.get("pv_forecast", "output/PV_forecast_12h.csv")
@@ -519,6 +1226,7 @@ def create_app(agent: DeepSeekAgent) -> Flask:
         horizon_hours = float(payload.get("horizon_hours", 12.0))
         step_minutes = int(payload.get("step_minutes", 15))
         window_hours = float(payload.get("window_hours", 24.0))
+        time_budget_ms = payload.get("time_budget_ms")
 
         result = write_market_decision_12h(
             data_dir=data_dir,
@@ -533,6 +1241,48 @@ def create_app(agent: DeepSeekAgent) -> Flask:
             soc_initial_kwh=float(soc_initial_kwh) if soc_initial_kwh is not None else None,
             soc_final_kwh=float(soc_final_kwh) if soc_final_kwh is not None else None,
             p_max_kw=p_max_kw,
+            time_budget_ms=float(time_budget_ms) if time_budget_ms is not None else None,
+            use_cache=request_flag(payload, "use_cache", True),
+        )
+
+        if not result.ok:
+            return 400, {"ok": False, "error": result.message, "warnings": result.warnings}
+
+        return 200, {
+            "ok": True,
+            "files": [result.filename] if result.filename else [],
+            "warnings": result.warnings,
+            "cached": result.cached,
+            "stats": vars(result.stats) if result.stats else {},
+        }
+
+    @app.route("/decision12h/scenarios", methods=["POST", "OPTIONS"])
+    def decision12h_scenarios():
+        if request.method == "OPTIONS":
+            return ("", 204)
+
+        payload = request.get_json(silent=True) or {}
+        scenarios = payload.get("scenarios")
+        if scenarios is not None and not isinstance(scenarios, list):
+            return jsonify({"ok": False, "error": "scenarios must be a list"}), 400
+        soc_initial_kwh = payload.get("soc_initial_kwh")
+        soc_final_kwh = payload.get("soc_final_kwh")
+
+        result = write_market_decision_scenarios(
+            data_dir=data_dir,
+            history_file=payload.get("history_file", "虚拟电厂_24h15min_数据.csv"),
+            load_forecast_file=payload.get("load_forecast", "output/Load_forecast_12h.csv"),
+            pv_forecast_file=payload.get("pv_forecast", "output/PV_forecast_12h.csv"),
+            output_file=payload.get("output_file", "output/Market_decision_12h_scenarios.csv"),
+            scenarios=scenarios,
+            selection=str(payload.get("selection", "expected")),
+            horizon_hours=float(payload.get("horizon_hours", 12.0)),
+            step_minutes=int(payload.get("step_minutes", 15)),
+            window_hours=float(payload.get("window_hours", 24.0)),
+            capacity_kwh=float(payload.get("capacity_kwh", 200.0)),
+            soc_initial_kwh=float(soc_initial_kwh) if soc_initial_kwh is not None else None,
+            soc_final_kwh=float(soc_final_kwh) if soc_final_kwh is not None else None,
+            p_max_kw=float(payload.get("p_max_kw", 100.0)),
         )
 
         if not result.ok:
@@ -543,151 +1293,114 @@ def create_app(agent: DeepSeekAgent) -> Flask:
                 "ok": True,
                 "files": [result.filename] if result.filename else [],
                 "warnings": result.warnings,
+                "selected": result.selected,
+                "scenarios": result.scenarios,
                 "stats": vars(result.stats) if result.stats else {},
             }
         )
 
-    def _safe_float(value: object) -> Optional[float]:
+    @app.route("/decision12h/sweep", methods=["POST", "OPTIONS"])
+    def decision12h_sweep():
+        if request.method == "OPTIONS":
+            return ("", 204)
+
+        payload = request.get_json(silent=True) or {}
         try:
-            if value is None:
-                return None
-            return float(value)
-        except (TypeError, ValueError):
-            return None
+            capacities = parse_grid(payload.get("capacities_kwh"))
+            powers = parse_grid(payload.get("p_max_kw"))
+        except (KeyError, TypeError, ValueError) as exc:
+            return jsonify({"ok": False, "error": f"invalid sweep grid: {exc}"}), 400
+        soc_final_frac = payload.get("soc_final_frac")
+        workers = payload.get("workers")
+
+        result = write_battery_sizing_sweep(
+            data_dir=data_dir,
+            capacities_kwh=capacities,
+            p_max_kw=powers,
+            history_file=payload.get("history_file", "虚拟电厂_24h15min_数据.csv"),
+            load_forecast_file=payload.get("load_forecast", "output/Load_forecast_12h.csv"),
+            pv_forecast_file=payload.get("pv_forecast", "output/PV_forecast_12h.csv"),
+            output_file=payload.get("output_file", "output/Battery_sizing_sweep.csv"),
+            horizon_hours=float(payload.get("horizon_hours", 12.0)),
+            step_minutes=int(payload.get("step_minutes", 15)),
+            window_hours=float(payload.get("window_hours", 24.0)),
+            soc_initial_frac=float(payload.get("soc_initial_frac", 0.5)),
+            soc_final_frac=float(soc_final_frac) if soc_final_frac is not None else None,
+            workers=int(workers) if workers else None,
+        )
 
-    def _extract_hour_value(row: Dict[str, str]) -> Optional[float]:
-        hour = _safe_float(row.get("时间_小时"))
-        if hour is not None:
-            return hour
-        period = _safe_float(row.get("时间_时段"))
-        if period is not None:
-            return period - 1.0
-        return None
-
-    def _parse_row_datetime(row: Dict[str, str]) -> Optional[datetime]:
-        text = str(row.get("Datetime", "") or "").strip()
-        if not text:
-            return None
-        for fmt in ("%Y-%m-%d %H:%M:%S", "%Y/%m/%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y/%m/%d %H:%M"):
-            try:
-                return datetime.strptime(text, fmt)
-            except ValueError:
-                continue
-        return None
-
-    def _infer_history_step_minutes(rows: List[Dict[str, str]]) -> int:
-        diffs: List[float] = []
-        prev: Optional[float] = None
-        for row in rows[-256:]:
-            hour = _extract_hour_value(row)
-            if hour is None:
-                continue
-            if prev is not None:
-                diff_h = hour - prev
-                if diff_h > 0:
-                    diffs.append(diff_h * 60.0)
-            prev = hour
-        if not diffs:
-            return 1
-        diffs.sort()
-        mid = diffs[len(diffs) // 2]
-        return max(1, int(round(mid)))
-
-    def _resample_history_rows(rows: List[Dict[str, str]], target_step_minutes: int) -> List[Dict[str, str]]:
-        if not rows:
-            return rows
-        actual_step = _infer_history_step_minutes(rows)
-        if actual_step >= target_step_minutes:
-            return rows
-        if target_step_minutes % actual_step != 0:
-            return rows
-
-        group_size = int(round(target_step_minutes / actual_step))
-        if group_size <= 1:
-            return rows
-
-        usable = len(rows) - (len(rows) % group_size)
-        if usable <= 0:
-            return rows
-
-        buckets: List[Dict[str, str]] = []
-        for start in range(0, usable, group_size):
-            chunk = rows[start : start + group_size]
-            last = chunk[-1]
-
-            def _avg(key: str) -> str:
-                values = [_safe_float(item.get(key)) for item in chunk]
-                clean = [float(v) for v in values if v is not None]
-                if not clean:
-                    return ""
-                avg = sum(clean) / len(clean)
-                return f"{avg:.6f}".rstrip("0").rstrip(".")
-
-            buckets.append(
-                {
-                    "Datetime": str(last.get("Datetime", "")),
-                    "时间_小时": str(last.get("时间_小时", "")),
-                    "时间_时段": str(last.get("时间_时段", "")),
-                    "光伏出力_kW": _avg("光伏出力_kW"),
-                    "负荷消耗_kW": _avg("负荷消耗_kW"),
-                    "实时电价_元/kWh": _avg("实时电价_元/kWh"),
-                }
+        if not result.ok:
+            return jsonify({"ok": False, "error": result.message, "warnings": result.warnings}), 400
+
+        return jsonify(
+            {
+                "ok": True,
+                "files": [result.filename] if result.filename else [],
+                "warnings": result.warnings,
+                "capacities_kwh": result.capacities_kwh,
+                "p_max_kw": result.p_max_kw,
+                "cost_yuan": result.cost_yuan,
+                "baseline_cost_yuan": result.baseline_cost_yuan,
+                "best": result.best,
+                "stats": result.stats,
+            }
+        )
+
+    @app.route("/backtest12h", methods=["POST", "OPTIONS"])
+    def backtest12h():
+        if request.method == "OPTIONS":
+            return ("", 204)
+
+        payload = request.get_json(silent=True) or {}
+        soc_initial_kwh = payload.get("soc_initial_kwh")
+        soc_final_kwh = payload.get("soc_final_kwh")
+        workers = payload.get("workers")
+        try:
+            result = write_backtest(
+                data_dir=data_dir,
+                history_file=payload.get("history_file", "虚拟电厂_24h15min_数据.csv"),
+                output_file=payload.get("output_file", "output/Backtest_12h.csv"),
+                model=str(payload.get("model", "lstm")),
+                runtime=str(payload.get("runtime", "auto")),
+                lookback=int(payload.get("lookback", 32)),
+                horizon_hours=float(payload.get("horizon_hours", 12.0)),
+                step_minutes=int(payload.get("step_minutes", 15)),
+                window_hours=float(payload.get("window_hours", 24.0)),
+                origin_every_hours=float(payload.get("origin_every_hours", 1.0)),
+                max_origins=int(payload.get("max_origins", 0)),
+                capacity_kwh=float(payload.get("capacity_kwh", 200.0)),
+                p_max_kw=float(payload.get("p_max_kw", 100.0)),
+                soc_initial_kwh=float(soc_initial_kwh) if soc_initial_kwh is not None else None,
+                soc_final_kwh=float(soc_final_kwh) if soc_final_kwh is not None else None,
+                workers=int(workers) if workers else None,
             )
-        return buckets
+        except (TypeError, ValueError) as exc:
+            return jsonify({"ok": False, "error": f"invalid backtest parameters: {exc}"}), 400
 
-    def _read_recent_vpp_rows(history_path: str, limit: int) -> List[Dict[str, str]]:
-        with open(history_path, "r", encoding="utf-8-sig") as f:
-            reader = csv.DictReader(f)
-            rows = [row for row in reader if row]
-        return rows[-limit:] if len(rows) > limit else rows
+        if not result.ok:
+            return jsonify({"ok": False, "error": result.message, "warnings": result.warnings}), 400
 
-    def _build_hourly_maps(rows: List[Dict[str, str]]) -> Tuple[Dict[float, float], Dict[float, float], List[str]]:
-        """Build time-of-day -> value maps from history rows."""
-        warnings: List[str] = []
-        buckets_load: Dict[float, List[float]] = {}
-        buckets_pv: Dict[float, List[float]] = {}
+        return jsonify(
+            {
+                "ok": True,
+                "files": [result.filename] if result.filename else [],
+                "warnings": result.warnings,
+                "summary": result.summary,
+                "stats": result.stats,
+            }
+        )
 
-        for r in rows:
-            hour = _extract_hour_value(r)
-            if hour is None:
-                continue
-            tod = float(hour) % 24.0
-
-            load = _safe_float(r.get("负荷消耗_kW"))
-            pv = _safe_float(r.get("光伏出力_kW"))
-            if load is not None:
-                buckets_load.setdefault(tod, []).append(load)
-            if pv is not None:
-                buckets_pv.setdefault(tod, []).append(pv)
-
-        if not buckets_load:
-            warnings.append("历史窗口中未解析到 负荷消耗_kW")
-        if not buckets_pv:
-            warnings.append("历史窗口中未解析到 光伏出力_kW")
-
-        load_map = {k: sum(v) / len(v) for k, v in buckets_load.items() if v}
-        pv_map = {k: sum(v) / len(v) for k, v in buckets_pv.items() if v}
-        return load_map, pv_map, warnings
-
-    def _needs_baseline_fallback(preds: List[float], history_rows: List[Dict[str, str]], key: str) -> bool:
-        history_values = [_safe_float(row.get(key)) for row in history_rows]
-        history_clean = [abs(float(v)) for v in history_values if v is not None]
+    def _needs_baseline_fallback(preds: List[float], history_values: np.ndarray) -> bool:
+        history_clean = np.abs(history_values[np.isfinite(history_values)])
         pred_clean = [abs(float(v)) for v in preds if v is not None]
-        if not history_clean or not pred_clean:
+        if not history_clean.size or not pred_clean:
             return False
-        history_avg = sum(history_clean) / len(history_clean)
+        history_avg = float(history_clean.mean())
         pred_avg = sum(pred_clean) / len(pred_clean)
         if history_avg <= 1e-6:
             return False
         return pred_avg < history_avg * 0.05
 
-    def _nearest_lookup(map_: Dict[float, float], hour: float) -> float:
-        if not map_:
-            return 0.0
-        keys = list(map_.keys())
-        nearest = min(keys, key=lambda k: abs(k - hour))
-        return float(map_.get(nearest, 0.0))
-
     def _format_hour(value: float) -> str:
         # Render as H:MM (supports 0..48h+), aligned to minute grid.
         total_minutes = int(round(value * 60.0))
@@ -700,166 +1413,441 @@ def create_app(agent: DeepSeekAgent) -> Flask:
             m = 0
         return f"{h}:{m:02d}"
 
+    def _format_value(value: float) -> str:
+        return f"{float(value):.4f}".rstrip("0").rstrip(".")
+
     def _build_forecast_csv(headers: List[str], rows: List[List[object]]) -> str:
         lines = [",".join(headers)]
         for r in rows:
             lines.append(",".join("" if v is None else str(v) for v in r))
         return "\n".join(lines)
 
-    @app.route("/predict12h", methods=["POST", "OPTIONS"])
-    def predict12h():
-        if request.method == "OPTIONS":
-            return ("", 204)
+    def _import_forecaster():
+        return preloader.get()
 
-        payload = request.get_json(silent=True) or {}
+    def _import_lightweight():
+        from predict import lightweight  # type: ignore
+
+        return lightweight
+
+    model_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "predict", "models"))
+    online_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "predict", ".online"))
+
+    def _forecast_cache_key(payload: Dict[str, Any]) -> str:
+        """
+        Cache key of a forecast request, or "" when it must be computed.
+
+        Requests that train or carry state between calls (retrain, stateful, online) are
+        never cached. For the LSTM the key includes the weights and scaler digests, so a
+        retrain, fine-tune checkpoint or swapped model file invalidates old entries.
+        """
+        if not request_flag(payload, "use_cache", True) or request_flag(payload, "retrain") or request_flag(payload, "stateful") or payload.get("online"):
+            return ""
+        history_file = payload.get("history_file", "虚拟电厂_24h15min_数据.csv")
+        try:
+            params = {
+                "history_file": history_file,
+                "horizon_hours": float(payload.get("horizon_hours", 12)),
+                "step_minutes": int(payload.get("step_minutes", 15)),
+                "window_hours": float(payload.get("window_hours", 24)),
+                "model": str(payload.get("model", "lstm")),
+                "quantiles": request_flag(payload, "quantiles", False),
+            }
+            if params["quantiles"]:
+                params["samples"] = int(payload.get("samples", 100))
+            if params["model"] == "lstm":
+                params.update(lookback=int(payload.get("lookback", 32)), runtime=str(payload.get("runtime", "auto")))
+        except (TypeError, ValueError):
+            return ""
+        digests = [file_digest(os.path.join(data_dir, history_file))]
+        online = []
+        if params["model"] == "lstm":
+            for target in ("Load", "PV"):
+                digests.append(file_digest(os.path.join(model_dir, f"lstm_{target}.pt")))
+                digests.append(file_digest(os.path.join(model_dir, f"scaler_{target}.pkl")))
+                # Online fine-tuning checkpoints, served in place of the trained weights when present.
+                online.append(file_digest(os.path.join(online_dir, f"online_{target}.json")))
+        if not all(digests):
+            return ""
+        return content_key("forecast_12h", [*digests, *online, params])
+
+    def _run_forecast(payload: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        """
+        `_compute_forecast` behind FORECAST_CACHE: an unchanged history with the same
+        parameters and model returns the stored result (with `cached` set) immediately.
+        """
+        key = _forecast_cache_key(payload)
+        entry = FORECAST_CACHE.get(key) if key else None
+        if entry is not None:
+            return 200, {**entry, "cached": True}
+        status, result = _compute_forecast(payload)
+        if key and status == 200 and result.get("ok"):
+            FORECAST_CACHE.put(key, result)
+        return status, result
+
+    def _compute_forecast(payload: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        """
+        Forecast Load/PV for the request and render both CSVs without writing them.
+
+        Returns (http_status, result). On success the result carries the JSON body
+        fields plus private keys: `_csv` (rel_path -> text), `_history` (windowed,
+        resampled preprocess.History) and `_series` (dts, absolute hours, load, pv).
+        """
         history_file = payload.get("history_file", "虚拟电厂_24h15min_数据.csv")
         horizon_hours = float(payload.get("horizon_hours", 12))
         step_minutes = int(payload.get("step_minutes", 15))
         window_hours = float(payload.get("window_hours", 24))
 
         if horizon_hours <= 0:
-            return jsonify({"ok": False, "error": "horizon_hours must be > 0"}), 400
+            return 400, {"ok": False, "error": "horizon_hours must be > 0"}
         if step_minutes <= 0 or 60 % step_minutes != 0:
-            return jsonify({"ok": False, "error": "step_minutes must divide 60 (e.g., 15)"}), 400
+            return 400, {"ok": False, "error": "step_minutes must divide 60 (e.g., 15)"}
 
         steps = int(round(horizon_hours * 60 / step_minutes))
         history_path = os.path.join(data_dir, history_file)
         if not os.path.exists(history_path):
-            return jsonify({"ok": False, "error": f"history file not found: {history_file}"}), 400
+            return 400, {"ok": False, "error": f"history file not found: {history_file}"}
 
         try:
-            raw_history_rows = _read_recent_vpp_rows(history_path, 50000)
-            history_step_minutes = _infer_history_step_minutes(raw_history_rows)
-            raw_window_rows = int(round(window_hours * 60 / history_step_minutes))
-            recent_raw = _read_recent_vpp_rows(history_path, raw_window_rows)
-            recent = _resample_history_rows(recent_raw, step_minutes)
+            history = preprocess.read_history(history_path)
         except OSError as exc:
-            return jsonify({"ok": False, "error": f"history read failed: {exc}"}), 500
-
-        if not recent:
-            return jsonify({"ok": False, "error": "history is empty"}), 400
-
-        last_row = recent[-1]
-        last_hour = _extract_hour_value(last_row)
-        if last_hour is None:
-            return jsonify({"ok": False, "error": "cannot parse last timestamp from history"}), 400
-
-        # LSTM inference (trained model). This does NOT call DeepSeek.
-        temp_csv_path = None
-        try:
-            import sys
-            from pathlib import Path
-
-            root_dir = Path(__file__).resolve().parents[1]
-            if str(root_dir) not in sys.path:
-                sys.path.insert(0, str(root_dir))
-            from predict.lstm import forecast_recent_window  # type: ignore
-        except Exception as exc:
-            return jsonify(
-                {
+            return 500, {"ok": False, "error": f"history read failed: {exc}"}
+        history_step_minutes = preprocess.infer_step_minutes(history)
+        recent_raw = history.tail(int(round(window_hours * 60 / history_step_minutes)))
+        # Missing timestamps come back as NaN rows so row positions stay evenly spaced in time.
+        gaps = preprocess.find_gaps(recent_raw, history_step_minutes)
+        recent_raw = preprocess.reindex(recent_raw, history_step_minutes, gaps)
+        recent = preprocess.resample_mean(recent_raw, step_minutes, history_step_minutes)
+
+        if not len(recent):
+            return 400, {"ok": False, "error": "history is empty"}
+
+        last_hour = float(recent.hours[-1])
+        if math.isnan(last_hour):
+            return 400, {"ok": False, "error": "cannot parse last timestamp from history"}
+
+        model = str(payload.get("model", "lstm"))
+        lightweight = _import_lightweight()
+        if model not in ("lstm", "auto") + lightweight.MODELS:
+            return 400, {"ok": False, "error": f"model must be one of: lstm, auto, {', '.join(lightweight.MODELS)}"}
+        quantiles = request_flag(payload, "quantiles", False)
+        samples = int(payload.get("samples", 100)) if quantiles else 0
+        if quantiles and not 1 <= samples <= 1000:
+            return 400, {"ok": False, "error": "samples must be in 1..1000"}
+
+        # Finer-than-15-minute requests forecast 15-minute block means, the resolution the
+        # models are suited for, and upsample them to step_minutes afterwards.
+        factor = 1
+        if step_minutes < COARSE_STEP_MINUTES and COARSE_STEP_MINUTES % step_minutes == 0 and history_step_minutes <= step_minutes:
+            factor = COARSE_STEP_MINUTES // step_minutes
+        model_step = step_minutes * factor
+        model_history = preprocess.resample_mean(recent.slice(len(recent) % factor), model_step) if factor > 1 else recent
+        # The models read rows as evenly spaced points; dropping the NaN rows reindex put in
+        # for missing timestamps would shift everything after a gap, so interpolate them.
+        model_history = preprocess.fill_history(model_history)
+        model_steps = -(-steps // factor)
+
+        band_history = model_history
+        if quantiles and BAND_HISTORY_HOURS > window_hours:
+            band_raw = preprocess.reindex(history.tail(int(round(BAND_HISTORY_HOURS * 60 / history_step_minutes))), history_step_minutes)
+            # Start on the window's block boundaries so both resample to the same last block.
+            group = step_minutes // history_step_minutes if history_step_minutes < step_minutes and step_minutes % history_step_minutes == 0 else 1
+            band_recent = preprocess.resample_mean(band_raw.slice((len(band_raw) - len(recent_raw)) % group), step_minutes, history_step_minutes)
+            band_history = preprocess.resample_mean(band_recent.slice(len(band_recent) % factor), model_step) if factor > 1 else band_recent
+            band_history = preprocess.fill_history(band_history)
+
+        last_stamp = recent.stamps[-1]
+        last_dt = None if np.isnat(last_stamp) else last_stamp.item()
+        season = max(1, int(round(24 * 60 / model_step)))
+        minute_of_day = last_dt.hour * 60 + last_dt.minute if last_dt is not None else int(round(last_hour * 60.0)) % 1440
+        phase = minute_of_day / 1440.0
+        model_reports: Dict[str, Dict[str, Any]] = {}
+        # P10/P50/P90 rows per target and how they were obtained (quantiles mode only).
+        bands: Dict[str, List[List[float]]] = {}
+        band_methods: Dict[str, Optional[str]] = {}
+
+        def _lightweight_preds(target: str, key: str, name: str) -> List[float]:
+            values = model_history.column(key)
+            preds, report = lightweight.forecast(values, model_steps, season, phase, name)
+            model_reports[target] = report
+            if quantiles:
+                band = lightweight.residual_quantiles(
+                    band_history.column(key), preds, season, phase, str(report["model"]), window=len(values)
+                )
+                # On an LSTM fallback the MC-dropout band describes the discarded output, so
+                # it is replaced, not kept.
+                bands.pop(target, None)
+                band_methods[target] = None
+                if band is not None:
+                    bands[target] = [[float(v) for v in row] for row in band]
+                    band_methods[target] = "residual"
+            return [float(v) for v in preds]
+
+        def _band_headers(target: str) -> List[str]:
+            return [f"{target}_Forecast_{label}" for label in BAND_LABELS] if target in bands else []
+
+        def _upsampled(coarse: List[float], key: str) -> List[float]:
+            values = preprocess.fill_gaps(recent.column(key), "hold")
+            period = 60 // step_minutes
+            offset = (minute_of_day % 60 // step_minutes + 1) % period
+            return [float(v) for v in lightweight.upsample(values, coarse, factor, steps, offset, period)]
+
+        lstm_stats: Dict[str, Any] = {}
+        fallback: List[str] = []
+        if model != "lstm":
+            # NumPy models only: torch is never imported on this path.
+            load_pred_list = _lightweight_preds("Load", "负荷消耗_kW", model)
+            pv_pred_list = _lightweight_preds("PV", "光伏出力_kW", model)
+        else:
+            # LSTM inference (trained model). This does NOT call DeepSeek.
+            try:
+                lstm = _import_forecaster()
+            except Exception as exc:
+                return 500, {
                     "ok": False,
                     "error": f"cannot import LSTM predictor: {exc}",
                     "hint": "请在本机安装 torch / scikit-learn / joblib，并确保 predict/lstm.py 可导入",
                 }
-            ), 500
 
-        lookback = int(payload.get("lookback", 32))
-        retrain = bool(payload.get("retrain", False))
-        try:
-            with tempfile.NamedTemporaryFile("w", encoding="utf-8-sig", newline="", suffix=".csv", delete=False) as handle:
-                writer = csv.DictWriter(
-                    handle,
-                    fieldnames=["Datetime", "时间_小时", "时间_时段", "光伏出力_kW", "负荷消耗_kW", "实时电价_元/kWh"],
+            lookback = int(payload.get("lookback", 32))
+            retrain = request_flag(payload, "retrain", False)
+            runtime = str(payload.get("runtime", "auto"))
+            stateful = request_flag(payload, "stateful", False)
+            fast_train = request_flag(payload, "fast_train", False)
+            warm_start = request_flag(payload, "warm_start", False)
+            online = payload.get("online", False)
+            if not isinstance(online, (bool, dict)):
+                return 400, {"ok": False, "error": "online must be a boolean or an options object"}
+            if runtime not in lstm.RUNTIMES:
+                return 400, {"ok": False, "error": f"runtime must be one of: {', '.join(lstm.RUNTIMES)}"}
+            try:
+                import pandas as pd
+
+                preds = lstm.forecast_recent_frame(
+                    df=pd.DataFrame(model_history.as_columns()),
+                    targets=["Load", "PV"],
+                    window_rows=len(model_history),
+                    steps=model_steps,
+                    lookback=lookback,
+                    retrain=retrain,
+                    runtime=runtime,
+                    stateful=stateful,
+                    fast_train=fast_train,
+                    warm_start=warm_start,
+                    online=online or None,
+                    samples=samples,
                 )
-                writer.writeheader()
-                writer.writerows(recent)
-                temp_csv_path = handle.name
-            preds = forecast_recent_window(
-                csv_path=temp_csv_path,
-                targets=["Load", "PV"],
-                window_rows=len(recent),
-                steps=steps,
-                lookback=lookback,
-                retrain=retrain,
-            )
-        except Exception as exc:
-            return jsonify({"ok": False, "error": f"lstm forecast failed: {exc}"}), 500
-        finally:
-            if temp_csv_path and os.path.exists(temp_csv_path):
-                try:
-                    os.remove(temp_csv_path)
-                except OSError:
-                    pass
+            except Exception as exc:
+                return 500, {"ok": False, "error": f"lstm forecast failed: {exc}"}
+            for target in ("Load", "PV"):
+                if quantiles and f"{target}_P10" in preds:
+                    bands[target] = [[float(v) for v in preds[f"{target}_{label}"]] for label in BAND_LABELS]
+                    band_methods[target] = "mc_dropout"
+
+            load_preds = preds.get("Load")
+            pv_preds = preds.get("PV")
+            if load_preds is None or pv_preds is None:
+                return 500, {"ok": False, "error": "missing Load/PV predictions"}
 
-        step_h = step_minutes / 60.0
-        out_load: List[List[object]] = []
-        out_pv: List[List[object]] = []
-        load_preds = preds.get("Load")
-        pv_preds = preds.get("PV")
-        if load_preds is None or pv_preds is None:
-            return jsonify({"ok": False, "error": "missing Load/PV predictions"}), 500
-
-        if step_minutes == 1:
-            recent_load = [_safe_float(row.get("负荷消耗_kW")) or 0.0 for row in recent]
-            recent_pv = [_safe_float(row.get("光伏出力_kW")) or 0.0 for row in recent]
-            if len(recent_load) < steps:
-                reps = int(math.ceil(steps / max(1, len(recent_load))))
-                recent_load = (recent_load * reps)[:steps]
-                recent_pv = (recent_pv * reps)[:steps]
-            load_pred_list = [float(v) for v in recent_load[:steps]]
-            pv_pred_list = [float(v) for v in recent_pv[:steps]]
-        else:
-            load_map, pv_map, _ = _build_hourly_maps(recent)
             load_pred_list = [float(v) for v in load_preds]
             pv_pred_list = [float(v) for v in pv_preds]
-            if _needs_baseline_fallback(load_pred_list, recent, "负荷消耗_kW"):
-                load_pred_list = [_nearest_lookup(load_map, (last_hour + step_h * i) % 24.0) for i in range(1, steps + 1)]
-            if _needs_baseline_fallback(pv_pred_list, recent, "光伏出力_kW"):
-                pv_pred_list = [_nearest_lookup(pv_map, (last_hour + step_h * i) % 24.0) for i in range(1, steps + 1)]
+            # Collapsed LSTM output: use the lightweight model with the best recent backtest.
+            if _needs_baseline_fallback(load_pred_list, model_history.column("负荷消耗_kW")):
+                load_pred_list = _lightweight_preds("Load", "负荷消耗_kW", "auto")
+                fallback.append("Load")
+            if _needs_baseline_fallback(pv_pred_list, model_history.column("光伏出力_kW")):
+                pv_pred_list = _lightweight_preds("PV", "光伏出力_kW", "auto")
+                fallback.append("PV")
+
+            lstm_stats = {
+                "lookback": lookback,
+                "retrain": retrain,
+                "fast_train": fast_train,
+                "warm_start": warm_start,
+                "runtime": runtime,
+                "quantization": {t: lstm.QUANT_REPORTS.get(t) for t in ("Load", "PV")} if runtime == "int8" else {},
+                "stateful": {t: lstm.SESSION_REPORTS.get(t) for t in ("Load", "PV")} if stateful else {},
+                "online": {t: lstm.ONLINE_REPORTS.get(t) for t in ("Load", "PV")} if online else {},
+            }
+
+        if factor > 1:
+            load_pred_list = _upsampled(load_pred_list, "负荷消耗_kW")
+            pv_pred_list = _upsampled(pv_pred_list, "光伏出力_kW")
+            for target, key in (("Load", "负荷消耗_kW"), ("PV", "光伏出力_kW")):
+                if target in bands:
+                    bands[target] = [_upsampled(row, key) for row in bands[target]]
+
+        band_warnings = [
+            f"no quantile band for {target}: not enough history to score forecast errors"
+            for target, method in band_methods.items()
+            if method is None
+        ]
 
-        last_dt = _parse_row_datetime(last_row)
+        step_h = step_minutes / 60.0
+        out_load: List[List[object]] = []
+        out_pv: List[List[object]] = []
+        dts: List[str] = []
+        hours: List[float] = []
+        load_values: List[float] = []
+        pv_values: List[float] = []
         for i in range(1, steps + 1):
             future_hour_abs = last_hour + step_h * i
             future_dt = last_dt + timedelta(minutes=step_minutes * i) if last_dt is not None else None
-            load_kw = float(load_pred_list[i - 1])
-            pv_kw = float(pv_pred_list[i - 1])
-            dt_text = future_dt.strftime("%Y-%m-%d %H:%M:%S") if future_dt is not None else _format_hour(future_hour_abs)
-            out_load.append([dt_text, f"{load_kw:.4f}".rstrip("0").rstrip(".")])
-            out_pv.append([dt_text, f"{pv_kw:.4f}".rstrip("0").rstrip(".")])
+            load_text = _format_value(load_pred_list[i - 1])
+            pv_text = _format_value(pv_pred_list[i - 1])
+            if future_dt is not None:
+                dt_text = future_dt.strftime("%Y-%m-%d %H:%M:%S")
+                hours.append(float(future_dt.hour) + float(future_dt.minute) / 60.0)
+            else:
+                dt_text = _format_hour(future_hour_abs)
+                hours.append(int(round(future_hour_abs * 60.0)) / 60.0)
+            dts.append(dt_text)
+            # Hand over exactly what the CSV holds, so file and in-memory consumers agree.
+            load_values.append(float(load_text))
+            pv_values.append(float(pv_text))
+            out_load.append([dt_text, load_text, *[_format_value(row[i - 1]) for row in bands.get("Load", [])]])
+            out_pv.append([dt_text, pv_text, *[_format_value(row[i - 1]) for row in bands.get("PV", [])]])
+
+        return 200, {
+            "ok": True,
+            "cached": False,
+            "warnings": band_warnings,
+            "stats": {
+                "history_file": history_file,
+                "window_rows": len(recent),
+                "history_step_minutes": history_step_minutes,
+                "history_gaps": {"count": len(gaps), "missing_rows": int(gaps[:, 1].sum())},
+                "horizon_hours": horizon_hours,
+                "step_minutes": step_minutes,
+                "steps": steps,
+                "model_step_minutes": model_step,
+                "model_steps": model_steps,
+                "last_hour": last_hour,
+                "model": model,
+                **lstm_stats,
+                "models": model_reports,
+                "fallback": fallback,
+                "quantiles": {"samples": samples, "methods": band_methods} if quantiles else {},
+            },
+            "_csv": {
+                "output/Load_forecast_12h.csv": _build_forecast_csv(["Datetime", "Load_Forecast", *_band_headers("Load")], out_load),
+                "output/PV_forecast_12h.csv": _build_forecast_csv(["Datetime", "PV_Forecast", *_band_headers("PV")], out_pv),
+            },
+            "_history": recent,
+            "_series": {"dts": dts, "hours": hours, "load": load_values, "pv": pv_values},
+        }
 
-        load_csv_text = _build_forecast_csv(["Datetime", "Load_Forecast"], out_load)
-        pv_csv_text = _build_forecast_csv(["Datetime", "PV_Forecast"], out_pv)
+    def _output_matches(rel_path: str, content: str) -> bool:
+        try:
+            with open(os.path.join(data_dir, rel_path), "r", encoding="utf-8-sig") as f:
+                return f.read() == content
+        except OSError:
+            return False
 
+    def _write_outputs(files: List[Tuple[str, str]], skip_unchanged: bool = False) -> Tuple[List[str], List[str]]:
         saved_files: List[str] = []
         write_errors: List[str] = []
-
-        for rel_path, content in [
-            ("output/Load_forecast_12h.csv", load_csv_text),
-            ("output/PV_forecast_12h.csv", pv_csv_text),
-        ]:
+        for rel_path, content in files:
+            if skip_unchanged and _output_matches(rel_path, content):
+                saved_files.append(rel_path)
+                continue
             wr = write_data_csv(rel_path, content, data_dir)
             if wr.ok:
                 saved_files.append(wr.filename)
             else:
                 write_errors.append(f"{rel_path}: {wr.message}")
+        return saved_files, write_errors
+
+    @app.route("/predict12h", methods=["POST", "OPTIONS"])
+    def predict12h():
+        if request.method == "OPTIONS":
+            return ("", 204)
+
+        status, body = _predict12h(request.get_json(silent=True) or {})
+        return jsonify(body), status
+
+    def _predict12h(payload: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        """/predict12h without the request: forecast and write both CSVs, (status, body)."""
+        status, forecast = _run_forecast(payload)
+        if not forecast.get("ok"):
+            return status, forecast
 
+        # A cached forecast only rewrites files that no longer hold its content.
+        saved_files, write_errors = _write_outputs(list(forecast["_csv"].items()), skip_unchanged=forecast["cached"])
         ok = bool(saved_files) and not write_errors
+        return 200, {
+            "ok": ok,
+            "files": saved_files,
+            "warnings": [*forecast["warnings"], *write_errors],
+            "cached": forecast["cached"],
+            "stats": forecast["stats"],
+        }
+
+    @app.route("/predict12h/online", methods=["GET"])
+    def predict12h_online():
+        """Status and drift/loss metrics of the background fine-tuners started by `online` forecasts."""
+        try:
+            lstm = _import_forecaster()
+        except Exception as exc:
+            return jsonify({"ok": False, "error": f"cannot import LSTM predictor: {exc}"}), 500
+        return jsonify({"ok": True, "trainers": lstm.online_status(), "defaults": lstm.ONLINE_DEFAULTS})
+
+    @app.route("/pipeline12h", methods=["POST", "OPTIONS"])
+    def pipeline12h():
+        """Forecast + decision in one pass: history is read once, forecasts stay in memory."""
+        if request.method == "OPTIONS":
+            return ("", 204)
+
+        payload = request.get_json(silent=True) or {}
+        status, forecast = _run_forecast(payload)
+        if not forecast.get("ok"):
+            return jsonify({"ok": False, "error": forecast.get("error", ""), "predict": forecast}), status
+
+        series = forecast["_series"]
+        soc_initial_kwh = payload.get("soc_initial_kwh")
+        soc_final_kwh = payload.get("soc_final_kwh")
+        time_budget_ms = payload.get("time_budget_ms")
+        output_file = payload.get("output_file", "output/Market_decision_12h.csv")
+        decision = build_market_decision_from_forecast(
+            history=forecast["_history"],
+            dts=series["dts"],
+            hours=series["hours"],
+            load_kw=series["load"],
+            pv_kw=series["pv"],
+            output_file=output_file,
+            horizon_hours=float(payload.get("horizon_hours", 12)),
+            step_minutes=int(payload.get("step_minutes", 15)),
+            window_hours=float(payload.get("window_hours", 24)),
+            capacity_kwh=float(payload.get("capacity_kwh", 200.0)),
+            soc_initial_kwh=float(soc_initial_kwh) if soc_initial_kwh is not None else None,
+            soc_final_kwh=float(soc_final_kwh) if soc_final_kwh is not None else None,
+            p_max_kw=float(payload.get("p_max_kw", 100.0)),
+            time_budget_ms=float(time_budget_ms) if time_budget_ms is not None else None,
+        )
+        if not decision.ok:
+            return jsonify({"ok": False, "error": decision.message, "warnings": decision.warnings}), 400
+
+        # Publish forecasts and decision together, only after both succeeded.
+        forecast_files = list(forecast["_csv"].items())
+        saved_files, write_errors = _write_outputs([*forecast_files, (decision.filename, decision.csv_text)], skip_unchanged=forecast["cached"])
+        ok = len(saved_files) == len(forecast_files) + 1 and not write_errors
         return jsonify(
             {
                 "ok": ok,
                 "files": saved_files,
-                "warnings": write_errors,
-                "stats": {
-                    "history_file": history_file,
-                    "window_rows": len(recent),
-                    "history_step_minutes": history_step_minutes,
-                    "horizon_hours": horizon_hours,
-                    "step_minutes": step_minutes,
-                    "steps": steps,
-                    "last_hour": last_hour,
-                    "model": "lstm",
-                    "lookback": lookback,
-                    "retrain": retrain,
+                "warnings": [*forecast["warnings"], *write_errors, *decision.warnings],
+                "predict": {
+                    "ok": ok,
+                    "files": saved_files[: len(forecast_files)],
+                    "warnings": forecast["warnings"],
+                    "cached": forecast["cached"],
+                    "stats": forecast["stats"],
+                },
+                "decision": {
+                    "ok": ok,
+                    "files": saved_files[len(forecast_files) :],
+                    "warnings": decision.warnings,
+                    "stats": vars(decision.stats) if decision.stats else {},
                 },
             }
         )
@@ -867,10 +1855,73 @@ def create_app(agent: DeepSeekAgent) -> Flask:
     return app
 
 
-def run_server(host: str, port: int) -> None:
+def run_server(
+    host: str,
+    port: int,
+    torch_threads: int = 0,
+    preload: bool = True,
+    production: bool = False,
+    threads: int = 8,
+    processes: int = 1,
+    shutdown_timeout: float = 30.0,
+    limits: Optional[Dict[str, int]] = None,
+    limit_wait_s: float = 30.0,
+    heavy_slots: int = 2,
+    background_slots: int = 1,
+    queue_sizes: Optional[Dict[str, int]] = None,
+) -> None:
+    if torch_threads > 0:
+        # Read by predict/lstm.py on import, before the first forecast spins up torch's pools.
+        os.environ["LSTM_NUM_THREADS"] = str(torch_threads)
+        os.environ["LSTM_NUM_INTEROP_THREADS"] = "1"
     agent = DeepSeekAgent()
-    app = create_app(agent)
-    app.run(host=host, port=port)
+    preloader = MLPreloader()
+    admission = AdmissionControl(
+        DEFAULT_LIMITS if limits is None else limits,
+        heavy_slots=heavy_slots,
+        background_slots=background_slots,
+        queue_sizes=queue_sizes,
+        wait_s=limit_wait_s,
+    )
+    app = create_app(agent, preloader, admission)
+    if not production:
+        if preload:
+            # Serve right away; torch and both forecasters load in the background (see /health).
+            preloader.start()
+        try:
+            app.run(host=host, port=port)
+        finally:
+            agent.close()
+        return
+
+    def _preload_before_fork() -> None:
+        # Load only: torch ops here would start thread pools the forked workers inherit
+        # broken (see function_serving.serve); each worker warms up in preloader.warm_up.
+        try:
+            preloader.get(warm_up=False)
+        except Exception as exc:
+            print(f"ML preload failed, forecasts will report it: {exc}", file=sys.stderr)
+
+    def _shutdown() -> None:
+        # Checkpoint online fine-tuning and close the pooled LLM connections before the worker
+        # exits (the pool is created on first use, so forked workers never share one).
+        if preloader.module is not None:
+            preloader.module.stop_online_training(checkpoint=True)
+        agent.close()
+
+    if preload and processes <= 1:
+        preloader.start()
+    serve(
+        app,
+        host,
+        port,
+        threads=threads,
+        processes=processes,
+        shutdown_timeout=shutdown_timeout,
+        before_fork=_preload_before_fork if preload else None,
+        after_fork=preloader.warm_up if preload else None,
+        on_shutdown=_shutdown,
+    )
 
 
 def run_demo() -> None:
@@ -879,7 +1930,10 @@ def run_demo() -> None:
         {"role": "system", "content": "你是一个简洁的助手。"},
         {"role": "user", "content": "用一句话介绍深度学习。"},
     ]
-    data = agent.chat(messages)
+    try:
+        data = agent.chat(messages)
+    finally:
+        agent.close()
     print(data["choices"][0]["message"]["content"])
 
 
@@ -888,9 +1942,35 @@ if __name__ == "__main__":
     parser.add_argument("--server", action="store_true", help="run as HTTP server")
     parser.add_argument("--host", default="127.0.0.1")
     parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--torch-threads", type=int, default=0, help="torch intra-op threads for forecasting (0 keeps torch's default)")
+    parser.add_argument("--no-preload", action="store_true", help="load the ML stack on the first forecast instead of at startup")
+    parser.add_argument("--production", action="store_true", help="serve with a thread pool (and optional worker processes) instead of Flask's dev server")
+    parser.add_argument("--threads", type=int, default=8, help="request threads per process (--production)")
+    parser.add_argument("--processes", type=int, default=1, help="worker processes forked after preloading (--production, POSIX only)")
+    parser.add_argument("--shutdown-timeout", type=float, default=30.0, help="seconds in-flight requests may finish after SIGINT/SIGTERM (--production)")
+    parser.add_argument("--limit", action="append", default=[], metavar="PATH=N", help="concurrent requests per endpoint, e.g. /predict12h=2 (0 = unlimited)")
+    parser.add_argument("--limit-wait", type=float, default=30.0, help="seconds a request waits for a slot before 503")
+    parser.add_argument("--heavy-slots", type=int, default=2, help="forecast/decision/backtest requests running at once per process")
+    parser.add_argument("--background-slots", type=int, default=1, help="heavy slots X-Priority: background requests may hold (the rest stay free for interactive work)")
+    parser.add_argument("--interactive-queue", type=int, default=16, help="interactive requests that may wait for a slot before 503")
+    parser.add_argument("--background-queue", type=int, default=4, help="background requests that may wait; a full queue sheds its oldest entry")
     args = parser.parse_args()
 
     if args.server:
-        run_server(args.host, args.port)
+        run_server(
+            args.host,
+            args.port,
+            args.torch_threads,
+            preload=not args.no_preload,
+            production=args.production,
+            threads=args.threads,
+            processes=args.processes,
+            shutdown_timeout=args.shutdown_timeout,
+            limits=parse_limits(args.limit),
+            limit_wait_s=args.limit_wait,
+            heavy_slots=args.heavy_slots,
+            background_slots=args.background_slots,
+            queue_sizes={"interactive": args.interactive_queue, "background": args.background_queue},
+        )
     else:
         run_demo()
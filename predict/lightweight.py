@@ -0,0 +1,273 @@
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+# Cheap closed-form forecasters over one evenly spaced series. Every model takes the history
+# `y`, the horizon `steps`, the number of points per day `season` and the time-of-day
+# `phase` (fraction of a day, 0..1) of the last observed point.
+
+MODELS = ("seasonal_naive", "ew_profile", "ridge")
+
+
+def infer_season(stamps: np.ndarray) -> int:
+    """Points per day from the median spacing of datetime64 stamps (96 for 15-min data)."""
+    stamps = np.asarray(stamps, dtype="datetime64[ns]")
+    if stamps.size < 2:
+        return 1
+    step_s = float(np.median(np.diff(stamps[-64:])).astype("timedelta64[s]").astype(np.int64))
+    return max(1, int(round(86400.0 / step_s))) if step_s > 0 else 1
+
+
+def phase_of(stamp: np.datetime64) -> float:
+    day = np.datetime64(stamp, "D")
+    return float((np.datetime64(stamp, "s") - day).astype(np.int64)) / 86400.0
+
+
+def _clip(y: np.ndarray, preds: np.ndarray) -> np.ndarray:
+    # Non-negative series (PV, load) stay non-negative.
+    return np.maximum(preds, 0.0) if y.size and y.min() >= 0 else preds
+
+
+def seasonal_naive(y: np.ndarray, steps: int, season: int, phase: float = 0.0) -> np.ndarray:
+    """Repeat the last full day (or whatever history there is)."""
+    y = np.asarray(y, dtype=np.float64)
+    period = min(season, y.size)
+    if period == 0:
+        return np.zeros(steps)
+    last = y[-period:]
+    return last[np.arange(steps) % period]
+
+
+def ew_profile(y: np.ndarray, steps: int, season: int, phase: float = 0.0, alpha: float = 0.3) -> np.ndarray:
+    """
+    Exponentially weighted daily profile: each time-of-day slot is the weighted mean of that
+    slot over past days, weight alpha * (1 - alpha) ** age_in_days (missing days skipped).
+    """
+    y = np.asarray(y, dtype=np.float64)
+    if y.size < season:
+        return seasonal_naive(y, steps, season, phase)
+    days = -(-y.size // season)
+    padded = np.full(days * season, np.nan)
+    padded[days * season - y.size :] = y
+    grid = padded.reshape(days, season)
+    weights = alpha * (1.0 - alpha) ** np.arange(days - 1, -1, -1, dtype=np.float64)
+    mask = ~np.isnan(grid)
+    profile = (np.where(mask, grid, 0.0) * weights[:, None]).sum(axis=0) / np.maximum((mask * weights[:, None]).sum(axis=0), 1e-12)
+    # Column c of the grid holds the points whose position is congruent to the last point + 1 + c.
+    return profile[np.arange(steps) % season]
+
+
+def _ridge_features(lag1: np.ndarray, lag2: np.ndarray, tod: np.ndarray, harmonics: int) -> np.ndarray:
+    angle = 2.0 * np.pi * tod[:, None] * np.arange(1, harmonics + 1)
+    return np.column_stack([np.ones_like(lag1), lag1, lag2, np.sin(angle), np.cos(angle)])
+
+
+def ridge(y: np.ndarray, steps: int, season: int, phase: float = 0.0, lam: float = 0.01, harmonics: int = 3) -> np.ndarray:
+    """
+    Ridge regression on the same slot one and two days back plus time-of-day harmonics,
+    solved in closed form. Horizons beyond a day reuse earlier predictions as lags.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    n_features = 3 + 2 * harmonics
+    if y.size < 2 * season + n_features:
+        return ew_profile(y, steps, season, phase)
+
+    n = y.size
+    # Time of day of point i, counting back from the last point at `phase`.
+    tod_hist = (phase - (n - 1 - np.arange(n)) / season) % 1.0
+    t = np.arange(2 * season, n)
+    x = _ridge_features(y[t - season], y[t - 2 * season], tod_hist[t], harmonics)
+    scale = np.maximum(np.abs(x).max(axis=0), 1e-12)
+    xs = x / scale
+    reg = lam * np.eye(n_features)
+    reg[0, 0] = 0.0  # leave the intercept unpenalized
+    w = np.linalg.solve(xs.T @ xs + reg, xs.T @ y[t]) / scale
+
+    ext = np.concatenate([y, np.empty(steps)])
+    for start in range(n, n + steps, season):
+        idx = np.arange(start, min(start + season, n + steps))
+        tod = (phase + (idx - (n - 1)) / season) % 1.0
+        ext[idx] = _ridge_features(ext[idx - season], ext[idx - 2 * season], tod, harmonics) @ w
+    return ext[n:]
+
+
+_FORECASTERS = {"seasonal_naive": seasonal_naive, "ew_profile": ew_profile, "ridge": ridge}
+
+
+def backtest(
+    y: np.ndarray,
+    season: int,
+    phase: float,
+    horizon: int,
+    models: Iterable[str] = MODELS,
+    origins: int = 3,
+) -> Dict[str, float]:
+    """
+    Mean absolute error of each model over the last `origins` non-overlapping `horizon`
+    blocks, each forecast from the history before it. Models that cannot be scored get inf.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    ends = [y.size - k * horizon for k in range(origins, 0, -1)]
+    ends = [e for e in ends if e >= max(season, 1)]
+    scores: Dict[str, float] = {}
+    for name in models:
+        if not ends:
+            scores[name] = float("inf")
+            continue
+        errors = []
+        for end in ends:
+            origin_phase = (phase - (y.size - end) / season) % 1.0
+            pred = _FORECASTERS[name](y[:end], horizon, season, origin_phase)
+            errors.append(np.abs(pred - y[end : end + horizon]).mean())
+        scores[name] = float(np.mean(errors))
+    return scores
+
+
+def forecast(
+    y: np.ndarray,
+    steps: int,
+    season: int,
+    phase: float,
+    model: str = "auto",
+    origins: int = 3,
+) -> Tuple[np.ndarray, Dict[str, object]]:
+    """
+    Forecast `steps` ahead with `model`, or with the model of lowest recent backtest MAE when
+    `model` is "auto". Returns (float32 predictions, report with the chosen model and scores).
+    """
+    y = np.asarray(y, dtype=np.float64)
+    y = y[np.isfinite(y)]
+    if model != "auto" and model not in _FORECASTERS:
+        raise ValueError(f"unknown model: {model} (expected auto or one of {', '.join(MODELS)})")
+    scores: Optional[Dict[str, float]] = None
+    if model == "auto":
+        scores = backtest(y, season, phase, max(1, min(steps, season)), origins=origins)
+        model = min(MODELS, key=lambda name: scores[name])
+    preds = _clip(y, _FORECASTERS[model](y, steps, season, phase))
+    report: Dict[str, object] = {"model": model, "season": season}
+    if scores is not None:
+        report["backtest_mae"] = {k: (round(v, 6) if np.isfinite(v) else None) for k, v in scores.items()}
+    return preds.astype(np.float32), report
+
+
+def residual_quantiles(
+    y: np.ndarray,
+    preds: np.ndarray,
+    season: int,
+    phase: float,
+    model: str,
+    quantiles: Iterable[float] = (0.1, 0.5, 0.9),
+    origins: int = 8,
+    window: Optional[int] = None,
+) -> Optional[np.ndarray]:
+    """
+    Quantile band around `preds` from `model`'s own recent errors.
+
+    The model is re-run from up to `origins` earlier points a quarter day apart, each with at
+    least a day of history. Errors are pooled over origins and lead times relative to the
+    forecast level (|forecast| + 10% of the mean level), so the band widens at peaks and
+    narrows where the series sits near zero (PV at night). `window` caps the history each
+    re-run sees at what the scored forecast was given, so `y` may reach further back only
+    to provide origins. Returns (len(quantiles), steps) float32, or None when the history
+    is too short to score.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    y = y[np.isfinite(y)]
+    preds = np.asarray(preds, dtype=np.float64)
+    floor = 0.1 * float(np.abs(y).mean()) if y.size else 0.0
+    spacing = max(1, season // 4)
+    scaled = []
+    for k in range(1, origins + 1):
+        end = y.size - k * spacing
+        if end < season:
+            break
+        horizon = min(preds.size, y.size - end)
+        origin_phase = (phase - (y.size - end) / season) % 1.0
+        start = max(0, end - window) if window else 0
+        pred = _clip(y, _FORECASTERS[model](y[start:end], horizon, season, origin_phase))
+        scaled.append((y[end : end + horizon] - pred) / (np.abs(pred) + floor + 1e-12))
+    if not scaled:
+        return None
+    offsets = np.quantile(np.concatenate(scaled), list(quantiles))
+    scale = np.abs(preds) + floor
+    return np.stack([_clip(y, preds + offset * scale) for offset in offsets]).astype(np.float32)
+
+
+def pchip(x: np.ndarray, y: np.ndarray, xq: np.ndarray) -> np.ndarray:
+    """
+    Monotone piecewise cubic Hermite interpolation (Fritsch-Carlson, as scipy's PchipInterpolator):
+    no overshoot between knots, so bumps and plateaus keep their shape. Queries outside the
+    knots hold the end values.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    xq = np.clip(np.asarray(xq, dtype=np.float64), x[0], x[-1])
+    if x.size < 2:
+        return np.full(xq.shape, y[0] if y.size else 0.0)
+    h = np.diff(x)
+    delta = np.diff(y) / h
+    d = np.zeros_like(y)
+    if x.size == 2:
+        d[:] = delta[0]
+    else:
+        # Weighted harmonic mean of neighbouring slopes; zero at local extrema.
+        w1 = 2.0 * h[1:] + h[:-1]
+        w2 = h[1:] + 2.0 * h[:-1]
+        same = delta[:-1] * delta[1:] > 0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            inner = (w1 + w2) / (w1 / delta[:-1] + w2 / delta[1:])
+        d[1:-1] = np.where(same, inner, 0.0)
+        for end, (h0, h1, d0, d1) in ((0, (h[0], h[1], delta[0], delta[1])), (-1, (h[-1], h[-2], delta[-1], delta[-2]))):
+            slope = ((2.0 * h0 + h1) * d0 - h0 * d1) / (h0 + h1)
+            if np.sign(slope) != np.sign(d0):
+                slope = 0.0
+            elif np.sign(d0) != np.sign(d1) and abs(slope) > 3.0 * abs(d0):
+                slope = 3.0 * d0
+            d[end] = slope
+    i = np.clip(np.searchsorted(x, xq, side="right") - 1, 0, x.size - 2)
+    t = (xq - x[i]) / h[i]
+    t2, t3 = t * t, t * t * t
+    return (
+        (2 * t3 - 3 * t2 + 1) * y[i]
+        + (t3 - 2 * t2 + t) * h[i] * d[i]
+        + (-2 * t3 + 3 * t2) * y[i + 1]
+        + (t3 - t2) * h[i] * d[i + 1]
+    )
+
+
+def upsample(fine_history: np.ndarray, coarse_forecast: np.ndarray, factor: int, steps: int, offset: int = 0, period: int = 0) -> np.ndarray:
+    """
+    Fine-resolution forecast from a forecast of `factor`-point block means.
+
+    A PCHIP curve runs through the block means of `fine_history` and `coarse_forecast`, each
+    placed at its block's centre, so the forecast joins the observed level without a jump.
+    On top goes the zero-mean intra-`period` profile of the history around that curve (e.g.
+    minute-of-hour shape for 1-minute data, `period` = 60), shrunk by its estimated noise;
+    `offset` is the position in the period of the first forecast point. `fine_history` should end on a block boundary.
+    """
+    factor = max(1, int(factor))
+    y = np.asarray(fine_history, dtype=np.float64)
+    y = y[y.size % factor :]
+    coarse = np.asarray(coarse_forecast, dtype=np.float64)
+    n = y.size
+    if n == 0:
+        return np.repeat(coarse, factor)[:steps].astype(np.float32)
+
+    blocks = y.reshape(-1, factor).mean(axis=1)
+    centre = (factor - 1) / 2.0
+    knots = np.concatenate([np.arange(blocks.size) * factor + centre - n, np.arange(coarse.size) * factor + centre])
+    curve = pchip(knots, np.concatenate([blocks, coarse]), np.arange(-n, steps))
+
+    preds = curve[n:]
+    if period > 1 and n >= period:
+        positions = (int(offset) - n + np.arange(n)) % period
+        residual = y - curve[:n]
+        counts = np.bincount(positions, minlength=period)
+        profile = np.bincount(positions, residual, minlength=period) / np.maximum(counts, 1)
+        profile -= profile.mean()
+        # Shrink towards zero by the share of the profile's spread that is sampling noise, so a
+        # series without a real intra-period shape (PV) gets a smooth curve instead of noise.
+        noise = residual.var() / max(float(counts.mean()), 1.0)
+        weight = max(0.0, 1.0 - noise / profile.var()) if profile.var() > 0 else 0.0
+        preds = preds + weight * profile[(int(offset) + np.arange(steps)) % period]
+    return _clip(y, preds).astype(np.float32)
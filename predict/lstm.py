@@ -1,10 +1,26 @@
 import argparse
+import atexit
+import copy
+import hashlib
 import json
+import os
+import tempfile
+import threading
+import time
+import warnings
+from collections import OrderedDict
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Optional
 
 import numpy as np
 import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+try:
+    from predict import lightweight, preprocess
+except ImportError:  # run as a script from predict/
+    import lightweight
+    import preprocess
 
 # Optional ML stack. If unavailable, we will fall back to a simple baseline forecast.
 HAS_ML = True
@@ -13,20 +29,24 @@ try:
     import torch
     from sklearn.preprocessing import MinMaxScaler
     from torch import nn
-    from torch.utils.data import DataLoader, TensorDataset
+    from torch.utils.data import BatchSampler, DataLoader, Dataset, RandomSampler
 except Exception:
     HAS_ML = False
     joblib = None  # type: ignore[assignment]
     torch = None  # type: ignore[assignment]
     MinMaxScaler = None  # type: ignore[assignment]
     nn = None  # type: ignore[assignment]
+    BatchSampler = None  # type: ignore[assignment]
     DataLoader = None  # type: ignore[assignment]
-    TensorDataset = None  # type: ignore[assignment]
+    Dataset = None  # type: ignore[assignment]
+    RandomSampler = None  # type: ignore[assignment]
 
 
 ROOT_DIR = Path(__file__).resolve().parents[1]
 DEFAULT_CSV = ROOT_DIR / "data" / "虚拟电厂_24h15min_数据.csv"
 MODEL_DIR = Path(__file__).resolve().parent / "models"
+# Online fine-tuning checkpoints (runtime state, not committed); see OnlineTrainer.
+ONLINE_DIR = Path(__file__).resolve().parent / ".online"
 OUTPUT_DIR = ROOT_DIR / "data" / "output"
 
 
@@ -59,6 +79,27 @@ if HAS_ML:
             last_step = output[:, -1, :]
             return self.head(last_step)
 
+    class SlidingWindowDataset(Dataset):
+        """
+        Training pairs (series[i:i+lookback], series[i+lookback]) over a strided view of the series.
+
+        Nothing is materialized up front: indexing with a batch of positions (as yielded by a
+        BatchSampler) gathers only that batch, so memory stays O(series) instead of O(series * lookback).
+        """
+
+        def __init__(self, series: np.ndarray, lookback: int):
+            self.series = torch.from_numpy(np.ascontiguousarray(series, dtype=np.float32))
+            self.lookback = int(lookback)
+            # unfold is a view: row i aliases series[i : i + lookback].
+            self.windows = self.series.unfold(0, self.lookback, 1) if self.series.numel() >= self.lookback else self.series.new_empty((0, self.lookback))
+
+        def __len__(self):
+            return max(0, self.series.numel() - self.lookback)
+
+        def __getitem__(self, index):
+            idx = torch.as_tensor(index)
+            return self.windows[idx].unsqueeze(-1), self.series[idx + self.lookback].unsqueeze(-1)
+
 
 def set_seed(seed: int = 42):
     np.random.seed(seed)
@@ -66,13 +107,34 @@ def set_seed(seed: int = 42):
         torch.manual_seed(seed)
 
 
+def configure_threads(intra_op: Optional[int] = None, inter_op: Optional[int] = None) -> Dict[str, int]:
+    """
+    Cap torch CPU threads so several serving workers do not oversubscribe the cores.
+    Inter-op threads can only be set before the first parallel op; later attempts are ignored.
+    """
+    if not HAS_ML:
+        return {}
+    if intra_op:
+        torch.set_num_threads(max(1, int(intra_op)))
+    if inter_op:
+        try:
+            torch.set_num_interop_threads(max(1, int(inter_op)))
+        except RuntimeError:
+            pass
+    return {"intra_op": torch.get_num_threads(), "inter_op": torch.get_num_interop_threads()}
+
+
+if HAS_ML and (os.getenv("LSTM_NUM_THREADS") or os.getenv("LSTM_NUM_INTEROP_THREADS")):
+    configure_threads(int(os.getenv("LSTM_NUM_THREADS") or 0), int(os.getenv("LSTM_NUM_INTEROP_THREADS") or 0))
+
+
 def make_sequences(series: np.ndarray, lookback: int):
-    xs, ys = [], []
-    for i in range(len(series) - lookback):
-        xs.append(series[i : i + lookback])
-        ys.append(series[i + lookback])
-    x = np.array(xs, dtype=np.float32)
-    y = np.array(ys, dtype=np.float32)
+    """(N, lookback) windows and their next values as read-only views of `series` (no copy)."""
+    series = np.asarray(series, dtype=np.float32)
+    if series.size <= lookback:
+        return np.empty((0, lookback), dtype=np.float32), np.empty(0, dtype=np.float32)
+    x = sliding_window_view(series, lookback)[:-1]
+    y = series[lookback:]
     return x, y
 
 
@@ -83,15 +145,15 @@ def train_model(
     batch_size: int,
     lr: float,
     device,
+    init_state: Optional[dict] = None,
 ):
-    x, y = make_sequences(series, lookback)
-    x_tensor = torch.from_numpy(x).unsqueeze(-1)
-    y_tensor = torch.from_numpy(y).unsqueeze(-1)
-
-    dataset = TensorDataset(x_tensor, y_tensor)
-    loader = DataLoader(dataset, batch_size=batch_size, shuffle=True)
+    dataset = SlidingWindowDataset(series, lookback)
+    # Same shuffled batches as DataLoader(shuffle=True), fetched one batch per index list.
+    loader = DataLoader(dataset, batch_size=None, sampler=BatchSampler(RandomSampler(dataset), batch_size, drop_last=False))
 
     model = LSTMForecaster().to(device)
+    if init_state is not None:
+        model.load_state_dict(init_state)
     optimizer = torch.optim.Adam(model.parameters(), lr=lr)
     loss_fn = nn.MSELoss()
 
@@ -109,6 +171,89 @@ def train_model(
     return model
 
 
+def _window_loss(model, windows, targets, start: int, stop: int, chunk: int = 4096) -> float:
+    """Mean squared one-step error over windows[start:stop], evaluated in chunks."""
+    model.eval()
+    total = 0.0
+    with torch.no_grad():
+        for b in range(start, stop, chunk):
+            e = min(stop, b + chunk)
+            preds = model(windows[b:e].unsqueeze(-1)).reshape(-1)
+            total += float(((preds - targets[b:e]) ** 2).sum())
+    return total / max(1, stop - start)
+
+
+def train_model_fast(
+    series: np.ndarray,
+    lookback: int,
+    epochs: int,
+    batch_size: int,
+    lr: float,
+    device,
+    *,
+    val_frac: float = 0.1,
+    patience: int = 3,
+    init_state: Optional[dict] = None,
+):
+    """
+    Train with in-memory index-permutation batching and early stopping.
+
+    The series lives on `device` once; batches are gathered from its strided window view
+    by a random permutation each epoch. The last `val_frac` of windows (the most recent
+    targets) are held out; training stops after `patience` epochs without a better
+    validation loss and the best weights are restored. With `init_state` (warm start) the
+    starting weights are scored first, so training never returns anything worse.
+
+    Returns (model, info) with epochs_run, val_loss and val_windows.
+    """
+    data = torch.from_numpy(np.ascontiguousarray(series, dtype=np.float32)).to(device)
+    n = max(0, data.numel() - lookback)
+    windows = data.unfold(0, lookback, 1)[:n]
+    targets = data[lookback:]
+    n_val = int(round(n * val_frac)) if n >= 20 else 0
+    n_train = n - n_val
+
+    model = LSTMForecaster().to(device)
+    if init_state is not None:
+        model.load_state_dict(init_state)
+    optimizer = torch.optim.Adam(model.parameters(), lr=lr)
+    loss_fn = nn.MSELoss()
+
+    best_loss = _window_loss(model, windows, targets, n_train, n) if (n_val and init_state is not None) else float("inf")
+    best_state = {k: v.detach().clone() for k, v in model.state_dict().items()} if init_state is not None else None
+    stale = 0
+    epochs_run = 0
+    for _ in range(epochs):
+        model.train()
+        perm = torch.randperm(n_train, device=device)
+        for b in range(0, n_train, batch_size):
+            idx = perm[b : b + batch_size]
+            optimizer.zero_grad()
+            loss = loss_fn(model(windows[idx].unsqueeze(-1)), targets[idx].unsqueeze(-1))
+            loss.backward()
+            optimizer.step()
+        epochs_run += 1
+        if not n_val:
+            continue
+        val_loss = _window_loss(model, windows, targets, n_train, n)
+        if val_loss < best_loss:
+            best_loss = val_loss
+            best_state = {k: v.detach().clone() for k, v in model.state_dict().items()}
+            stale = 0
+        else:
+            stale += 1
+            if stale >= patience:
+                break
+
+    if n_val and best_state is not None:
+        model.load_state_dict(best_state)
+    return model, {
+        "epochs_run": epochs_run,
+        "val_loss": best_loss if n_val else None,
+        "val_windows": n_val,
+    }
+
+
 def iterative_forecast(model, last_window: np.ndarray, steps: int, device):
     model.eval()
     window = last_window.copy()
@@ -122,6 +267,433 @@ def iterative_forecast(model, last_window: np.ndarray, steps: int, device):
     return np.array(preds, dtype=np.float32)
 
 
+def batched_iterative_forecast(model, windows: np.ndarray, steps: int, device, chunk: int = 1024, mc_dropout: bool = False) -> np.ndarray:
+    """
+    `iterative_forecast` for a (batch, lookback) stack of windows: each model call advances
+    every window in the chunk by one step. Returns (batch, steps) float32.
+
+    With `mc_dropout` the eager module runs with dropout active, so every row (and step)
+    draws its own dropout mask: identical windows become Monte-Carlo samples.
+    """
+    if mc_dropout:
+        model.train()
+    else:
+        model.eval()
+    windows = np.ascontiguousarray(windows, dtype=np.float32)
+    preds = np.empty((windows.shape[0], steps), dtype=np.float32)
+    with torch.no_grad():
+        for start in range(0, windows.shape[0], chunk):
+            window = torch.from_numpy(windows[start : start + chunk]).unsqueeze(-1).to(device)
+            for i in range(steps):
+                pred = model(window).reshape(-1, 1, 1).to(window.dtype)
+                preds[start : start + window.shape[0], i] = pred.cpu().numpy().reshape(-1)
+                window = torch.cat([window[:, 1:], pred], dim=1)
+    if mc_dropout:
+        model.eval()
+    return preds
+
+
+# Quantiles reported by probabilistic forecasts (columns <target>_Forecast_P10/P50/P90).
+QUANTILES = (0.1, 0.5, 0.9)
+
+_MC_LOCK = threading.Lock()
+
+
+def _eager_model(target_name: str, device):
+    """The float eager module for the current weights (exported graphs are frozen in eval mode)."""
+    path = _artifact_paths(target_name)["state_dict"]
+    key = (str(path), _file_sha256(path), str(device), "eager")
+    model = _RUNTIME_CACHE.get(key)
+    if model is None:
+        model = LSTMForecaster().to(device)
+        model.load_state_dict(torch.load(path, map_location=device))
+        model.eval()
+        _cache_current(_RUNTIME_CACHE, key, model)
+    return model
+
+
+def _mc_model(target_name: str, device):
+    """
+    Private copy of the eager module for MC dropout. Sampling switches the module to train
+    mode, so it must not be the cached eager module that other requests forecast with.
+    """
+    path = _artifact_paths(target_name)["state_dict"]
+    key = (str(path), _file_sha256(path), str(device), "mc")
+    model = _RUNTIME_CACHE.get(key)
+    if model is None:
+        model = copy.deepcopy(_eager_model(target_name, device))
+        _cache_current(_RUNTIME_CACHE, key, model)
+    return model
+
+
+def _served_scaler(target_name: str):
+    """The fitted scaler for the current weights, loaded once per file content and shared read-only."""
+    path = _artifact_paths(target_name)["scaler"]
+    key = (str(path), _file_sha256(path), "scaler")
+    scaler = _RUNTIME_CACHE.get(key)
+    if scaler is None:
+        scaler = joblib.load(path)
+        _cache_current(_RUNTIME_CACHE, key, scaler)
+    return scaler
+
+
+def mc_dropout_quantiles(
+    target_name: str,
+    series: np.ndarray,
+    steps: int,
+    *,
+    lookback: int = 32,
+    samples: int = 100,
+    quantiles=QUANTILES,
+    device="cpu",
+) -> np.ndarray:
+    """
+    Monte-Carlo dropout forecast quantiles from the last `lookback` points of the raw `series`.
+
+    The window is repeated `samples` times and rolled out as one batch with dropout active,
+    so S samples cost one batched rollout rather than S sequential ones.
+    Returns (len(quantiles), steps) float32 in raw units.
+    """
+    scaler = _served_scaler(target_name)
+    model = _mc_model(target_name, device)
+    window = scaler.transform(np.asarray(series[-lookback:], dtype=np.float64).reshape(-1, 1)).reshape(-1)
+    with _MC_LOCK:  # one sampler at a time on the MC copy (it toggles train/eval mode)
+        draws = batched_iterative_forecast(model, np.repeat(window[None, :], max(1, int(samples)), axis=0), steps, device, mc_dropout=True)
+    draws = scaler.inverse_transform(draws.reshape(-1, 1)).reshape(draws.shape)
+    return np.quantile(draws, quantiles, axis=0).astype(np.float32)
+
+
+RUNTIMES = ("auto", "eager", "torchscript", "onnx", "int8")
+
+# Loaded inference graphs (and served scalers) keyed by (artifact path, content digest, device[, variant]).
+_RUNTIME_CACHE: Dict[tuple, object] = {}
+
+# int8 accuracy-check verdicts keyed by (target, weights digest); the verdict depends only on the
+# weights, so it is checked once per digest. QUANT_REPORTS holds the latest per target.
+_QUANT_VERDICTS: Dict[tuple, Dict[str, object]] = {}
+QUANT_REPORTS: Dict[str, Dict[str, object]] = {}
+
+
+def _cache_current(cache: Dict[tuple, object], key: tuple, value: object) -> None:
+    """
+    Store `value` under `key` = (owner, digest, ...) and drop the owner's entries for other
+    digests. Weights only move forward (retrain, online checkpoints), so a superseded
+    digest is never looked up again and would otherwise pin its module for good.
+    """
+    for stale in [k for k in list(cache) if k[0] == key[0] and k[1] != key[1]]:
+        cache.pop(stale, None)
+    cache[key] = value
+
+
+def _serving_dir(target_name: str) -> Path:
+    """
+    ONLINE_DIR when it holds a fine-tuned checkpoint of the current trained weights,
+    else MODEL_DIR. A retrain (or a checkout of other weights) makes the checkpoint stale.
+    """
+    meta_path = ONLINE_DIR / f"online_{target_name}.json"
+    trained = MODEL_DIR / f"lstm_{target_name}.pt"
+    if not (meta_path.exists() and (ONLINE_DIR / f"lstm_{target_name}.pt").exists() and trained.exists()):
+        return MODEL_DIR
+    try:
+        base = json.loads(meta_path.read_text(encoding="utf-8")).get("base")
+    except (OSError, ValueError):
+        return MODEL_DIR
+    return ONLINE_DIR if base == _file_sha256(trained) else MODEL_DIR
+
+
+def _artifact_paths(target_name: str) -> Dict[str, Path]:
+    """Served weights, exported graphs and scaler of `target_name` (see _serving_dir)."""
+    model_dir = _serving_dir(target_name)
+    return {
+        "state_dict": model_dir / f"lstm_{target_name}.pt",
+        "torchscript": model_dir / f"lstm_{target_name}.ts",
+        "onnx": model_dir / f"lstm_{target_name}.onnx",
+        "manifest": model_dir / f"export_{target_name}.json",
+        "scaler": model_dir / f"scaler_{target_name}.pkl",
+    }
+
+
+def _file_sha256(path: Path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def _write_atomically(path: Path, write) -> None:
+    """Call `write(temp_path)` on a fresh file next to `path`, then swap it into place."""
+    fd, temp_name = tempfile.mkstemp(dir=str(path.parent), prefix=path.name + ".", suffix=".tmp")
+    os.close(fd)
+    try:
+        write(temp_name)
+        os.replace(temp_name, path)
+    except BaseException:
+        try:
+            os.remove(temp_name)
+        except OSError:
+            pass
+        raise
+
+
+def _fresh_digest(target_name: str, kind: str) -> str:
+    """
+    Digest of the current weights if the `kind` artifact was exported from them, else "".
+    The export manifest records which `.pt` bytes each artifact came from, so a retrain
+    (or a checkout that touches mtimes) never serves a stale graph.
+    """
+    paths = _artifact_paths(target_name)
+    if not (paths[kind].exists() and paths["state_dict"].exists() and paths["manifest"].exists()):
+        return ""
+    try:
+        manifest = json.loads(paths["manifest"].read_text(encoding="utf-8"))
+    except ValueError:
+        return ""
+    digest = _file_sha256(paths["state_dict"])
+    return digest if manifest.get(kind) == digest else ""
+
+
+def export_model(target_name: str, *, lookback: int = 32, onnx: bool = False) -> Dict[str, str]:
+    """
+    Export `lstm_<target>.pt` as a frozen TorchScript graph (`lstm_<target>.ts`) and,
+    optionally, ONNX (`lstm_<target>.onnx`) next to it.
+
+    The graph is traced on a (1, lookback, 1) window with batch and sequence length left
+    dynamic, so it accepts any window the eager model does. `export_<target>.json` records
+    the weights digest per artifact. Returns format -> written path.
+    """
+    if not HAS_ML:
+        raise RuntimeError("ML stack not available. Install torch, scikit-learn, joblib.")
+    paths = _artifact_paths(target_name)
+    if not paths["state_dict"].exists():
+        raise FileNotFoundError(f"model not found: {paths['state_dict']}")
+
+    model = LSTMForecaster()
+    model.load_state_dict(torch.load(paths["state_dict"], map_location="cpu"))
+    model.eval()
+    example = torch.zeros(1, max(1, int(lookback)), 1)
+
+    digest = _file_sha256(paths["state_dict"])
+    manifest: Dict[str, str] = {}
+    if paths["manifest"].exists():
+        try:
+            manifest = json.loads(paths["manifest"].read_text(encoding="utf-8"))
+        except ValueError:
+            manifest = {}
+
+    written: Dict[str, str] = {}
+    with torch.no_grad(), warnings.catch_warnings():
+        # torch.jit is deprecated upstream but still the lightest self-contained serving format.
+        warnings.simplefilter("ignore", FutureWarning)
+        graph = torch.jit.freeze(torch.jit.trace(model, example))
+        _write_atomically(paths["torchscript"], graph.save)
+    written["torchscript"] = str(paths["torchscript"])
+    manifest["torchscript"] = digest
+
+    if onnx:
+        try:
+            _write_atomically(
+                paths["onnx"],
+                lambda temp_path: torch.onnx.export(
+                    model,
+                    example,
+                    temp_path,
+                    input_names=["window"],
+                    output_names=["next"],
+                    dynamic_axes={"window": {0: "batch", 1: "seq"}, "next": {0: "batch"}},
+                    dynamo=False,
+                ),
+            )
+        except Exception as exc:
+            raise RuntimeError(f"ONNX export failed (is the onnx package installed?): {exc}") from exc
+        written["onnx"] = str(paths["onnx"])
+        manifest["onnx"] = digest
+    # Artifacts first, manifest last: a reader never sees a digest for a graph still being written.
+    text = json.dumps(manifest, ensure_ascii=True, indent=2)
+    _write_atomically(paths["manifest"], lambda temp_path: Path(temp_path).write_text(text, encoding="utf-8"))
+    return written
+
+
+class _OnnxForecaster:
+    """onnxruntime session behind the eager model's call convention (tensor in, tensor out)."""
+
+    def __init__(self, path: Path):
+        import onnxruntime
+
+        self.session = onnxruntime.InferenceSession(str(path), providers=["CPUExecutionProvider"])
+
+    def eval(self):
+        return self
+
+    def __call__(self, x):
+        out = self.session.run(None, {"window": x.detach().cpu().numpy().astype(np.float32)})[0]
+        return torch.from_numpy(out)
+
+
+def quantize_dynamic_int8(model):
+    """Copy of `model` with the LSTM and Linear head weights dynamically quantized to int8 (CPU only)."""
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        return torch.ao.quantization.quantize_dynamic(model, {nn.LSTM, nn.Linear}, dtype=torch.qint8)
+
+
+def _load_int8(target_name: str, device):
+    if torch.device(device).type != "cpu":
+        raise ValueError("int8 runtime is CPU only")
+    path = _artifact_paths(target_name)["state_dict"]
+    key = (str(path), _file_sha256(path), "cpu", "int8")
+    model = _RUNTIME_CACHE.get(key)
+    if model is None:
+        model = LSTMForecaster()
+        model.load_state_dict(torch.load(path, map_location="cpu"))
+        model = quantize_dynamic_int8(model.eval())
+        _cache_current(_RUNTIME_CACHE, key, model)
+    return model
+
+
+def check_quantized_accuracy(
+    target_name: str,
+    series: np.ndarray,
+    *,
+    lookback: int = 32,
+    steps: int = 48,
+    origins: int = 4,
+    tolerance: float = 0.02,
+) -> Dict[str, object]:
+    """
+    Compare int8 and float rollouts from `origins` recent points of the raw `series`.
+
+    Errors are in scaled units (fractions of the training range). The int8 model passes
+    when its worst deviation from the float rollout is within `tolerance`; the timings
+    are reported (`faster`) but do not affect the verdict, since they vary from run to run.
+    """
+    if not HAS_ML:
+        raise RuntimeError("ML stack not available. Install torch, scikit-learn, joblib.")
+    paths = _artifact_paths(target_name)
+    scaler = joblib.load(paths["scaler"])
+    scaled = scaler.transform(np.asarray(series, dtype=np.float64).reshape(-1, 1)).reshape(-1).astype(np.float32)
+    if scaled.size < lookback:
+        raise ValueError(f"not enough history for accuracy check: size={scaled.size} lookback={lookback}")
+
+    float_model = LSTMForecaster()
+    float_model.load_state_dict(torch.load(paths["state_dict"], map_location="cpu"))
+    float_model.eval()
+    int8_model = _load_int8(target_name, "cpu")
+
+    ends = np.unique(np.linspace(lookback, scaled.size, max(1, int(origins))).astype(int))
+    diffs = []
+    elapsed = {"float": 0.0, "int8": 0.0}
+    for end in ends:
+        window = scaled[end - lookback : end]
+        t0 = time.perf_counter()
+        ref = iterative_forecast(float_model, window, steps, "cpu")
+        t1 = time.perf_counter()
+        got = iterative_forecast(int8_model, window, steps, "cpu")
+        elapsed["float"] += t1 - t0
+        elapsed["int8"] += time.perf_counter() - t1
+        diffs.append(np.abs(got - ref))
+    diff = np.concatenate(diffs)
+    max_abs = float(diff.max())
+    return {
+        "ok": bool(max_abs <= tolerance),
+        "max_abs_err": round(max_abs, 6),
+        "mean_abs_err": round(float(diff.mean()), 6),
+        "tolerance": tolerance,
+        "origins": int(ends.size),
+        "steps": steps,
+        "float_ms": round(elapsed["float"] * 1000.0, 2),
+        "int8_ms": round(elapsed["int8"] * 1000.0, 2),
+        "faster": bool(elapsed["int8"] <= elapsed["float"]),
+        "threads": torch.get_num_threads(),
+    }
+
+
+def _gated_int8(target_name: str, series: np.ndarray, lookback: int, device):
+    """int8 model if it passed the accuracy check for the current weights, else None (serve float)."""
+    digest = _file_sha256(_artifact_paths(target_name)["state_dict"])
+    report = _QUANT_VERDICTS.get((target_name, digest))
+    if report is None:
+        report = check_quantized_accuracy(target_name, series, lookback=lookback)
+        _cache_current(_QUANT_VERDICTS, (target_name, digest), report)
+    QUANT_REPORTS[target_name] = report
+    return _load_int8(target_name, device) if report["ok"] else None
+
+
+def load_runtime(target_name: str, device, runtime: str = "auto"):
+    """
+    Load the exported inference graph for `target_name`, or None to use the eager module.
+
+    - auto: the TorchScript graph when it was exported from the current weights, otherwise None
+    - eager: always None
+    - torchscript: the TorchScript graph, re-exporting it first when missing or stale
+    - onnx: the ONNX graph via onnxruntime (must already be exported and fresh)
+    - int8: the dynamically quantized module, unchecked (load_or_train gates it on accuracy)
+    """
+    if runtime not in RUNTIMES:
+        raise ValueError(f"unknown runtime: {runtime} (expected one of {', '.join(RUNTIMES)})")
+    if runtime == "eager":
+        return None
+    if runtime == "int8":
+        return _load_int8(target_name, device)
+
+    kind = "onnx" if runtime == "onnx" else "torchscript"
+    digest = _fresh_digest(target_name, kind)
+    if not digest:
+        if runtime == "auto":
+            return None
+        if runtime == "onnx":
+            raise FileNotFoundError(f"ONNX model for {target_name} missing or stale (run: python predict/lstm.py --export --onnx)")
+        export_model(target_name)
+        digest = _fresh_digest(target_name, kind)
+
+    artifact = _artifact_paths(target_name)[kind]
+    key = (str(artifact), digest, str(device))
+    model = _RUNTIME_CACHE.get(key)
+    if model is None:
+        if kind == "onnx":
+            model = _OnnxForecaster(artifact)
+        else:
+            model = torch.jit.load(str(artifact), map_location=device)
+            model.eval()
+        _cache_current(_RUNTIME_CACHE, key, model)
+    return model
+
+
+def preload(
+    targets=("Load", "PV"), runtime: str = "auto", lookback: int = 32, device=None, warm_up: bool = True
+) -> Dict[str, Dict[str, object]]:
+    """
+    Load the serving graph of each trained target into the runtime cache and run a short
+    warm-up rollout, so the first real forecast pays neither loading nor graph optimization.
+    `warm_up=False` only loads: a process about to fork must not run torch ops (see
+    function_serving.serve). Calling again later runs just the rollouts, the loads being
+    cached. Untrained targets are reported and skipped. Returns target -> {ok, runtime,
+    load_s | error}.
+    """
+    if not HAS_ML:
+        raise RuntimeError("ML stack not available. Install torch, scikit-learn, joblib.")
+    device = device or torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    report: Dict[str, Dict[str, object]] = {}
+    for target in targets:
+        started = time.perf_counter()
+        paths = _artifact_paths(target)
+        if not (paths["state_dict"].exists() and paths["scaler"].exists()):
+            report[target] = {"ok": False, "error": "model not trained yet"}
+            continue
+        try:
+            model = load_runtime(target, device, runtime) if runtime != "int8" else None
+            served = ("onnx" if runtime == "onnx" else "torchscript") if model is not None else "eager"
+            model = model or _eager_model(target, device)
+            _served_scaler(target)
+            if warm_up:
+                iterative_forecast(model, np.zeros(lookback, dtype=np.float32), 2, device)
+        except Exception as exc:
+            report[target] = {"ok": False, "error": str(exc)}
+            continue
+        report[target] = {"ok": True, "runtime": served, "load_s": round(time.perf_counter() - started, 3)}
+    return report
+
+
+# How far (in scaled units) new history may fall outside the served scaler's range for a warm start.
+WARM_START_RANGE_SLACK = 0.25
+
+
 def load_or_train(
     target_name: str,
     series: np.ndarray,
@@ -131,23 +703,51 @@ def load_or_train(
     lr: float,
     device,
     retrain: bool,
+    runtime: str = "auto",
+    fast_train: bool = False,
+    warm_start: bool = False,
 ):
     MODEL_DIR.mkdir(parents=True, exist_ok=True)
     model_path = MODEL_DIR / f"lstm_{target_name}.pt"
     scaler_path = MODEL_DIR / f"scaler_{target_name}.pkl"
     config_path = MODEL_DIR / f"config_{target_name}.json"
+    served = _artifact_paths(target_name)
 
-    if model_path.exists() and scaler_path.exists() and not retrain:
-        model = LSTMForecaster().to(device)
-        model.load_state_dict(torch.load(model_path, map_location=device))
-        scaler = joblib.load(scaler_path)
+    if served["state_dict"].exists() and served["scaler"].exists() and not retrain:
+        if runtime == "int8":
+            model = _gated_int8(target_name, series, lookback, device)
+        else:
+            model = load_runtime(target_name, device, runtime)
+        if model is None:
+            model = LSTMForecaster().to(device)
+            model.load_state_dict(torch.load(served["state_dict"], map_location=device))
+        scaler = _served_scaler(target_name)
         return model, scaler
 
-    scaler = MinMaxScaler()
-    scaled = scaler.fit_transform(series.reshape(-1, 1)).reshape(-1)
-    model = train_model(scaled, lookback, epochs, batch_size, lr, device)
+    # A warm start continues from the served weights, which only make sense under the served
+    # scaler; if the new history falls well outside that scaler's range, start cold instead.
+    warm = False
+    if warm_start and served["state_dict"].exists() and served["scaler"].exists():
+        scaler = joblib.load(served["scaler"])
+        scaled = scaler.transform(series.reshape(-1, 1)).reshape(-1)
+        warm = bool(scaled.min() >= -WARM_START_RANGE_SLACK and scaled.max() <= 1.0 + WARM_START_RANGE_SLACK)
+    if not warm:
+        scaler = MinMaxScaler()
+        scaled = scaler.fit_transform(series.reshape(-1, 1)).reshape(-1)
+    init_state = torch.load(served["state_dict"], map_location=device) if warm else None
+
+    started = time.perf_counter()
+    if fast_train:
+        model, info = train_model_fast(scaled, lookback, epochs, batch_size, lr, device, init_state=init_state)
+    else:
+        model = train_model(scaled, lookback, epochs, batch_size, lr, device, init_state=init_state)
+        info = {"epochs_run": epochs, "val_loss": None, "val_windows": 0}
+    train_seconds = time.perf_counter() - started
+
     torch.save(model.state_dict(), model_path)
     joblib.dump(scaler, scaler_path)
+    # Keep the serving artifact in step with the weights just written.
+    export_model(target_name, lookback=lookback)
     config_path.write_text(
         json.dumps(
             {
@@ -155,6 +755,14 @@ def load_or_train(
                 "epochs": epochs,
                 "batch_size": batch_size,
                 "lr": lr,
+                "mode": "fast" if fast_train else "standard",
+                "warm_start": warm,
+                "warm_start_requested": bool(warm_start),
+                "epochs_run": info["epochs_run"],
+                "val_loss": info["val_loss"],
+                "val_windows": info["val_windows"],
+                "train_seconds": round(train_seconds, 3),
+                "train_points": int(series.size),
             },
             ensure_ascii=True,
             indent=2,
@@ -164,6 +772,332 @@ def load_or_train(
     return model, scaler
 
 
+class StreamingSession:
+    """
+    Stateful inference for one target: carries the LSTM (h, c) across requests.
+
+    `sync` advances the state only over points not seen before. The last `checkpoints`
+    points keep their post-step state, so a revised tail (e.g. a partially filled resample
+    bucket) rewinds to the last unchanged point instead of replaying everything. `forecast`
+    forks the state and rolls the horizon out one LSTM step per point.
+
+    A (re)started session warms up from a zero state over only the last `warmup` points
+    (the training `lookback`): the model only ever saw windows that long, and replaying
+    the whole history would cost a pass over every point on each reset. After that the
+    state carries forward across requests, whereas `iterative_forecast` restarts from a
+    zero state on every `lookback` window.
+    """
+
+    def __init__(self, model, scaler, device, warmup: int = 32, checkpoints: int = 16):
+        self.model = model.eval()
+        self.scaler = scaler
+        self.device = device
+        self.warmup = max(1, int(warmup))
+        self.max_checkpoints = max(1, int(checkpoints))
+        self.lock = threading.Lock()
+        # (stamp, raw value, top-layer output, (h, c)) after each of the most recent points.
+        self._checkpoints: List[tuple] = []
+        self.points_seen = 0
+
+    def _advance(self, stamps: np.ndarray, values: np.ndarray) -> None:
+        if values.size == 0:
+            return
+        scaled = self.scaler.transform(values.reshape(-1, 1)).astype(np.float32)
+        x = torch.from_numpy(scaled).view(1, -1, 1).to(self.device)
+        state = self._checkpoints[-1][3] if self._checkpoints else None
+        # Bulk of the chunk in one call; only the tail is stepped to record checkpoints.
+        split = max(0, values.size - self.max_checkpoints)
+        with torch.no_grad():
+            if split:
+                _, state = self.model.lstm(x[:, :split], state)
+            for i in range(split, values.size):
+                out, state = self.model.lstm(x[:, i : i + 1], state)
+                self._checkpoints.append((stamps[i], float(values[i]), out[:, -1, :], state))
+        del self._checkpoints[: -self.max_checkpoints]
+        self.points_seen += int(values.size)
+
+    def sync(self, stamps: np.ndarray, values: np.ndarray) -> Dict[str, object]:
+        """Bring the state up to the end of (stamps, values); returns what was replayed."""
+        # Stamps are sorted; find each checkpoint's position and stop at the first mismatch.
+        keep, positions = -1, []
+        for k, (stamp, value, _, _) in enumerate(self._checkpoints):
+            i = int(np.searchsorted(stamps, stamp))
+            if i >= len(stamps) or stamps[i] != stamp or float(values[i]) != value:
+                break
+            keep = k
+            positions.append(i)
+        reset = keep < 0
+        if reset:
+            self._checkpoints = []
+            self.points_seen = 0
+            start = max(0, len(values) - self.warmup)
+        else:
+            rewound = len(self._checkpoints) - 1 - keep
+            del self._checkpoints[keep + 1 :]
+            self.points_seen -= rewound
+            start = positions[keep] + 1
+        self._advance(stamps[start:], values[start:])
+        return {"reset": reset, "advanced": int(len(values) - start), "points_seen": self.points_seen}
+
+    def forecast(self, steps: int) -> np.ndarray:
+        _, _, out, state = self._checkpoints[-1]
+        preds = np.empty(steps, dtype=np.float32)
+        with torch.no_grad():
+            for i in range(steps):
+                pred = self.model.head(out)
+                preds[i] = float(pred.reshape(-1)[0])
+                out, state = self.model.lstm(pred.view(1, 1, 1), state)
+                out = out[:, -1, :]
+        return self.scaler.inverse_transform(preds.reshape(-1, 1)).reshape(-1).astype(np.float32)
+
+
+# Live sessions keyed by (target, weights digest, sample spacing, lookback); oldest dropped beyond the cap.
+_SESSIONS: "OrderedDict[tuple, StreamingSession]" = OrderedDict()
+_SESSIONS_LOCK = threading.Lock()
+_MAX_SESSIONS = 8
+SESSION_REPORTS: Dict[str, Dict[str, object]] = {}
+
+
+def _get_session(target_name: str, spacing: str, device, lookback: int = 32) -> Optional[StreamingSession]:
+    paths = _artifact_paths(target_name)
+    scaler_path = paths["scaler"]
+    if not (paths["state_dict"].exists() and scaler_path.exists()):
+        return None
+    key = (target_name, _file_sha256(paths["state_dict"]), spacing, str(device), int(lookback))
+    with _SESSIONS_LOCK:
+        session = _SESSIONS.get(key)
+        if session is None:
+            model = LSTMForecaster().to(device)
+            model.load_state_dict(torch.load(paths["state_dict"], map_location=device))
+            session = StreamingSession(model, joblib.load(scaler_path), device, warmup=lookback)
+            _cache_current(_SESSIONS, key, session)
+            while len(_SESSIONS) > _MAX_SESSIONS:
+                _SESSIONS.popitem(last=False)
+        _SESSIONS.move_to_end(key)
+    return session
+
+
+ONLINE_DEFAULTS: Dict[str, float] = {
+    "update_every": 15,  # new points between fine-tuning rounds
+    "steps": 20,  # optimizer steps per round
+    "batch_size": 64,
+    "lr": 1e-4,
+    "buffer_points": 1440,  # replay buffer length (most recent points)
+    "checkpoint_every": 4,  # rounds between checkpoints to ONLINE_DIR
+}
+
+
+class OnlineTrainer:
+    """
+    Background fine-tuning of one target's served weights on a replay buffer of recent history.
+
+    `observe` runs on the request path and only appends points newer than the last one seen.
+    Once `update_every` new points have arrived the worker thread runs `steps` Adam steps on
+    random windows from the buffer, scoring the newly arrived windows before and after
+    (prequential loss, the drift signal). Every `checkpoint_every` rounds the weights, the
+    scaler and `online_<target>.json` (metrics plus the digest of the trained weights they
+    derive from) are written atomically to ONLINE_DIR and TorchScript is re-exported there;
+    serving switches to them through `_serving_dir` and the usual digest checks, while the
+    trained artifacts in MODEL_DIR are never modified. A retrain that rewrites the trained
+    weights makes the checkpoint stale; the trainer reloads and continues from the new ones.
+
+    The served scaler must cover the buffered history for the weights to mean anything. If
+    the history falls well outside it (e.g. a scaler fitted in MW against kW data), the
+    trainer fits a fresh scaler on the buffer and fine-tunes under it instead of idling.
+    """
+
+    def __init__(self, target_name: str, lookback: int, device, **options):
+        self.target_name = target_name
+        self.lookback = int(lookback)
+        self.device = device
+        self.options = {**ONLINE_DEFAULTS, **{k: v for k, v in options.items() if k in ONLINE_DEFAULTS}}
+        self.lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+        self._stamps = np.empty(0, dtype="datetime64[ns]")
+        self._values = np.empty(0, dtype=np.float32)
+        self._pending = 0
+        self._spacing = ""
+        self._base = ""
+        self._dirty = False
+        self.metrics: Dict[str, object] = {"rounds": 0, "checkpoints": 0, "points_observed": 0}
+        self._load()
+        self._thread = threading.Thread(target=self._run, name=f"online-{target_name}", daemon=True)
+        self._thread.start()
+
+    def _load(self) -> None:
+        """Continue from the served weights: the last checkpoint if it is current, else the trained ones."""
+        paths = _artifact_paths(self.target_name)
+        self.model = LSTMForecaster().to(self.device)
+        self.model.load_state_dict(torch.load(paths["state_dict"], map_location=self.device))
+        self.scaler = joblib.load(paths["scaler"])
+        self.optimizer = torch.optim.Adam(self.model.parameters(), lr=float(self.options["lr"]))
+        self._base = _file_sha256(MODEL_DIR / f"lstm_{self.target_name}.pt")
+
+    def observe(self, stamps: np.ndarray, values: np.ndarray, spacing: str) -> Dict[str, object]:
+        with self.lock:
+            if spacing != self._spacing:
+                # One model per target: never mix sample spacings in the buffer.
+                self._stamps = self._stamps[:0]
+                self._values = self._values[:0]
+                self._pending = 0
+                self._spacing = spacing
+            fresh = stamps > self._stamps[-1] if self._stamps.size else np.ones(stamps.size, dtype=bool)
+            if fresh.any():
+                seeding = not self._stamps.size
+                keep = int(self.options["buffer_points"])
+                # Raw values: the scaler may change when a retrain is picked up.
+                self._stamps = np.concatenate([self._stamps, stamps[fresh]])[-keep:]
+                self._values = np.concatenate([self._values, values[fresh].astype(np.float32)])[-keep:]
+                if seeding:
+                    self._fit_scaler_if_needed(self._values)
+                # The first window only seeds the buffer; rounds are driven by arrivals after it.
+                self._pending = 0 if seeding else self._pending + int(fresh.sum())
+                self.metrics["points_observed"] = int(self.metrics["points_observed"]) + int(fresh.sum())
+            if self._pending >= int(self.options["update_every"]):
+                self._wake.set()
+            return self.status()
+
+    def _fit_scaler_if_needed(self, raw: np.ndarray) -> None:
+        """Refit the scaler on `raw` when it lies well outside the current scaler's range."""
+        scaled = self.scaler.transform(raw.reshape(-1, 1))
+        if scaled.min() < -WARM_START_RANGE_SLACK or scaled.max() > 1.0 + WARM_START_RANGE_SLACK:
+            self.scaler = MinMaxScaler().fit(raw.reshape(-1, 1))
+            self.metrics["scaler_refits"] = int(self.metrics.get("scaler_refits", 0)) + 1
+
+    def status(self) -> Dict[str, object]:
+        return {
+            **self.metrics,
+            "buffer_points": int(self._values.size),
+            "pending_points": self._pending,
+            "options": dict(self.options),
+        }
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            if self._stopped:
+                return
+            try:
+                self._round()
+            except Exception as exc:  # keep the worker alive; surface the failure in metrics
+                self.metrics["last_error"] = str(exc)
+
+    def _round(self) -> None:
+        with self.lock:
+            raw = self._values.copy()
+            n_new = self._pending
+            self._pending = 0
+        if _file_sha256(MODEL_DIR / f"lstm_{self.target_name}.pt") != self._base:
+            # Weights were retrained underneath: continue from them, dropping the stale fine-tune.
+            self._load()
+            self._dirty = False
+            if raw.size:
+                self._fit_scaler_if_needed(raw)
+            self.metrics["reloads"] = int(self.metrics.get("reloads", 0)) + 1
+        if raw.size <= self.lookback + 1:
+            return
+        values = self.scaler.transform(raw.reshape(-1, 1)).reshape(-1).astype(np.float32)
+
+        started = time.perf_counter()
+        data = torch.from_numpy(values).to(self.device)
+        n = data.numel() - self.lookback
+        windows = data.unfold(0, self.lookback, 1)[:n]
+        targets = data[self.lookback :]
+        new_from = max(0, n - n_new)
+        loss_before = _window_loss(self.model, windows, targets, new_from, n)
+
+        loss_fn = nn.MSELoss()
+        self.model.train()
+        for _ in range(int(self.options["steps"])):
+            idx = torch.randint(0, n, (int(self.options["batch_size"]),), device=self.device)
+            self.optimizer.zero_grad()
+            loss = loss_fn(self.model(windows[idx].unsqueeze(-1)), targets[idx].unsqueeze(-1))
+            loss.backward()
+            self.optimizer.step()
+
+        loss_after = _window_loss(self.model, windows, targets, new_from, n)
+        replay_loss = _window_loss(self.model, windows, targets, 0, n)
+        old, new = values[: values.size - n_new], values[values.size - n_new :]
+        ewma = self.metrics.get("prequential_loss_ewma")
+        ewma = loss_before if ewma is None else 0.8 * float(ewma) + 0.2 * loss_before
+        self.metrics.update(
+            rounds=int(self.metrics["rounds"]) + 1,
+            new_points=n_new,
+            loss_before=loss_before,
+            loss_after=loss_after,
+            replay_loss=replay_loss,
+            prequential_loss_ewma=ewma,
+            # >1 means fresh data is harder for the model than the buffer it is fitting.
+            drift_ratio=loss_before / replay_loss if replay_loss > 0 else None,
+            # Shift of the new points' mean, in standard deviations of the older buffer.
+            mean_shift=float((new.mean() - old.mean()) / (old.std() + 1e-9)) if old.size and new.size else 0.0,
+            round_ms=round((time.perf_counter() - started) * 1000.0, 2),
+        )
+        self._dirty = True
+        if int(self.metrics["rounds"]) % int(self.options["checkpoint_every"]) == 0:
+            self.checkpoint()
+
+    def checkpoint(self) -> None:
+        """Write the fine-tuned weights and scaler to ONLINE_DIR, where serving picks them up."""
+        if not self._dirty:
+            return
+        ONLINE_DIR.mkdir(parents=True, exist_ok=True)
+        state = {k: v.detach().cpu() for k, v in self.model.state_dict().items()}
+        _write_atomically(ONLINE_DIR / f"lstm_{self.target_name}.pt", lambda path: torch.save(state, path))
+        _write_atomically(ONLINE_DIR / f"scaler_{self.target_name}.pkl", lambda path: joblib.dump(self.scaler, path))
+        self._dirty = False
+        self.metrics["checkpoints"] = int(self.metrics["checkpoints"]) + 1
+        self.metrics["last_checkpoint"] = time.strftime("%Y-%m-%d %H:%M:%S")
+        meta = {"base": self._base, "lookback": self.lookback, **{k: v for k, v in self.status().items() if k != "options"}}
+        text = json.dumps(meta, ensure_ascii=True, indent=2)
+        # Written last: until it names the current base, serving ignores the files above.
+        _write_atomically(ONLINE_DIR / f"online_{self.target_name}.json", lambda path: Path(path).write_text(text, encoding="utf-8"))
+        export_model(self.target_name, lookback=self.lookback)
+
+    def stop(self, checkpoint: bool = True) -> None:
+        self._stopped = True
+        self._wake.set()
+        self._thread.join(timeout=30)
+        if checkpoint:
+            self.checkpoint()
+
+
+_ONLINE_TRAINERS: Dict[str, OnlineTrainer] = {}
+ONLINE_REPORTS: Dict[str, Dict[str, object]] = {}
+_ONLINE_LOCK = threading.Lock()
+
+
+def _get_online_trainer(target_name: str, lookback: int, device, options: Dict[str, object]) -> Optional[OnlineTrainer]:
+    paths = _artifact_paths(target_name)
+    if not (paths["state_dict"].exists() and paths["scaler"].exists()):
+        return None
+    with _ONLINE_LOCK:
+        trainer = _ONLINE_TRAINERS.get(target_name)
+        if trainer is None:
+            trainer = OnlineTrainer(target_name, lookback, device, **options)
+            _ONLINE_TRAINERS[target_name] = trainer
+    return trainer
+
+
+def online_status() -> Dict[str, Dict[str, object]]:
+    with _ONLINE_LOCK:
+        return {name: trainer.status() for name, trainer in _ONLINE_TRAINERS.items()}
+
+
+def stop_online_training(checkpoint: bool = True) -> None:
+    """Stop all online trainers, writing any un-checkpointed fine-tuning first."""
+    with _ONLINE_LOCK:
+        trainers = list(_ONLINE_TRAINERS.values())
+        _ONLINE_TRAINERS.clear()
+    for trainer in trainers:
+        trainer.stop(checkpoint=checkpoint)
+
+
+atexit.register(stop_online_training)
+
+
 def _resolve_target_column(df: pd.DataFrame, target_name: str) -> str:
     candidates = TARGET_COLUMN_CANDIDATES.get(target_name) or []
     for c in candidates:
@@ -188,6 +1122,15 @@ def baseline_forecast(series: np.ndarray, steps: int) -> np.ndarray:
     return tiled.astype(np.float32)
 
 
+def _lightweight_forecast(df: pd.DataFrame, finite: np.ndarray, series: np.ndarray, steps: int) -> np.ndarray:
+    """Best NumPy model by recent backtest when the LSTM cannot run; plain tiling without timestamps."""
+    if "Datetime" not in df.columns or series.size < 2:
+        return baseline_forecast(series, steps)
+    stamps = pd.to_datetime(df["Datetime"]).to_numpy()[finite]
+    preds, _ = lightweight.forecast(series, steps, lightweight.infer_season(stamps), lightweight.phase_of(stamps[-1]))
+    return preds
+
+
 def forecast_target(
     df: pd.DataFrame,
     target_name: str,
@@ -204,7 +1147,8 @@ def forecast_target(
         return np.zeros(steps, dtype=np.float32)
 
     series = _to_float_series(df[col])
-    series = series[np.isfinite(series)]
+    finite = np.isfinite(series)
+    series = series[finite]
     if series.size == 0:
         if strict_ml:
             raise ValueError(f"empty series for target={target_name}")
@@ -215,11 +1159,34 @@ def forecast_target(
     if not HAS_ML:
         if strict_ml:
             raise RuntimeError("ML stack not available. Install torch, scikit-learn, joblib.")
-        return baseline_forecast(series, steps)
+        return _lightweight_forecast(df, finite, series, steps)
     if series.size < (safe_lookback + 8):
         if strict_ml:
             raise ValueError(f"not enough history points for LSTM: size={series.size} lookback={safe_lookback}")
-        return baseline_forecast(series, steps)
+        return _lightweight_forecast(df, finite, series, steps)
+
+    online = getattr(args, "online", None)
+    stream = (getattr(args, "stateful", False) or online) and not args.retrain and "Datetime" in df.columns
+    if stream:
+        stamps = pd.to_datetime(df["Datetime"]).to_numpy()[finite]
+        spacing = str(np.median(np.diff(stamps[-8:]))) if stamps.size > 1 else ""
+    if stream and online:
+        options = online if isinstance(online, dict) else {}
+        trainer = _get_online_trainer(target_name, safe_lookback, args.device, options)
+        if trainer is not None:
+            ONLINE_REPORTS[target_name] = trainer.observe(stamps, series, spacing)
+    samples = int(getattr(args, "samples", 0) or 0)
+    if stream and getattr(args, "stateful", False):
+        session = _get_session(target_name, spacing, args.device, lookback=safe_lookback)
+        if session is not None:
+            with session.lock:
+                SESSION_REPORTS[target_name] = session.sync(stamps, series)
+                preds = session.forecast(steps)
+            if samples > 0:
+                args.quantile_preds[target_name] = mc_dropout_quantiles(
+                    target_name, series, steps, lookback=safe_lookback, samples=samples, device=args.device
+                )
+            return preds
 
     model, scaler = load_or_train(
         target_name=target_name,
@@ -230,14 +1197,65 @@ def forecast_target(
         lr=args.lr,
         device=args.device,
         retrain=args.retrain,
+        runtime=getattr(args, "runtime", "auto"),
+        fast_train=getattr(args, "fast_train", False),
+        warm_start=getattr(args, "warm_start", False),
     )
-    scaled = scaler.transform(series.reshape(-1, 1)).reshape(-1)
-    last_window = scaled[-safe_lookback:]
+    # The scaler is elementwise, so only the window that feeds the model needs scaling.
+    last_window = scaler.transform(series[-safe_lookback:].reshape(-1, 1)).reshape(-1)
     scaled_preds = iterative_forecast(model, last_window, steps, args.device)
     preds = scaler.inverse_transform(scaled_preds.reshape(-1, 1)).reshape(-1)
+    if samples > 0:
+        args.quantile_preds[target_name] = mc_dropout_quantiles(
+            target_name, series, steps, lookback=safe_lookback, samples=samples, device=args.device
+        )
     return preds.astype(np.float32)
 
 
+def forecast_origins(
+    target_name: str,
+    series: np.ndarray,
+    ends: np.ndarray,
+    steps: int,
+    *,
+    lookback: int = 32,
+    runtime: str = "auto",
+    device=None,
+) -> np.ndarray:
+    """
+    Forecast `steps` ahead from many origins of one evenly spaced raw `series` with the
+    served model: origin k sees series[:ends[k]]. All origins roll out as one batch.
+
+    Never trains (that would leak the future into a backtest), so the weights must exist.
+    Returns (len(ends), steps) float32.
+    """
+    if not HAS_ML:
+        raise RuntimeError("ML stack not available. Install torch, scikit-learn, joblib.")
+    paths = _artifact_paths(target_name)
+    if not (paths["state_dict"].exists() and paths["scaler"].exists()):
+        raise FileNotFoundError(f"model not found for {target_name} (train it first: python predict/lstm.py)")
+    series = np.asarray(series, dtype=np.float64)
+    ends = np.asarray(ends, dtype=np.int64)
+    if ends.size and (ends.min() < lookback or ends.max() > series.size):
+        raise ValueError(f"origins must leave {lookback} points of history inside the series")
+    device = device or torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    model, scaler = load_or_train(
+        target_name=target_name,
+        series=series[: int(ends.max()) if ends.size else series.size],
+        lookback=lookback,
+        epochs=0,
+        batch_size=0,
+        lr=0.0,
+        device=device,
+        retrain=False,
+        runtime=runtime,
+    )
+    scaled = scaler.transform(series.reshape(-1, 1)).reshape(-1).astype(np.float32)
+    windows = preprocess.windows(scaled, lookback, ends)
+    preds = batched_iterative_forecast(model, windows, steps, device)
+    return scaler.inverse_transform(preds.reshape(-1, 1)).reshape(preds.shape).astype(np.float32)
+
+
 def forecast_recent_window(
     *,
     csv_path: str,
@@ -247,10 +1265,17 @@ def forecast_recent_window(
     lookback: int = 32,
     retrain: bool = False,
     base_date: str = "2026-01-01",
+    runtime: str = "auto",
+    stateful: bool = False,
+    fast_train: bool = False,
+    warm_start: bool = False,
+    online: object = None,
+    samples: int = 0,
 ) -> Dict[str, np.ndarray]:
     """
     Load CSV, take the most recent `window_rows`, and forecast `steps` ahead for each target.
     This function is intended to be called by the local Flask service for one-shot inference.
+    With `samples` > 0 the result also holds MC-dropout quantiles as "<target>_P10/_P50/_P90".
     """
     if not HAS_ML:
         raise RuntimeError("ML stack not available. Install torch, scikit-learn, joblib.")
@@ -260,7 +1285,44 @@ def forecast_recent_window(
         raise FileNotFoundError(f"CSV not found: {csv_path}")
 
     df = pd.read_csv(p, encoding="utf-8-sig")
-    df = _ensure_datetime(df, base_date)
+    return forecast_recent_frame(
+        df=df,
+        targets=targets,
+        window_rows=window_rows,
+        steps=steps,
+        lookback=lookback,
+        retrain=retrain,
+        base_date=base_date,
+        runtime=runtime,
+        stateful=stateful,
+        fast_train=fast_train,
+        warm_start=warm_start,
+        online=online,
+        samples=samples,
+    )
+
+
+def forecast_recent_frame(
+    *,
+    df: pd.DataFrame,
+    targets: List[str],
+    window_rows: int,
+    steps: int,
+    lookback: int = 32,
+    retrain: bool = False,
+    base_date: str = "2026-01-01",
+    runtime: str = "auto",
+    stateful: bool = False,
+    fast_train: bool = False,
+    warm_start: bool = False,
+    online: object = None,
+    samples: int = 0,
+) -> Dict[str, np.ndarray]:
+    """Same as `forecast_recent_window`, for history already held in memory."""
+    if not HAS_ML:
+        raise RuntimeError("ML stack not available. Install torch, scikit-learn, joblib.")
+
+    df = _ensure_datetime(df.copy(), base_date)
     df = df.sort_values("Datetime").reset_index(drop=True)
     if window_rows > 0 and len(df) > window_rows:
         df = df.iloc[-window_rows:].reset_index(drop=True)
@@ -273,11 +1335,21 @@ def forecast_recent_window(
     args.batch_size = 64
     args.lr = 1e-3
     args.retrain = retrain
+    args.runtime = runtime
+    args.stateful = stateful
+    args.fast_train = fast_train
+    args.warm_start = warm_start
+    args.online = online
+    args.samples = samples
+    args.quantile_preds = {}
     args.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
     outputs: Dict[str, np.ndarray] = {}
     for t in targets:
         outputs[t] = forecast_target(df, t, lookback, steps, args, strict_ml=True)
+        # Probabilistic mode adds "<target>_P10" etc. next to the point forecast.
+        for q, values in zip(QUANTILES, args.quantile_preds.get(t, ())):
+            outputs[f"{t}_P{int(round(q * 100))}"] = values
     return outputs
 
 
@@ -288,21 +1360,10 @@ def build_future_index(df: pd.DataFrame, steps: int):
         base = pd.Timestamp.today().normalize()
         return pd.date_range(base, periods=steps, freq="15min")
 
-    dt = dt.sort_values()
-    last_time = dt.iloc[-1]
-
-    freq = pd.infer_freq(dt)
-    if freq is None:
-        diffs = dt.diff().dropna().dt.total_seconds().values
-        if diffs.size:
-            median_s = float(np.median(diffs))
-            freq = f"{int(max(1, round(median_s / 60.0)))}min"
-        else:
-            freq = "15min"
-
-    offset = pd.tseries.frequencies.to_offset(freq)
-    future_index = pd.date_range(last_time + offset, periods=steps, freq=freq)
-    return future_index
+    stamps = np.sort(dt.to_numpy().astype("datetime64[s]"))
+    # Same spacing rule as the service: median of the recent positive diffs.
+    freq = f"{preprocess.stamp_step_minutes(stamps) or 15}min"
+    return pd.date_range(pd.Timestamp(stamps[-1]) + pd.Timedelta(freq), periods=steps, freq=freq)
 
 
 def _ensure_datetime(df: pd.DataFrame, base_date: str) -> pd.DataFrame:
@@ -326,8 +1387,23 @@ def main():
     parser.add_argument("--batch-size", type=int, default=64)
     parser.add_argument("--lr", type=float, default=1e-3)
     parser.add_argument("--retrain", action="store_true")
+    parser.add_argument("--fast-train", action="store_true", help="in-memory batching with early stopping on a held-out tail")
+    parser.add_argument("--warm-start", action="store_true", help="retrain from the currently saved weights and scaler")
     parser.add_argument("--base-date", type=str, default="2026-01-01", help="used when CSV has only '时间_小时'")
+    parser.add_argument("--runtime", choices=RUNTIMES, default="auto", help="inference graph for saved models")
+    parser.add_argument("--export", action="store_true", help="export saved models to TorchScript and exit")
+    parser.add_argument("--onnx", action="store_true", help="with --export, also write ONNX")
+    parser.add_argument("--check-int8", action="store_true", help="compare int8 and float forecasts on the CSV and exit")
+    parser.add_argument("--threads", type=int, default=0, help="torch intra-op threads (0 keeps the default)")
+    parser.add_argument("--samples", type=int, default=0, help="MC-dropout samples for P10/P50/P90 columns (0 = point forecast only)")
     args = parser.parse_args()
+    args.quantile_preds = {}
+    configure_threads(args.threads)
+
+    if args.export:
+        for target in ["Load", "PV"]:
+            print(json.dumps({target: export_model(target, lookback=args.lookback, onnx=args.onnx)}, ensure_ascii=False))
+        return
 
     if HAS_ML and torch is not None:
         args.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
@@ -342,6 +1418,13 @@ def main():
     df = _ensure_datetime(df, args.base_date)
     df = df.sort_values("Datetime").reset_index(drop=True)
 
+    if args.check_int8:
+        for target in ["Load", "PV"]:
+            series = _to_float_series(df[_resolve_target_column(df, target)])
+            report = check_quantized_accuracy(target, series[np.isfinite(series)], lookback=args.lookback)
+            print(json.dumps({target: report}, ensure_ascii=False))
+        return
+
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
     future_index = build_future_index(df, args.steps)
 
@@ -353,6 +1436,8 @@ def main():
                 f"{target}_Forecast": preds,
             }
         )
+        for q, values in zip(QUANTILES, args.quantile_preds.get(target, ())):
+            output_df[f"{target}_Forecast_P{int(round(q * 100))}"] = values
         output_path = OUTPUT_DIR / f"{target}_forecast_24h.csv"
         output_df.to_csv(output_path, index=False, encoding="utf-8-sig")
 
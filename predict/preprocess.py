@@ -0,0 +1,264 @@
+import csv
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+# Typed-column view of the VPP history CSV (Datetime, 时间_小时, 时间_时段 and the kW / price
+# columns), shared by the Flask endpoints, the decision/backtest modules and the forecasters.
+# Everything below works on whole NumPy columns; rows are never materialized as dicts.
+
+DATETIME = "Datetime"
+HOUR = "时间_小时"
+PERIOD = "时间_时段"
+VALUE_COLUMNS = ("光伏出力_kW", "负荷消耗_kW", "实时电价_元/kWh")
+
+_STAMP_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y/%m/%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y/%m/%d %H:%M")
+
+
+@dataclass
+class History:
+    """One entry per row in every array; slicing returns views, not copies."""
+
+    text: np.ndarray  # object array of Datetime strings as written in the file ("" when missing)
+    stamps: np.ndarray  # datetime64[s], NaT when missing or unparseable
+    hours: np.ndarray  # 时间_小时 (or 时间_时段 - 1) as float, NaN when missing
+    values: Dict[str, np.ndarray]  # float64 per value column, NaN when missing
+
+    def __len__(self) -> int:
+        return int(self.stamps.size)
+
+    def slice(self, start: Optional[int] = None, stop: Optional[int] = None) -> "History":
+        s = slice(start, stop)
+        return History(self.text[s], self.stamps[s], self.hours[s], {k: v[s] for k, v in self.values.items()})
+
+    def tail(self, rows: int) -> "History":
+        return self.slice(-rows) if 0 < rows < len(self) else self
+
+    def column(self, key: str) -> np.ndarray:
+        values = self.values.get(key)
+        return values if values is not None else np.full(len(self), np.nan)
+
+    def as_columns(self) -> Dict[str, np.ndarray]:
+        """Columns in file order, e.g. for `pandas.DataFrame(history.as_columns())`."""
+        return {DATETIME: self.stamps, HOUR: self.hours, **self.values}
+
+
+def to_floats(cells: Sequence[str]) -> np.ndarray:
+    """Parse a column of numeric strings; blanks and garbage become NaN."""
+    try:
+        return np.asarray(cells, dtype=np.float64)
+    except ValueError:
+        out = np.full(len(cells), np.nan)
+        for i, cell in enumerate(cells):
+            try:
+                out[i] = float(cell)
+            except (TypeError, ValueError):
+                pass
+        return out
+
+
+def parse_stamps(text: Sequence[str]) -> np.ndarray:
+    """datetime64[s] for ISO-like strings ("2026-01-01 00:15:00", also with "/"), NaT otherwise."""
+    try:
+        # NumPy's own ISO parser; "" becomes NaT.
+        return np.asarray(text, dtype="datetime64[s]")
+    except ValueError:
+        pass
+    out = np.full(len(text), np.datetime64("NaT"), dtype="datetime64[s]")
+    for i, t in enumerate(text):
+        for fmt in _STAMP_FORMATS:
+            try:
+                out[i] = np.datetime64(datetime.strptime(str(t).strip(), fmt), "s")
+                break
+            except ValueError:
+                continue
+    return out
+
+
+def empty_history() -> History:
+    return History(
+        np.asarray([], dtype=object),
+        np.asarray([], dtype="datetime64[s]"),
+        np.asarray([], dtype=np.float64),
+        {k: np.asarray([], dtype=np.float64) for k in VALUE_COLUMNS},
+    )
+
+
+def read_history(path: str) -> History:
+    """Read the history CSV column by column (raises OSError like `open`)."""
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if not header:
+            return empty_history()
+        width = len(header)
+        rows = [r if len(r) >= width else r + [""] * (width - len(r)) for r in reader if r]
+    if not rows:
+        return empty_history()
+    index = {name.strip(): i for i, name in enumerate(header)}
+
+    def _col(name: str) -> Optional[list]:
+        i = index.get(name)
+        return None if i is None else [r[i] for r in rows]
+
+    text = _col(DATETIME)
+    if text is None:
+        text = [""] * len(rows)
+    hour_cells, period_cells = _col(HOUR), _col(PERIOD)
+    hours = to_floats(hour_cells) if hour_cells is not None else np.full(len(rows), np.nan)
+    if period_cells is not None:
+        missing = np.isnan(hours)
+        if missing.any():
+            hours[missing] = to_floats(period_cells)[missing] - 1.0
+    values = {}
+    for key in VALUE_COLUMNS:
+        cells = _col(key)
+        values[key] = to_floats(cells) if cells is not None else np.full(len(rows), np.nan)
+    return History(np.asarray(text, dtype=object), parse_stamps(text), hours, values)
+
+
+def _median_minutes(diffs: np.ndarray) -> int:
+    diffs = np.sort(diffs[diffs > 0])
+    return max(1, int(round(float(diffs[diffs.size // 2])))) if diffs.size else 0
+
+
+def stamp_step_minutes(stamps: np.ndarray, tail: int = 256) -> int:
+    """Median positive spacing in minutes of the last `tail` datetime64 stamps (NaT skipped); 0 if none."""
+    stamps = np.asarray(stamps, dtype="datetime64[s]")[-tail:]
+    return _median_minutes(np.diff(stamps[~np.isnat(stamps)]).astype(np.int64) / 60.0)
+
+
+def infer_step_minutes(history: History, tail: int = 256) -> int:
+    """
+    Row spacing in minutes from Datetime when at least two stamps parse, from 时间_小时
+    otherwise, and 1 when neither gives a spacing.
+    """
+    step = stamp_step_minutes(history.stamps, tail)
+    if step:
+        return step
+    hours = history.hours[-tail:]
+    return _median_minutes(np.diff(hours[np.isfinite(hours)]) * 60.0) or 1
+
+
+def resample_mean(history: History, step_minutes: int, source_step: int = 0) -> History:
+    """
+    Average consecutive blocks of rows down to `step_minutes` (NaNs skipped; all-NaN blocks
+    stay NaN). Blocks start at the first row and a trailing partial block is dropped; each
+    block is labelled with its last row. Returned unchanged when the history is already at
+    least that coarse or the step is not a multiple of the source step.
+    """
+    actual = source_step or infer_step_minutes(history)
+    if actual >= step_minutes or step_minutes % actual != 0:
+        return history
+    group = step_minutes // actual
+    usable = len(history) - len(history) % group
+    if group <= 1 or usable <= 0:
+        return history
+
+    def _mean(values: np.ndarray) -> np.ndarray:
+        blocks = values[:usable].reshape(-1, group)
+        sums = blocks.sum(axis=1)
+        if np.isfinite(sums).all():
+            return sums / group
+        finite = np.isfinite(blocks)
+        counts = finite.sum(axis=1)
+        sums = np.where(finite, blocks, 0.0).sum(axis=1)
+        return np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+
+    labels = slice(group - 1, usable, group)
+    return History(
+        history.text[labels],
+        history.stamps[labels],
+        history.hours[labels],
+        {k: _mean(v) for k, v in history.values.items()},
+    )
+
+
+def find_gaps(history: History, step_minutes: int) -> np.ndarray:
+    """
+    (row, missing) pairs for every place where Datetime jumps by more than one step:
+    `missing` points are absent just before `row`. Rows without a stamp are ignored.
+    """
+    stamps = history.stamps
+    ok = np.flatnonzero(~np.isnat(stamps))
+    if ok.size < 2:
+        return np.zeros((0, 2), dtype=np.int64)
+    jumps = np.diff(stamps[ok]).astype(np.int64) // (60 * step_minutes) - 1
+    at = np.flatnonzero(jumps > 0)
+    return np.stack([ok[at + 1], jumps[at]], axis=1).astype(np.int64)
+
+
+def reindex(history: History, step_minutes: int, gaps: Optional[np.ndarray] = None) -> History:
+    """
+    Insert the rows `find_gaps` reports as missing (stamps on the step grid, NaN values) so
+    row positions map to evenly spaced time again; combine with `fill_gaps` for the values.
+    """
+    gaps = find_gaps(history, step_minutes) if gaps is None else gaps
+    if gaps.size == 0:
+        return history
+    repeat = np.ones(len(history), dtype=np.int64)
+    repeat[gaps[:, 0]] += gaps[:, 1]
+    # Position of every original row in the reindexed arrays.
+    target = np.cumsum(repeat) - 1
+    total = int(target[-1]) + 1
+    inserted = np.ones(total, dtype=bool)
+    inserted[target] = False
+
+    # Missing rows count back from the next observed row in whole steps.
+    next_row = np.searchsorted(target, np.arange(total))
+    back = target[np.minimum(next_row, len(history) - 1)] - np.arange(total)
+    step = np.timedelta64(60 * step_minutes, "s")
+    stamps = np.empty(total, dtype="datetime64[s]")
+    stamps[target] = history.stamps
+    stamps[inserted] = history.stamps[next_row[inserted]] - back[inserted] * step
+    hours = np.full(total, np.nan)
+    hours[target] = history.hours
+    hours[inserted] = history.hours[next_row[inserted]] - back[inserted] * (step_minutes / 60.0)
+    text = np.empty(total, dtype=object)
+    text[target] = history.text
+    text[inserted] = [t.replace("T", " ") for t in np.datetime_as_string(stamps[inserted]).tolist()]
+
+    values = {}
+    for key, column in history.values.items():
+        filled = np.full(total, np.nan)
+        filled[target] = column
+        values[key] = filled
+    return History(text, stamps, hours, values)
+
+
+def fill_gaps(values: np.ndarray, method: str = "linear") -> np.ndarray:
+    """
+    Replace NaNs: "linear" interpolates between neighbours, "hold" repeats the previous
+    reading. Leading NaNs take the first reading; an all-NaN column becomes zeros.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    finite = np.isfinite(values)
+    if finite.all() or not finite.any():
+        return np.where(finite, values, 0.0)
+    idx = np.arange(values.size)
+    if method == "linear":
+        return np.interp(idx, idx[finite], values[finite])
+    if method == "hold":
+        last = np.maximum.accumulate(np.where(finite, idx, -1))
+        return values[np.where(last >= 0, last, np.argmax(finite))]
+    raise ValueError(f"unknown fill method: {method}")
+
+
+def fill_history(history: History, method: str = "linear") -> History:
+    """`history` with every value column passed through `fill_gaps`; stamps and hours stay as they are."""
+    return History(history.text, history.stamps, history.hours, {k: fill_gaps(v, method) for k, v in history.values.items()})
+
+
+def hour_of_day(history: History) -> np.ndarray:
+    """Clock hour (0..24) of each row from Datetime, falling back to 时间_小时 modulo 24."""
+    stamps = history.stamps
+    seconds = (stamps - stamps.astype("datetime64[D]")).astype(np.int64)
+    return np.where(np.isnat(stamps), history.hours % 24.0, seconds / 3600.0)
+
+
+def windows(values: np.ndarray, length: int, ends: np.ndarray) -> np.ndarray:
+    """(len(ends), length) view of `values`: row k holds the `length` points before ends[k]."""
+    view = np.lib.stride_tricks.sliding_window_view(np.asarray(values), length)
+    return view[np.asarray(ends, dtype=np.int64) - length]
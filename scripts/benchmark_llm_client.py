@@ -0,0 +1,131 @@
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import httpx
+
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+LLM_DIR = ROOT_DIR / "llm"
+DEFAULT_OUTPUT = ROOT_DIR / "data" / "output" / "llm_client_benchmark.json"
+
+if str(LLM_DIR) not in sys.path:
+    sys.path.insert(0, str(LLM_DIR))
+from main import DeepSeekAgent, LLMConfig  # noqa: E402
+
+
+COMPLETION = {
+    "id": "stub",
+    "object": "chat.completion",
+    "choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"}, "finish_reason": "stop"}],
+    "usage": {"prompt_tokens": 8, "completion_tokens": 1, "total_tokens": 9},
+}
+
+
+def start_stub(delay_s: float) -> ThreadingHTTPServer:
+    """Local stand-in for /v1/chat/completions that answers after `delay_s` with keep-alive."""
+    body = json.dumps(COMPLETION).encode("utf-8")
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Headers and body go out in two writes; with Nagle on, every reply would wait for a delayed ACK.
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            if delay_s > 0:
+                time.sleep(delay_s)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def timed(call: Callable[[], object], calls: int) -> Dict[str, float]:
+    samples: List[float] = []
+    for _ in range(calls):
+        t0 = time.perf_counter()
+        call()
+        samples.append((time.perf_counter() - t0) * 1000.0)
+    samples.sort()
+    return {
+        "calls": calls,
+        "mean_ms": round(statistics.fmean(samples), 3),
+        "p50_ms": round(samples[len(samples) // 2], 3),
+        "p95_ms": round(samples[int(len(samples) * 0.95)], 3),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="对比每次新建 httpx.Client 与 DeepSeekAgent 连接池的单次调用延迟（本地桩 LLM 服务）。")
+    parser.add_argument("--calls", type=int, default=200, help="每种方式的顺序调用次数")
+    parser.add_argument("--concurrency", type=int, default=8, help="异步并发调用数（achat + asyncio.gather）")
+    parser.add_argument("--delay-ms", type=float, default=0.0, help="桩服务每次应答前的模拟推理耗时")
+    parser.add_argument("--output", default=str(DEFAULT_OUTPUT), help="结果 JSON 路径")
+    args = parser.parse_args()
+
+    stub = start_stub(args.delay_ms / 1000.0)
+    base_url = f"http://127.0.0.1:{stub.server_address[1]}/v1"
+    agent = DeepSeekAgent(LLMConfig(api_key="benchmark", base_url=base_url))
+    messages = [{"role": "user", "content": "ping"}]
+
+    def per_call_client() -> None:
+        # What DeepSeekAgent.chat used to do: a fresh client (SSL context, pool, connection) per call.
+        with httpx.Client(timeout=30.0) as client:
+            resp = client.post(f"{base_url}/chat/completions", headers={"Authorization": "Bearer benchmark"}, json={"messages": messages})
+            resp.raise_for_status()
+            resp.json()
+
+    async def concurrent() -> float:
+        await agent.achat(messages, cache=False)  # build the async pool outside the timing
+        t0 = time.perf_counter()
+        await asyncio.gather(*(agent.achat(messages, cache=False) for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - t0
+        await agent.aclose()
+        return elapsed
+
+    try:
+        per_call_client()
+        # Identical prompts would be answered from the completion cache; every call must reach the stub.
+        agent.chat(messages, cache=False)  # open the pooled connection once, as the first real request would
+        result: Dict[str, object] = {
+            "delay_ms": args.delay_ms,
+            "per_call_client": timed(per_call_client, args.calls),
+            "pooled": timed(lambda: agent.chat(messages, cache=False), args.calls),
+        }
+        result["saved_ms_per_call"] = round(result["per_call_client"]["mean_ms"] - result["pooled"]["mean_ms"], 3)
+        t0 = time.perf_counter()
+        for _ in range(args.concurrency):
+            agent.chat(messages, cache=False)
+        result["sequential_batch_ms"] = round((time.perf_counter() - t0) * 1000.0, 3)
+        result["async_batch_ms"] = round(asyncio.run(concurrent()) * 1000.0, 3)
+        result["async_concurrency"] = args.concurrency
+    finally:
+        agent.close()
+        stub.shutdown()
+
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    output = Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,135 @@
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+from urllib import error, request
+
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+LLM_DIR = ROOT_DIR / "llm"
+DEFAULT_OUTPUT = ROOT_DIR / "data" / "output" / "startup_benchmark.json"
+
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return int(sock.getsockname()[1])
+
+
+def call(url: str, payload: Optional[Dict] = None, timeout: float = 300.0) -> Tuple[int, Dict]:
+    data = None if payload is None else json.dumps(payload).encode("utf-8")
+    req = request.Request(url, data=data, headers={"Content-Type": "application/json"})
+    try:
+        with request.urlopen(req, timeout=timeout) as resp:
+            return resp.status, json.loads(resp.read().decode("utf-8"))
+    except error.HTTPError as exc:
+        return exc.code, json.loads(exc.read().decode("utf-8") or "{}")
+
+
+def measure(preload: bool, payload: Dict, timeout_s: float) -> Dict[str, object]:
+    """Start one server process and time /health, readiness and the first /predict12h."""
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    cmd = [sys.executable, "main.py", "--server", "--host", "127.0.0.1", "--port", str(port)]
+    if not preload:
+        cmd.append("--no-preload")
+    env = dict(os.environ)
+    # The agent refuses to start without a key; the benchmark never calls the LLM.
+    env.setdefault("DEEPSEEK_API_KEY", "benchmark")
+    started = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=str(LLM_DIR), env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    result: Dict[str, object] = {"preload": preload}
+    try:
+        health = None
+        while health is None:
+            if proc.poll() is not None:
+                raise RuntimeError(f"server exited with code {proc.returncode}")
+            if time.perf_counter() - started > timeout_s:
+                raise RuntimeError("server did not answer /health in time")
+            try:
+                _, health = call(base + "/health", timeout=2.0)
+            except (error.URLError, ConnectionError, socket.timeout):
+                time.sleep(0.05)
+        result["health_s"] = round(time.perf_counter() - started, 3)
+
+        if preload:
+            while not health.get("ready"):
+                if health.get("ml", {}).get("state") == "failed":
+                    raise RuntimeError(f"preload failed: {health['ml'].get('error')}")
+                if time.perf_counter() - started > timeout_s:
+                    raise RuntimeError("server did not become ready in time")
+                time.sleep(0.05)
+                _, health = call(base + "/health", timeout=2.0)
+            result["ready_s"] = round(time.perf_counter() - started, 3)
+
+        t0 = time.perf_counter()
+        status, body = call(base + "/predict12h", payload, timeout=timeout_s)
+        result["first_predict_s"] = round(time.perf_counter() - t0, 3)
+        result["first_predict_status"] = status
+        if not body.get("ok"):
+            result["first_predict_error"] = body.get("message") or body.get("error")
+        t0 = time.perf_counter()
+        call(base + "/predict12h", payload, timeout=timeout_s)
+        result["second_predict_s"] = round(time.perf_counter() - t0, 3)
+        result["first_result_s"] = round(result.get("ready_s", result["health_s"]) + result["first_predict_s"], 3)
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+    return result
+
+
+def check_baseline(current: Dict, baseline: Dict, tolerance: float) -> list:
+    """Names of metrics that got slower than baseline * (1 + tolerance)."""
+    failures = []
+    for mode in ("preload", "lazy"):
+        for key in ("health_s", "first_predict_s"):
+            old = baseline.get(mode, {}).get(key)
+            new = current.get(mode, {}).get(key)
+            if isinstance(old, (int, float)) and isinstance(new, (int, float)) and new > old * (1.0 + tolerance):
+                failures.append(f"{mode}.{key}: {new:.3f}s > {old:.3f}s (+{tolerance:.0%})")
+    return failures
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="测量服务冷启动：/health 可用时间、模型就绪时间与首个 /predict12h 延迟（预加载 vs 懒加载）。")
+    parser.add_argument("--output", default=str(DEFAULT_OUTPUT), help="结果 JSON 路径")
+    parser.add_argument("--baseline", default="", help="基线 JSON；任一指标慢于基线超过容差时以 1 退出")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="相对基线允许的变慢比例")
+    parser.add_argument("--timeout", type=float, default=300.0, help="单次启动/请求超时（秒）")
+    parser.add_argument("--skip-lazy", action="store_true", help="只测预加载模式")
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    # use_cache=false so the first request really runs the model instead of a persisted result.
+    payload = {"use_cache": False}
+    current: Dict[str, object] = {"preload": measure(True, payload, args.timeout)}
+    if not args.skip_lazy:
+        current["lazy"] = measure(False, payload, args.timeout)
+    print(json.dumps(current, ensure_ascii=False, indent=2))
+
+    output = Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(current, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        failures = check_baseline(current, baseline, args.tolerance)
+        for line in failures:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if failures:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
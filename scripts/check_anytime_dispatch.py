@@ -0,0 +1,89 @@
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+LLM_DIR = ROOT_DIR / "llm"
+
+if str(LLM_DIR) not in sys.path:
+    sys.path.insert(0, str(LLM_DIR))
+from function_decision import _solve_dispatch  # noqa: E402
+
+
+def check_case(net: np.ndarray, price: np.ndarray, step_minutes: int, capacity_kwh: float, p_max_kw: float,
+               soc0_kwh: float, socT_kwh: float, budget_ms: float) -> Dict[str, object]:
+    """Solve one trace exactly and in anytime mode with a generous budget."""
+    kwargs = dict(
+        net_kw=net,
+        price=price,
+        dt_h=step_minutes / 60.0,
+        step_minutes=step_minutes,
+        capacity_kwh=capacity_kwh,
+        p_max_kw=p_max_kw,
+        soc0_kwh=soc0_kwh,
+        socT_kwh=socT_kwh,
+    )
+    exact, exact_report = _solve_dispatch(**kwargs)
+    anytime, report = _solve_dispatch(time_budget_ms=budget_ms, **kwargs)
+    return {
+        "step_minutes": step_minutes,
+        "capacity_kwh": capacity_kwh,
+        "p_max_kw": p_max_kw,
+        "soc0_kwh": round(soc0_kwh, 3),
+        "socT_kwh": round(socT_kwh, 3),
+        "exact_cost": float(exact.cost[0]),
+        "anytime_cost": float(anytime.cost[0]),
+        "exact_final_soc": float(exact.soc_kwh[0][-1]),
+        "anytime_final_soc": float(anytime.soc_kwh[0][-1]),
+        "full_resolution": report.soc_step_kwh == exact_report.soc_step_kwh,
+        "refinements": report.refinements,
+        "widenings": report.widenings,
+        "exact_ms": round(exact_report.solve_ms, 3),
+        "anytime_ms": round(report.solve_ms, 3),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="用随机净负荷/电价校验：预算充足时限时渐进求解与精确 DP 的成本和终端 SOC 一致。")
+    parser.add_argument("--cases", type=int, default=200, help="随机算例数")
+    parser.add_argument("--steps", default="15,30,60", help="参与校验的步长（分钟），逗号分隔")
+    parser.add_argument("--budget-ms", type=float, default=600000.0, help="限时求解的预算（足够大即可跑满分辨率）")
+    parser.add_argument("--tolerance", type=float, default=1e-6, help="允许的成本差（元）")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    steps = [int(s) for s in args.steps.split(",") if s.strip()]
+    failures: List[Dict[str, object]] = []
+    for _ in range(args.cases):
+        step = int(rng.choice(steps))
+        n = int(round(12 * 60 / step))
+        capacity = float(rng.choice([50.0, 100.0, 200.0, 500.0, 1000.0]))
+        case = check_case(
+            net=rng.normal(50.0, 80.0, n),
+            price=rng.choice([0.3, 0.6, 1.0, 1.4], n),
+            step_minutes=step,
+            capacity_kwh=capacity,
+            p_max_kw=float(rng.choice([20.0, 50.0, 100.0, 300.0])),
+            soc0_kwh=capacity * float(rng.uniform()),
+            socT_kwh=capacity * float(rng.uniform()),
+            budget_ms=args.budget_ms,
+        )
+        if (
+            not case["full_resolution"]
+            or case["anytime_cost"] > case["exact_cost"] + args.tolerance
+            or abs(case["anytime_final_soc"] - case["exact_final_soc"]) > 1e-9
+        ):
+            failures.append(case)
+
+    print(json.dumps({"cases": args.cases, "steps": steps, "failures": len(failures), "examples": failures[:5]}, ensure_ascii=False, indent=2))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
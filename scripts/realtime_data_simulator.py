@@ -209,47 +209,97 @@ def generate_rows(seed_profiles: Dict[int, Dict[str, float]], sim_step: int, end
     return rows
 
 
-def post_json(url: str, payload: Dict[str, object], timeout_s: float) -> Dict[str, object]:
+def post_json(url: str, payload: Dict[str, object], timeout_s: float, headers: Optional[Dict[str, str]] = None) -> Dict[str, object]:
     data = json.dumps(payload).encode("utf-8")
-    req = request.Request(url, data=data, headers={"Content-Type": "application/json"}, method="POST")
+    req = request.Request(url, data=data, headers={"Content-Type": "application/json", **(headers or {})}, method="POST")
     with request.urlopen(req, timeout=timeout_s) as resp:
         body = resp.read().decode("utf-8")
         return json.loads(body) if body else {}
 
 
-def sync_backend(base_url: str, timeout_s: float) -> Dict[str, object]:
+PREDICT_PAYLOAD: Dict[str, object] = {
+    "history_file": "虚拟电厂_24h15min_数据.csv",
+    "window_hours": 24,
+    "horizon_hours": 12,
+    "step_minutes": 1,
+}
+
+DECISION_PAYLOAD: Dict[str, object] = {
+    "history_file": "虚拟电厂_24h15min_数据.csv",
+    "load_forecast": "output/Load_forecast_12h.csv",
+    "pv_forecast": "output/PV_forecast_12h.csv",
+    "output_file": "output/Market_decision_12h.csv",
+    "horizon_hours": 12,
+    "step_minutes": 1,
+    "window_hours": 24,
+    "capacity_kwh": 200,
+    "p_max_kw": 100,
+}
+
+
+def sync_headers(revision: int) -> Dict[str, str]:
+    """
+    Mark syncs as background work: the backend serves dashboard requests first and drops a
+    queued sync once a newer revision of the same data arrives (HTTP 409).
+    """
+    return {"X-Priority": "background", "X-Sync-Key": "realtime-sim", "X-Revision": str(revision)}
+
+
+def _superseded_result() -> Dict[str, object]:
+    return {
+        "predict": {"ok": False, "error": "superseded", "superseded": True},
+        "decision": {"ok": False, "error": "not-run"},
+    }
+
+
+def sync_backend(base_url: str, timeout_s: float, revision: int = 0) -> Dict[str, object]:
+    """
+    Refresh forecasts and decision in one round trip via /pipeline12h.
+    Falls back to /predict12h + /decision12h when the backend predates the pipeline endpoint.
+    """
+    try:
+        pipeline_result = post_json(f"{base_url.rstrip('/')}/pipeline12h", {**PREDICT_PAYLOAD, **DECISION_PAYLOAD}, timeout_s, sync_headers(revision))
+    except error.HTTPError as exc:
+        if exc.code == 404:
+            return sync_backend_separately(base_url, timeout_s, revision)
+        if exc.code == 409:
+            return _superseded_result()
+        return {
+            "predict": {"ok": False, "error": str(exc)},
+            "decision": {"ok": False, "error": "not-run"},
+        }
+    except (error.URLError, TimeoutError, json.JSONDecodeError) as exc:
+        return {
+            "predict": {"ok": False, "error": str(exc)},
+            "decision": {"ok": False, "error": "not-run"},
+        }
+    return {
+        "predict": pipeline_result.get("predict") or {"ok": False, "error": pipeline_result.get("error", "not-run")},
+        "decision": pipeline_result.get("decision") or {"ok": False, "error": "not-run"},
+    }
+
+
+def sync_backend_separately(base_url: str, timeout_s: float, revision: int = 0) -> Dict[str, object]:
     result: Dict[str, object] = {
         "predict": {"ok": False, "error": "not-run"},
         "decision": {"ok": False, "error": "not-run"},
     }
     try:
-        predict_payload = {
-            "history_file": "虚拟电厂_24h15min_数据.csv",
-            "window_hours": 24,
-            "horizon_hours": 12,
-            "step_minutes": 1,
-        }
-        predict_result = post_json(f"{base_url.rstrip('/')}/predict12h", predict_payload, timeout_s)
+        predict_result = post_json(f"{base_url.rstrip('/')}/predict12h", PREDICT_PAYLOAD, timeout_s, sync_headers(revision))
         result["predict"] = predict_result
         if not predict_result.get("ok"):
             return result
+    except error.HTTPError as exc:
+        if exc.code == 409:
+            return _superseded_result()
+        result["predict"] = {"ok": False, "error": str(exc)}
+        return result
     except (error.URLError, TimeoutError, json.JSONDecodeError) as exc:
         result["predict"] = {"ok": False, "error": str(exc)}
         return result
 
     try:
-        decision_payload = {
-            "history_file": "虚拟电厂_24h15min_数据.csv",
-            "load_forecast": "output/Load_forecast_12h.csv",
-            "pv_forecast": "output/PV_forecast_12h.csv",
-            "output_file": "output/Market_decision_12h.csv",
-            "horizon_hours": 12,
-            "step_minutes": 1,
-            "window_hours": 24,
-            "capacity_kwh": 200,
-            "p_max_kw": 100,
-        }
-        result["decision"] = post_json(f"{base_url.rstrip('/')}/decision12h", decision_payload, timeout_s)
+        result["decision"] = post_json(f"{base_url.rstrip('/')}/decision12h", DECISION_PAYLOAD, timeout_s, sync_headers(revision))
     except (error.URLError, TimeoutError, json.JSONDecodeError) as exc:
         result["decision"] = {"ok": False, "error": str(exc)}
     return result
@@ -279,9 +329,13 @@ def print_tick(sim_step: int, backend_result: Optional[Dict[str, object]]) -> No
     latest_slot = window_end_minute % DAY_STEPS
     message = f"[sim] tick={sim_step} minute={latest_slot + 1}/1440 hour={latest_slot * STEP_HOURS:.2f}"
     if backend_result:
-        predict_ok = bool((backend_result.get("predict") or {}).get("ok"))
+        predict = backend_result.get("predict") or {}
+        predict_ok = bool(predict.get("ok"))
         decision_ok = bool((backend_result.get("decision") or {}).get("ok"))
-        message += f" predict={'ok' if predict_ok else 'fail'} decision={'ok' if decision_ok else 'fail'}"
+        if predict.get("superseded"):
+            message += " backend=superseded"
+        else:
+            message += f" predict={'ok' if predict_ok else 'fail'} decision={'ok' if decision_ok else 'fail'}"
     print(message, flush=True)
 
 
@@ -336,7 +390,7 @@ def main() -> int:
         backend_result = None
         should_sync_backend = (not args.no_backend_sync) and (args.backend_sync_every <= 1 or sim_step % args.backend_sync_every == 0)
         if should_sync_backend:
-            backend_result = sync_backend(args.backend_base_url, args.backend_timeout)
+            backend_result = sync_backend(args.backend_base_url, args.backend_timeout, sim_step)
 
         write_json_atomic(
             status_path,